@@ -2,6 +2,7 @@
 
 import os
 import sys
+import json
 import vamp
 import tempfile
 import numpy as np
@@ -20,14 +21,14 @@ dep: ffmpeg
 SAVE = False
 
 
-def det(tf):
+def det(fp, tf):
     # fmt: off
     sp.check_call([
         b"ffmpeg",
         b"-nostdin",
         b"-hide_banner",
         b"-v", b"fatal",
-        b"-y", b"-i", fsenc(sys.argv[1]),
+        b"-y", b"-i", fsenc(fp),
         b"-map", b"0:a:0",
         b"-ac", b"1",
         b"-ar", b"22050",
@@ -47,8 +48,7 @@ def det(tf):
             # fallback; 73% accuracy
             plug = "vamp-example-plugins:fixedtempo"
             c = vamp.collect(d, 22050, plug, parameters={"maxdflen": 40})
-            print(c["list"][0]["label"].split(" ")[0])
-            return
+            return c["list"][0]["label"].split(" ")[0]
 
     # throws if detection failed:
     beats = [float(x["timestamp"]) for x in cl]
@@ -59,10 +59,9 @@ def det(tf):
     bds = bds[n0:n1]
     bpm = sum(bds)
     bpm = round(60 * (len(bds) / bpm), 2)
-    print(f"{bpm:.2f}")
 
     if SAVE:
-        fdir, fname = os.path.split(sys.argv[1])
+        fdir, fname = os.path.split(fp)
         bdir = os.path.join(fdir, ".beats")
         try:
             os.mkdir(fsenc(bdir))
@@ -74,6 +73,24 @@ def det(tf):
             txt = "\n".join([f"{x:.2f}" for x in beats])
             f.write(txt.encode("utf-8"))
 
+    return f"{bpm:.2f}"
+
+
+def worker(tf):
+    # -mtp .bpm=w,audio-bpm.py; stays running and takes one file
+    # per line of json, to avoid importing numpy/vamp every time
+    for ln in sys.stdin:
+        req = json.loads(ln)
+        fp = req["path"]
+        try:
+            ret = {"v": det(fp, tf)}
+        except Exception as ex:
+            ret = {"err": repr(ex)}
+
+        ret["id"] = req.get("id")
+        sys.stdout.write(json.dumps(ret) + "\n")
+        sys.stdout.flush()
+
 
 def main():
     with tempfile.NamedTemporaryFile(suffix=".pcm", delete=False) as f:
@@ -81,7 +98,10 @@ def main():
         tf = f.name
 
     try:
-        det(tf)
+        if sys.argv[1] == "--mtp-worker":
+            worker(tf)
+        else:
+            print(det(sys.argv[1], tf))
     except:
         pass  # mute
     finally:
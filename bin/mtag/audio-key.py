@@ -2,6 +2,7 @@
 
 import os
 import sys
+import json
 import tempfile
 import subprocess as sp
 import keyfinder
@@ -20,14 +21,14 @@ dep: ffmpeg
 # obvious when mixing 9a ghostly parapara ship
 
 
-def det(tf):
+def det(fp, tf):
     # fmt: off
     sp.check_call([
         b"ffmpeg",
         b"-nostdin",
         b"-hide_banner",
         b"-v", b"fatal",
-        b"-y", b"-i", fsenc(sys.argv[1]),
+        b"-y", b"-i", fsenc(fp),
         b"-map", b"0:a:0",
         b"-t", b"300",
         b"-sample_fmt", b"s16",
@@ -35,7 +36,23 @@ def det(tf):
     ])
     # fmt: on
 
-    print(keyfinder.key(tf).camelot())
+    return keyfinder.key(tf).camelot()
+
+
+def worker(tf):
+    # -mtp key=w,audio-key.py; stays running and takes one file
+    # per line of json, to avoid importing keyfinder every time
+    for ln in sys.stdin:
+        req = json.loads(ln)
+        fp = req["path"]
+        try:
+            ret = {"v": det(fp, tf)}
+        except Exception as ex:
+            ret = {"err": repr(ex)}
+
+        ret["id"] = req.get("id")
+        sys.stdout.write(json.dumps(ret) + "\n")
+        sys.stdout.flush()
 
 
 def main():
@@ -44,7 +61,10 @@ def main():
         tf = f.name
 
     try:
-        det(tf)
+        if sys.argv[1] == "--mtp-worker":
+            worker(tf)
+        else:
+            print(det(sys.argv[1], tf))
     except:
         pass  # mute
     finally:
@@ -21,14 +21,14 @@ dep: ffmpeg
 """
 
 
-def det():
+def det(fp):
     # fmt: off
     cmd = [
         b"ffmpeg",
         b"-nostdin",
         b"-hide_banner",
         b"-v", b"fatal",
-        b"-i", fsenc(sys.argv[1]),
+        b"-i", fsenc(fp),
         b"-f", b"framemd5",
         b"-"
     ]
@@ -59,12 +59,31 @@ def det():
         dg = base64.urlsafe_b64encode(dg).decode("ascii")
         r[v[0].lower() + "hash"] = dg
 
-    print(json.dumps(r, indent=4))
+    return r
+
+
+def worker():
+    # -mtp ahash,vhash=w,media-hash.py; stays running and
+    # takes one file per line of json
+    for ln in sys.stdin:
+        req = json.loads(ln)
+        fp = req["path"]
+        try:
+            ret = {"v": det(fp)}
+        except Exception as ex:
+            ret = {"err": repr(ex)}
+
+        ret["id"] = req.get("id")
+        sys.stdout.write(json.dumps(ret) + "\n")
+        sys.stdout.flush()
 
 
 def main():
     try:
-        det()
+        if sys.argv[1] == "--mtp-worker":
+            worker()
+        else:
+            print(json.dumps(det(sys.argv[1]), indent=4))
     except:
         pass  # mute
 
@@ -759,7 +759,7 @@ class VFS(object):
         folder = "" if flt or not wrap else (vpath.split("/")[-1].lstrip(".") or "top")
 
         g = self.walk(folder, vrem, [], uname, [[True, False]], True, scandir, False)
-        for _, _, vpath, apath, files, rd, vd in g:
+        for dbv, dbrd, vpath, apath, files, rd, vd in g:
             if flt:
                 files = [x for x in files if x[0] in flt]
 
@@ -777,8 +777,8 @@ class VFS(object):
             apaths = [os.path.join(apath, n) for n in fnames]
             ret = list(zip(vpaths, apaths, files))
 
-            for f in [{"vp": v, "ap": a, "st": n[1]} for v, a, n in ret]:
-                yield f
+            for v, a, n in ret:
+                yield {"vp": v, "ap": a, "st": n[1], "dbv": dbv, "rd": dbrd}
 
             if not dirs:
                 continue
@@ -2,6 +2,7 @@
 from __future__ import print_function, unicode_literals
 
 import argparse
+import errno
 import os
 import re
 import time
@@ -9,7 +10,7 @@ import time
 from .__init__ import ANYWIN, MACOS
 from .authsrv import AXS, VFS
 from .bos import bos
-from .util import chkcmd, min_ex, undot
+from .util import HAVE_FICLONE, chkcmd, fclone, fsenc, min_ex, undot
 
 if True:  # pylint: disable=using-constant-test
     from typing import Optional, Union
@@ -17,6 +18,10 @@ if True:  # pylint: disable=using-constant-test
     from .util import RootLogger, undot
 
 
+# the fs says no; anything else is not an answer
+E_NOREFLINK = (errno.EOPNOTSUPP, errno.EXDEV, errno.EINVAL)
+
+
 class Fstab(object):
     def __init__(self, log: "RootLogger", args: argparse.Namespace):
         self.log_func = log
@@ -27,6 +32,7 @@ class Fstab(object):
         self.oldtab: Optional[VFS] = None
         self.srctab = "a"
         self.cache: dict[str, str] = {}
+        self.reflinks: dict[int, bool] = {}  # st_dev => supported
         self.age = 0.0
         self.maxage = args.mtab_age
 
@@ -68,6 +74,52 @@ class Fstab(object):
         self.log("found {} at {}".format(fs, path))
         return fs
 
+    def can_reflink(self, path: str) -> bool:
+        """check (once per filesystem) if files in folder path can be reflinked"""
+        try:
+            dev = bos.stat(path).st_dev
+            return self.reflinks[dev]
+        except KeyError:
+            pass
+        except:
+            return False
+
+        ok = False
+        if HAVE_FICLONE:
+            fn1 = os.path.join(path, ".cpr-reflink-%d" % (os.getpid(),))
+            fn2 = fn1 + ".2"
+            ex: Optional[Exception] = None
+            try:
+                with open(fsenc(fn1), "wb") as f:
+                    f.write(b"\x00" * 4096)
+                with open(fsenc(fn1), "rb") as f1, open(fsenc(fn2), "wb") as f2:
+                    try:
+                        fclone(f1.fileno(), f2.fileno())
+                        ok = True
+                    except Exception as ex2:
+                        self.log("no reflink at %s: %r" % (path, ex2), 6)
+                        if getattr(ex2, "errno", 0) not in E_NOREFLINK:
+                            ex = ex2
+            except Exception as ex2:
+                ex = ex2
+
+            for fn in (fn1, fn2):
+                try:
+                    os.unlink(fsenc(fn))
+                except:
+                    pass
+
+            if ex:
+                # readonly, full, permissions... try again next time
+                t = "could not probe for reflink at %s: %r"
+                self.log(t % (path, ex), 3)
+                return False
+
+        t = "reflink %s on %s filesystem at %s"
+        self.log(t % ("ok" if ok else "ng", self.get(path), path))
+        self.reflinks[dev] = ok
+        return ok
+
     def _winpath(self, path: str) -> str:
         # try to combine volume-label + st_dev (vsn)
         path = path.replace("/", "\\")
@@ -108,6 +160,7 @@ class Fstab(object):
             return
 
         self.log("mtab has changed; reevaluating support for sparse files")
+        self.reflinks = {}
 
         tab1.sort(key=lambda x: (len(x[0]), x[0]))
         path1, fs1 = tab1[0]
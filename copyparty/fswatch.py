@@ -0,0 +1,286 @@
+# coding: utf-8
+from __future__ import print_function, unicode_literals
+
+import errno
+import os
+import select
+import stat
+import struct
+import threading
+import time
+
+from .__init__ import ANYWIN, MACOS
+from .util import Daemon, fsdec, fsenc, min_ex, statdir
+
+if True:  # pylint: disable=using-constant-test
+    from typing import Any, Union
+
+    from .util import RootLogger
+
+
+IN_MODIFY = 0x2
+IN_ATTRIB = 0x4
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_MOVE_SELF = 0x800
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_ONLYDIR = 0x1000000
+IN_DONT_FOLLOW = 0x2000000
+IN_EXCL_UNLINK = 0x4000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+# what we care about; files finished writing, and anything appearing/disappearing
+IN_MASK = (
+    IN_ATTRIB
+    | IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_ONLYDIR
+    | IN_DONT_FOLLOW
+    | IN_EXCL_UNLINK
+)
+
+EV_HDR = struct.Struct("iIII")
+
+try:
+    if ANYWIN or MACOS:
+        raise Exception()
+
+    import ctypes
+
+    LIBC = ctypes.CDLL(None, use_errno=True)
+    for _zs in ("inotify_init1", "inotify_add_watch", "inotify_rm_watch"):
+        if not hasattr(LIBC, _zs):
+            raise Exception()
+
+    LIBC.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    LIBC.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+    HAVE_INOTIFY = True
+except:
+    HAVE_INOTIFY = False
+
+
+class Inotify(object):
+    """bare minimum inotify(7) through ctypes"""
+
+    def __init__(self) -> None:
+        self.fd: int = LIBC.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            zi = ctypes.get_errno()
+            raise OSError(zi, os.strerror(zi))
+
+    def add(self, path: str, mask: int = IN_MASK) -> int:
+        wd: int = LIBC.inotify_add_watch(self.fd, fsenc(path), mask)
+        if wd < 0:
+            zi = ctypes.get_errno()
+            raise OSError(zi, os.strerror(zi))
+        return wd
+
+    def rm(self, wd: int) -> None:
+        LIBC.inotify_rm_watch(self.fd, wd)
+
+    def read(self, timeout: float) -> list[tuple[int, int, str]]:
+        """returns list of (wd, mask, name)"""
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return []
+
+        try:
+            buf = os.read(self.fd, 0x40000)
+        except OSError as ex:
+            if ex.errno == errno.EAGAIN:
+                return []
+            raise
+
+        ret = []
+        ofs = 0
+        while ofs < len(buf):
+            wd, mask, _, nlen = EV_HDR.unpack_from(buf, ofs)
+            ofs += EV_HDR.size
+            name = fsdec(buf[ofs : ofs + nlen].rstrip(b"\0"))
+            ofs += nlen
+            ret.append((wd, mask, name))
+
+        return ret
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class FsWatch(object):
+    """
+    watches volumes for changes made outside copyparty;
+    every change is held back for `settle` seconds (to let writers finish,
+    and to let copyparty's own db updates land first), then reported by
+    checking what is actually on disk at that point:
+      on_file(ptop, rd, fn): file appeared or changed
+      on_dir(ptop, rd): new folder, contents unknown
+      on_gone(ptop, rd, fn): file or folder is no longer there
+      on_lost(ptop): events were dropped; need a full rescan
+    """
+
+    def __init__(
+        self,
+        log_func: "RootLogger",
+        on_file: Any,
+        on_dir: Any,
+        on_gone: Any,
+        on_lost: Any,
+        settle: float = 2.0,
+    ) -> None:
+        self.log_func = log_func
+        self.on_file = on_file
+        self.on_dir = on_dir
+        self.on_gone = on_gone
+        self.on_lost = on_lost
+        self.settle = settle
+
+        self.ino = Inotify()
+        self.mutex = threading.Lock()
+        self.stop = False
+        self.warned_lim = False
+
+        # wd => (ptop, rd)
+        self.wds: dict[int, tuple[str, str]] = {}
+        # ptop => excluded abspaths (subvolumes, histpaths)
+        self.vols: dict[str, set[str]] = {}
+        # (ptop, rd, fn) => deadline
+        self.pend: dict[tuple[str, str, str], float] = {}
+        self.addq: list[tuple[str, str]] = []
+
+        Daemon(self.worker, "fswatch")
+
+    def log(self, msg: str, c: Union[int, str] = 0) -> None:
+        self.log_func("fswatch", msg, c)
+
+    def set_vols(self, vols: dict[str, list[str]]) -> None:
+        """ptop => excluded abspaths; replaces the current set of volumes"""
+        with self.mutex:
+            for ptop in list(self.vols):
+                if ptop not in vols:
+                    self._unwatch(ptop, "")
+                    del self.vols[ptop]
+
+            for ptop, excl in vols.items():
+                if ptop not in self.vols:
+                    self.vols[ptop] = set(excl)
+                    self.addq.append((ptop, ""))
+
+    def shutdown(self) -> None:
+        self.stop = True
+
+    def _unwatch(self, ptop: str, rd: str) -> None:
+        """mutex me; forget watches on rd and below"""
+        pfx = rd + "/"
+        for wd, (wtop, wrd) in list(self.wds.items()):
+            if wtop == ptop and (not rd or wrd == rd or wrd.startswith(pfx)):
+                self.ino.rm(wd)
+                del self.wds[wd]
+
+    def _watch(self, ptop: str, rd: str) -> None:
+        """recursively add watches; not holding mutex while walking"""
+        todo = [rd]
+        while todo and not self.stop:
+            rd = todo.pop()
+            ap = os.path.join(ptop, rd) if rd else ptop
+            with self.mutex:
+                excl = self.vols.get(ptop)
+                if excl is None or ap in excl:
+                    continue
+                try:
+                    wd = self.ino.add(ap)
+                    self.wds[wd] = (ptop, rd)
+                except OSError as ex:
+                    if ex.errno == errno.ENOSPC and not self.warned_lim:
+                        self.warned_lim = True
+                        t = "inotify watch limit reached (see sysctl fs.inotify.max_user_watches); changes in some folders will only be noticed by rescans"
+                        self.log(t, 3)
+                    continue
+
+            for fn, inf in statdir(self.log_func, True, True, ap, False):
+                if stat.S_ISDIR(inf.st_mode):
+                    todo.append(rd + "/" + fn if rd else fn)
+
+    def worker(self) -> None:
+        while not self.stop:
+            try:
+                self._work()
+            except Exception as ex:
+                self.log("%r\n%s" % (ex, min_ex()), 1)
+                time.sleep(1)
+
+        self.ino.close()
+
+    def _work(self) -> None:
+        with self.mutex:
+            addq = self.addq
+            self.addq = []
+
+        for ptop, rd in addq:
+            self._watch(ptop, rd)
+
+        evs = self.ino.read(min(0.5, self.settle))
+        now = time.time()
+        with self.mutex:
+            for wd, mask, name in evs:
+                if mask & IN_Q_OVERFLOW:
+                    self.log("kernel event queue overflow; rescanning", 3)
+                    self.pend.clear()
+                    for ptop in self.vols:
+                        self.on_lost(ptop)
+                    continue
+
+                if mask & IN_IGNORED:
+                    self.wds.pop(wd, None)
+                    continue
+
+                zt = self.wds.get(wd)
+                if not zt or not name:
+                    continue
+
+                ptop, rd = zt
+                if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                    # watch it right away so we don't miss its contents
+                    self.addq.append((ptop, rd + "/" + name if rd else name))
+
+                self.pend[(ptop, rd, name)] = now + self.settle
+
+            if not self.pend:
+                return
+
+            ready = [k for k, v in self.pend.items() if v <= now]
+            for k in ready:
+                del self.pend[k]
+
+        # anything inside a new/deleted folder is handled by that folder
+        done = set([(x[0], x[1] + "/" + x[2] if x[1] else x[2]) for x in ready])
+        for ptop, rd, fn in ready:
+            zs = rd
+            while zs and (ptop, zs) not in done:
+                zs = zs.rsplit("/", 1)[0] if "/" in zs else ""
+            if zs:
+                continue
+
+            ap = os.path.join(ptop, rd, fn) if rd else os.path.join(ptop, fn)
+            try:
+                inf = os.lstat(fsenc(ap))
+            except:
+                inf = None
+
+            if not inf:
+                with self.mutex:
+                    self._unwatch(ptop, rd + "/" + fn if rd else fn)
+                self.on_gone(ptop, rd, fn)
+            elif stat.S_ISDIR(inf.st_mode):
+                if ap not in self.vols.get(ptop, ()):
+                    self.on_dir(ptop, rd + "/" + fn if rd else fn)
+            elif stat.S_ISREG(inf.st_mode):
+                self.on_file(ptop, rd, fn)
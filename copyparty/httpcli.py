@@ -37,7 +37,7 @@ from .bos import bos
 from .star import StreamTar
 from .stolen.qrcodegen import QrCode, qr2svg
 from .sutil import StreamArc, gfilter
-from .szip import StreamZip
+from .szip import StoreZip, StreamZip
 from .up2k import up2k_chunksize
 from .util import unquote  # type: ignore
 from .util import (
@@ -59,6 +59,7 @@ from .util import (
     atomic_move,
     b64dec,
     exclude_dotfiles,
+    fcopy_range,
     formatdate,
     fsenc,
     gen_filekey,
@@ -86,16 +87,18 @@ from .util import (
     read_header,
     read_socket,
     read_socket_chunked,
+    read_socket_into,
     read_socket_unbounded,
     relchk,
     ren_open,
     runhook,
     s2hms,
-    s3enc,
     sanitize_fn,
     sanitize_vpath,
+    sck_alive,
     sendfile_kern,
     sendfile_py,
+    sendvec,
     stat_resource,
     ub64dec,
     ub64enc,
@@ -118,6 +121,8 @@ if True:  # pylint: disable=using-constant-test
 
 if TYPE_CHECKING:
     from .httpconn import HttpConn
+    from .rescache import CachedRes
+    from .u2idx import U2idx
 
 if not hasattr(socket, "AF_UNIX"):
     setattr(socket, "AF_UNIX", -9001)
@@ -137,6 +142,12 @@ READMES = [[0, ["preadme.md", "PREADME.md"]], [1, ["readme.md", "README.md"]]]
 
 RSS_SORT = {"m": "mt", "u": "at", "n": "fn", "s": "sz"}
 
+# folders with at least this many entries count towards cpp_ls_big_seconds
+LS_BIG = 1000
+
+# multirange requests with more ranges than this get the whole file
+RANGE_MAX = 64
+
 
 class HttpCli(object):
     """
@@ -1141,6 +1152,11 @@ class HttpCli(object):
 
             res_path = "web/" + self.vpath[5:]
             if res_path in RES:
+                rc = self.conn.hsrv.res
+                cres = rc.cache.get(res_path) if rc else None
+                if cres and "txt" not in self.uparam and "mime" not in self.uparam:
+                    return self.tx_cres(cres)
+
                 ap = os.path.join(self.E.mod, res_path)
                 if bos.path.exists(ap) or bos.path.exists(ap + ".gz"):
                     return self.tx_file(ap)
@@ -1888,7 +1904,10 @@ class HttpCli(object):
 
         return enc or "utf-8"
 
-    def get_body_reader(self) -> tuple[Generator[bytes, None, None], int]:
+    def get_body_reader(
+        self, rbuf: Optional[bytearray] = None
+    ) -> tuple[Generator[bytes, None, None], int]:
+        """rbuf: reuse this buffer for each read, if possible"""
         bufsz = self.args.s_rd_sz
         if "chunked" in self.headers.get("transfer-encoding", "").lower():
             return read_socket_chunked(self.sr, bufsz), -1
@@ -1899,12 +1918,23 @@ class HttpCli(object):
             self.in_hdr_recv = True
             self.s.settimeout(max(self.args.s_tbody // 20, 1))
             return read_socket_unbounded(self.sr, bufsz), remains
+        elif rbuf:
+            return read_socket_into(self.sr, rbuf, remains), remains  # type: ignore
         else:
             return read_socket(self.sr, bufsz, remains), remains
 
     def dump_to_file(self, is_put: bool) -> tuple[int, str, str, int, str, str]:
         # post_sz, sha_hex, sha_b64, remains, path, url
-        reader, remains = self.get_body_reader()
+        rbuf = self.conn.hsrv.rbufs.get()
+        try:
+            return self._dump_to_file(is_put, rbuf)
+        finally:
+            self.conn.hsrv.rbufs.put(rbuf)
+
+    def _dump_to_file(
+        self, is_put: bool, rbuf: bytearray
+    ) -> tuple[int, str, str, int, str, str]:
+        reader, remains = self.get_body_reader(rbuf)
         vfs, rem = self.asrv.vfs.get(self.vpath, self.uname, False, True)
         rnd, _, lifetime, xbu, xau = self.upload_flags(vfs)
         lim = vfs.get_dbv(rem)[0].lim
@@ -2611,13 +2641,12 @@ class HttpCli(object):
                         pass
 
             f = f or open(fsenc(path), "rb+", self.args.iobuf)
+            rbuf = self.conn.hsrv.rbufs.get()
 
             try:
                 for chash, cstart in zip(chashes, cstarts):
                     f.seek(cstart[0])
-                    reader = read_socket(
-                        self.sr, self.args.s_rd_sz, min(remains, chunksize)
-                    )
+                    reader = read_socket_into(self.sr, rbuf, min(remains, chunksize))
                     post_sz, _, sha_b64 = hashcopy(
                         reader, f, hasher, 0, self.args.s_wr_slp
                     )
@@ -2638,17 +2667,11 @@ class HttpCli(object):
                     if len(cstart) > 1 and path != os.devnull:
                         t = " & ".join(unicode(x) for x in cstart[1:])
                         self.log("clone %s to %s" % (cstart[0], t))
-                        ofs = 0
-                        while ofs < chunksize:
-                            bufsz = max(4 * 1024 * 1024, self.args.iobuf)
-                            bufsz = min(chunksize - ofs, bufsz)
-                            f.seek(cstart[0] + ofs)
-                            buf = f.read(bufsz)
-                            for wofs in cstart[1:]:
-                                f.seek(wofs + ofs)
-                                f.write(buf)
-
-                            ofs += len(buf)
+                        f.flush()
+                        fd = f.fileno()
+                        zb = "reflink" in vfs.flags
+                        for wofs in cstart[1:]:
+                            fcopy_range(fd, fd, cstart[0], wofs, chunksize, zb)
 
                         self.log("clone {} done".format(cstart[0]))
 
@@ -2682,6 +2705,8 @@ class HttpCli(object):
                 f.close()
                 chashes = []  # exception flag
                 raise
+            finally:
+                self.conn.hsrv.rbufs.put(rbuf)
         finally:
             if locked:
                 # now block until all chunks released+confirmed
@@ -3588,6 +3613,74 @@ class HttpCli(object):
 
         return txt
 
+    def tx_cres(self, cres: "CachedRes") -> bool:
+        """sends an embedded resource from the in-memory cache"""
+        status = 200
+        logmsg = "{:4} {} ".format("", self.req)
+
+        accept = set()
+        for zs in self.headers.get("accept-encoding", "").lower().split(","):
+            enc, _, q = zs.partition(";")
+            q = q.replace(" ", "")
+            try:
+                if q.startswith("q=") and float(q[2:]) <= 0:
+                    continue  # explicitly refused
+            except:
+                continue
+
+            accept.add(enc.strip())
+
+        if re.match(r"MSIE [4-6]\.", self.ua) and " SV1" not in self.ua:
+            accept = set()
+
+        enc, etag, body = cres.pick(accept)
+
+        do_send = True
+        if cres.lastmod:
+            file_lastmod, do_send, _ = self._chk_lastmod(int(cres.ts))
+            self.out_headers["Last-Modified"] = file_lastmod
+
+            if self.can_write:
+                self.out_headers["X-Lastmod3"] = str(int(cres.ts * 1000))
+
+        # if-none-match wins over if-modified-since
+        c_etag = self.headers.get("if-none-match")
+        if c_etag:
+            zl = [x.strip() for x in c_etag.split(",")]
+            zl = [x[2:] if x.startswith("W/") else x for x in zl]
+            do_send = "*" not in zl and not cres.etags.intersection(zl)
+            if not do_send and self.no304():
+                do_send = True
+
+        if not do_send:
+            status = 304
+
+        self.out_headers["ETag"] = etag
+        if cres.compressed:
+            self.out_headers["Vary"] += ", Accept-Encoding"
+            self.out_headers["Cache-Control"] = "max-age=604869"
+        else:
+            self.permit_caching()
+
+        if enc:
+            self.out_headers["Content-Encoding"] = enc
+
+        logmsg += "{} {}".format(enc or "plain", status)
+
+        if self.mode == "HEAD" or not do_send:
+            if self.do_log:
+                self.log(logmsg)
+
+            self.send_headers(length=len(body), status=status, mime=cres.mime)
+            return True
+
+        self.reply(body, status, cres.mime)
+
+        if self.do_log:
+            self.log("{},  {}".format(logmsg, self._spd(len(body))))
+
+        return True
+
     def tx_res(self, req_path: str) -> bool:
         status = 200
         logmsg = "{:4} {} ".format("", self.req)
@@ -3822,37 +3915,42 @@ class HttpCli(object):
         lower = 0
         upper = file_sz
         hrange = self.headers.get("range")
+        ranges: list[tuple[int, int]] = []
 
-        # let's not support 206 with compression
-        # and multirange / multipart is also not-impl (mostly because calculating contentlength is a pain)
+        # let's not support 206 with compression;
+        # multirange is not-impl for files that are still being uploaded
         if (
             do_send
             and not is_compressed
             and hrange
             and can_range
             and file_sz
-            and "," not in hrange
+            and (ptop is None or "," not in hrange)
+            and hrange.count(",") < RANGE_MAX
         ):
             try:
                 if not hrange.lower().startswith("bytes"):
                     raise Exception()
 
-                a, b = hrange.split("=", 1)[1].split("-")
-
-                if a.strip():
-                    lower = int(a.strip())
-                else:
-                    lower = 0
+                for zs in hrange.split("=", 1)[1].split(","):
+                    a, b = [x.strip() for x in zs.split("-")]
 
-                if b.strip():
-                    upper = int(b.strip()) + 1
-                else:
-                    upper = file_sz
+                    if a:
+                        lower = int(a)
+                        upper = int(b) + 1 if b else file_sz
+                        if lower < 0 or lower >= upper:
+                            raise Exception()
+                    else:
+                        # suffix; the last b bytes
+                        lower = max(0, file_sz - int(b))
+                        upper = file_sz
 
-                if upper > file_sz:
-                    upper = file_sz
+                    # skip unsatisfiable ranges; 416 if nothing is left
+                    upper = min(upper, file_sz)
+                    if lower < upper:
+                        ranges.append((lower, upper))
 
-                if lower < 0 or lower >= upper:
+                if not ranges:
                     raise Exception()
 
             except:
@@ -3864,12 +3962,26 @@ class HttpCli(object):
                 )
                 return True
 
+            # coalesce overlapping and adjacent ranges
+            ranges.sort()
+            zl = [ranges[0]]
+            for lower, upper in ranges[1:]:
+                if lower <= zl[-1][1]:
+                    zl[-1] = (zl[-1][0], max(upper, zl[-1][1]))
+                else:
+                    zl.append((lower, upper))
+            ranges = zl
+
             status = 206
-            self.out_headers["Content-Range"] = "bytes {}-{}/{}".format(
-                lower, upper - 1, file_sz
-            )
+            lower, upper = ranges[0]
+            if len(ranges) == 1:
+                ranges = []
+                self.out_headers["Content-Range"] = "bytes {}-{}/{}".format(
+                    lower, upper - 1, file_sz
+                )
 
-            logtail += " [\033[36m{}-{}\033[0m]".format(lower, upper)
+            for a, b in ranges or [(lower, upper)]:
+                logtail += " [\033[36m{}-{}\033[0m]".format(a, b)
 
         use_sendfile = False
         if decompress:
@@ -3906,6 +4018,23 @@ class HttpCli(object):
         if "nohtml" in self.vn.flags and "html" in mime:
             mime = "text/plain; charset=utf-8"
 
+        # multipart/byteranges; build the part headers first
+        # so the content-length is known, then lower/upper
+        # describe the whole response body from here on
+        parts: list[tuple[bytes, int, int]] = []
+        ptail = b""
+        if ranges:
+            bnd = ub64enc(os.urandom(12)).decode("ascii")
+            zs = "\r\n--%s\r\nContent-Type: %s\r\nContent-Range: bytes %d-%d/%d\r\n\r\n"
+            for a, b in ranges:
+                zb = (zs % (bnd, mime, a, b - 1, file_sz)).encode("utf-8")
+                parts.append((zb, a, b))
+
+            ptail = ("\r\n--%s--\r\n" % (bnd,)).encode("utf-8")
+            mime = "multipart/byteranges; boundary=" + bnd
+            lower = 0
+            upper = len(ptail) + sum(len(zb) + b - a for zb, a, b in parts)
+
         self.out_headers["Accept-Ranges"] = "bytes"
         logmsg += unicode(status) + logtail
 
@@ -3940,7 +4069,51 @@ class HttpCli(object):
             self.send_headers(length=upper - lower, status=status, mime=mime)
 
             sendfun = sendfile_kern if use_sendfile else sendfile_py
-            remains = sendfun(
+            if parts:
+                remains = self.tx_parts(sendfun, f, parts, ptail, upper, dls)
+            else:
+                remains = sendfun(
+                    self.log,
+                    lower,
+                    upper,
+                    f,
+                    self.s,
+                    self.args.s_wr_sz,
+                    self.args.s_wr_slp,
+                    not self.args.no_poll,
+                    dls,
+                    self.dl_id,
+                )
+
+        if remains > 0:
+            logmsg += " \033[31m" + unicode(upper - remains) + "\033[0m"
+            ret = False
+
+        spd = self._spd((upper - lower) - remains)
+        if self.do_log:
+            self.log("{},  {}".format(logmsg, spd))
+
+        return ret
+
+    def tx_parts(
+        self,
+        sendfun: Any,
+        f: typing.BinaryIO,
+        parts: list[tuple[bytes, int, int]],
+        ptail: bytes,
+        nbytes: int,
+        dls: dict[str, tuple[float, int]],
+    ) -> int:
+        """sends a multipart/byteranges body; returns num bytes not sent"""
+        remains = nbytes
+        for zb, lower, upper in parts:
+            try:
+                self.s.sendall(zb)
+            except:
+                return remains
+
+            remains -= len(zb)
+            zi = sendfun(
                 self.log,
                 lower,
                 upper,
@@ -3952,16 +4125,17 @@ class HttpCli(object):
                 dls,
                 self.dl_id,
             )
+            remains -= (upper - lower) - zi
+            if zi:
+                return remains
 
-        if remains > 0:
-            logmsg += " \033[31m" + unicode(upper - remains) + "\033[0m"
-            ret = False
-
-        spd = self._spd((upper - lower) - remains)
-        if self.do_log:
-            self.log("{},  {}".format(logmsg, spd))
+        try:
+            self.s.sendall(ptail)
+            remains -= len(ptail)
+        except:
+            pass
 
-        return ret
+        return remains
 
     def tx_pipe(
         self,
@@ -4124,7 +4298,6 @@ class HttpCli(object):
             raise Pebkac(400, "not enabled in server config")
 
         logmsg = "{:4} {} ".format("", self.req)
-        self.keepalive = False
 
         cancmp = not self.args.no_tarcmp
 
@@ -4172,7 +4345,6 @@ class HttpCli(object):
         cdis = "attachment; filename=\"{}.{}\"; filename*=UTF-8''{}.{}"
         cdis = cdis.format(afn, ext, ufn, ext)
         self.log(cdis)
-        self.send_headers(None, mime=mime, headers={"Content-Disposition": cdis})
 
         fgen = vn.zipgen(
             vpath, rem, set(items), self.uname, False, not self.args.no_scandir
@@ -4188,6 +4360,12 @@ class HttpCli(object):
                 self.log("transcoding to [{}]".format(cfmt))
                 fgen = gfilter(fgen, self.thumbcli, self.uname, vpath, cfmt)
 
+        if packer == StreamZip and "store" in uarg and not cfmt:
+            return self.tx_zip_store(fgen, "utf" in uarg, cdis, logmsg)
+
+        self.keepalive = False
+        self.send_headers(None, mime=mime, headers={"Content-Disposition": cdis})
+
         now = time.time()
         self.dl_id = "%s:%s" % (self.ip, self.addr[1])
         self.conn.hsrv.dli[self.dl_id] = (
@@ -4207,7 +4385,9 @@ class HttpCli(object):
             utf8="utf" in uarg,
             pre_crc="crc" in uarg,
             cmp=uarg if cancmp or uarg == "pax" else "",
+            vec=True,
         )
+        use_sendfile = not self.tls and not self.args.no_sendfile
         n = 0
         bsent = 0
         for buf in bgen.gen():
@@ -4215,9 +4395,12 @@ class HttpCli(object):
                 break
 
             try:
-                self.s.sendall(buf)
-                bsent += len(buf)
+                nbuf, zi = self._tx_parts(buf, use_sendfile, dls)
+                bsent += nbuf - zi
             except:
+                zi = 1
+
+            if zi:
                 logmsg += " \033[31m" + unicode(bsent) + "\033[0m"
                 bgen.stop()
                 break
@@ -4231,6 +4414,200 @@ class HttpCli(object):
         self.log("{},  {}".format(logmsg, spd))
         return True
 
+    def tx_zip_store(
+        self,
+        fgen: Generator[dict[str, Any], None, None],
+        utf8: bool,
+        cdis: str,
+        logmsg: str,
+    ) -> bool:
+        """
+        uncompressed zip with a content-length, so it can be
+        resumed / seeked; crc32s come from the db when possible
+        """
+        idx = self.conn.get_u2idx()
+        if idx and not hasattr(idx, "p_end"):
+            idx = None
+
+        files: list[list[Any]] = []
+        w16s: list[Optional[tuple[str, str]]] = []
+        dbkey: Any = None
+        dbls: dict[str, tuple[int, int, str, Optional[int]]] = {}
+        for f in fgen:
+            st = f["st"]
+            if "err" in f or stat.S_ISDIR(st.st_mode):
+                continue
+
+            sz = st.st_size
+            ts = st.st_mtime
+            dbv = f.get("dbv")
+            crc = None if sz else 0
+            w16 = None
+            if sz and idx and dbv:
+                if dbkey != (dbv.realpath, f["rd"]):
+                    dbkey = (dbv.realpath, f["rd"])
+                    dbls = self._zip_crcs(idx, dbv, f["rd"])
+
+                zt = dbls.get(f["vp"].rsplit("/", 1)[-1])
+                if zt and zt[0] == int(ts) and zt[1] == sz:
+                    crc = zt[3]
+                    w16 = (dbv.realpath, zt[2])
+
+            files.append([f["vp"], f["ap"], sz, ts, crc])
+            w16s.append(w16)
+
+        zgen = StoreZip(self.log, self.args.iobuf, files, utf8)
+        total = zgen.size
+        etag = '"%s"' % (zgen.etag,)
+        nknown = len([x for x in files if x[4] is not None])
+        logmsg += "(%d files, %d crcs) " % (len(files), nknown)
+
+        lower = 0
+        upper = total
+        status = 200
+        hrange = self.headers.get("range")
+        if_range = self.headers.get("if-range")
+        if hrange and total and (not if_range or if_range == etag):
+            try:
+                if not hrange.lower().startswith("bytes") or "," in hrange:
+                    raise Exception()
+
+                a, b = [x.strip() for x in hrange.split("=", 1)[1].split("-")]
+                if a:
+                    lower = int(a)
+                    upper = min(total, int(b) + 1) if b else total
+                else:
+                    lower = max(0, total - int(b))
+
+                if lower < 0 or lower >= upper:
+                    raise Exception()
+            except:
+                err = "invalid range ({}), size={}".format(hrange, total)
+                self.loud_reply(
+                    err,
+                    status=416,
+                    headers={"Content-Range": "bytes */{}".format(total)},
+                )
+                return True
+
+            status = 206
+            self.out_headers["Content-Range"] = "bytes {}-{}/{}".format(
+                lower, upper - 1, total
+            )
+            logmsg += "[\033[36m{}-{}\033[0m] ".format(lower, upper)
+
+        self.out_headers["Accept-Ranges"] = "bytes"
+        self.out_headers["ETag"] = etag
+        self.send_headers(
+            length=upper - lower,
+            status=status,
+            mime="application/zip",
+            headers={"Content-Disposition": cdis},
+        )
+        if self.mode == "HEAD":
+            self.log(logmsg + unicode(status))
+            return True
+
+        now = time.time()
+        self.dl_id = "%s:%s" % (self.ip, self.addr[1])
+        self.conn.hsrv.dli[self.dl_id] = (
+            now,
+            upper - lower,
+            self.vn,
+            "%s :zip" % (self.vpath,),
+            self.uname,
+        )
+        dls = self.conn.hsrv.dls
+        dls[self.dl_id] = (now, 0)
+
+        use_sendfile = not self.tls and not self.args.no_sendfile
+        remains = upper - lower
+        try:
+            for x in zgen.gen(lower, upper):
+                nbuf, zi = self._tx_parts(x, use_sendfile, dls)
+                remains -= nbuf - zi
+                if zi:
+                    break
+        except Exception as ex:
+            self.log("zip aborted: %r" % (ex,), 3)
+        finally:
+            crcs: dict[str, list[tuple[str, int]]] = {}
+            for n in zgen.new_crcs:
+                zt2 = w16s[n]
+                if zt2:
+                    crcs.setdefault(zt2[0], []).append((zt2[1], files[n][4]))
+
+            for ptop, zl in crcs.items():
+                self.conn.hsrv.broker.say("up2k.crc_add", ptop, zl)
+
+        logmsg += unicode(status)
+        if remains > 0:
+            logmsg += " \033[31m" + unicode(upper - lower - remains) + "\033[0m"
+
+        spd = self._spd(upper - lower - remains)
+        self.log("{},  {}".format(logmsg, spd))
+        return remains <= 0
+
+    def _tx_parts(
+        self,
+        x: Union[bytes, list[bytes], tuple[str, int, int]],
+        use_sendfile: bool,
+        dls: dict[str, tuple[float, int]],
+    ) -> tuple[int, int]:
+        """
+        sends one item from an archive generator; bytes, a list of
+        bytes (vectored), or (abspath, lower, upper) from a file;
+        returns (num bytes to send, num bytes that were not sent)
+        """
+        if isinstance(x, bytes):
+            self.s.sendall(x)
+            return len(x), 0
+
+        if isinstance(x, list):
+            if self.tls:
+                self.s.sendall(b"".join(x))
+            else:
+                sendvec(self.s, x)
+            return sum(len(zb) for zb in x), 0
+
+        ap, a, b = x
+        sendfun = sendfile_py
+        if use_sendfile and (BITNESS > 32 or b < 0x7FFFFFFF):
+            sendfun = sendfile_kern
+
+        with open(fsenc(ap), "rb", self.args.iobuf) as f:
+            zi = sendfun(
+                self.log,
+                a,
+                b,
+                f,
+                self.s,
+                self.args.s_wr_sz,
+                self.args.s_wr_slp,
+                not self.args.no_poll,
+                dls,
+                self.dl_id,
+            )
+
+        return b - a, zi
+
+    def _zip_crcs(
+        self, idx: "U2idx", dbv: VFS, rd: str
+    ) -> dict[str, tuple[int, int, str, Optional[int]]]:
+        """{fn: (lastmod, size, wark[:16], crc32)} for files in rd"""
+        cur = idx.get_cur(dbv)
+        if not cur:
+            return {}
+
+        q = "select up.fn, up.mt, up.sz, up.w, cr.v from up left join cr on cr.w = substr(up.w,1,16) where up.rd = ?"
+        try:
+            return {
+                fn: (mt, sz, w[:16], crc)
+                for fn, mt, sz, w, crc in cur.execute(q, (rd,))
+            }
+        except:
+            return {}  # mojibake, or db is too old
+
     def tx_ico(self, ext: str, exact: bool = False) -> bool:
         self.permit_caching()
         if ext.endswith("/"):
@@ -5362,7 +5739,15 @@ class HttpCli(object):
 
                 thp = None
                 if self.thumbcli and not nothumb:
-                    thp = self.thumbcli.get(dbv, vrem, int(st.st_mtime), th_fmt)
+                    thp = self.thumbcli.get(
+                        dbv,
+                        vrem,
+                        int(st.st_mtime),
+                        th_fmt,
+                        "i",
+                        self.uname,
+                        lambda: sck_alive(self.s),
+                    )
 
                 if thp:
                     return self.tx_file(thp)
@@ -5600,6 +5985,7 @@ class HttpCli(object):
                     raise Pebkac(403, t)
                 return self.tx_zip(k, v, self.vpath, vn, rem, [])
 
+        t0_ls = time.time()
         fsroot, vfs_ls, vfs_virt = vn.ls(
             rem,
             self.uname,
@@ -5769,45 +6155,29 @@ class HttpCli(object):
         is_admin = self.can_admin
         tagset: set[str] = set()
         rd = vrem
-        for fe in files if icur else []:
-            assert icur  # !rm
-            fn = fe["name"]
-            erd_efn = (rd, fn)
-            q = "select mt.k, mt.v from up inner join mt on mt.w = substr(up.w,1,16) where up.rd = ? and up.fn = ? and +mt.k != 'x'"
+        lsm = None
+        if icur:
+            zsl = [] if "nodirsz" in vf else [x["name"] for x in dirs]
             try:
-                r = icur.execute(q, erd_efn)
+                lsm = idx.ls_meta(dbv, rd, zsl)
             except Exception as ex:
-                if "database is locked" in str(ex):
-                    break
-
-                try:
-                    erd_efn = s3enc(idx.mem_cur, rd, fn)
-                    r = icur.execute(q, erd_efn)
-                except:
-                    t = "tag read error, {}/{}\n{}"
-                    self.log(t.format(rd, fn, min_ex()))
-                    break
-
-            tags = {k: v for k, v in r}
+                if "database is locked" not in str(ex):
+                    t = "tag read error, {}\n{}"
+                    self.log(t.format(rd, min_ex()))
 
-            if is_admin:
-                q = "select ip, at from up where rd=? and fn=?"
-                try:
-                    zs1, zs2 = icur.execute(q, erd_efn).fetchone()
-                    if zs1:
-                        tags["up_ip"] = zs1
-                    if zs2:
-                        tags[".up_at"] = zs2
-                except:
-                    pass
-            elif add_up_at:
-                q = "select at from up where rd=? and fn=?"
-                try:
-                    (zs1,) = icur.execute(q, erd_efn).fetchone()
-                    if zs1:
-                        tags[".up_at"] = zs1
-                except:
-                    pass
+        for fe in files if icur else []:
+            tags = {}
+            zt = lsm[0].get(fe["name"]) if lsm else None
+            if zt:
+                ip, at, zd = zt
+                tags.update(zd)  # cached; do not modify
+                if is_admin:
+                    if ip:
+                        tags["up_ip"] = ip
+                    if at:
+                        tags[".up_at"] = at
+                elif add_up_at and at:
+                    tags[".up_at"] = at
 
             _ = [tagset.add(k) for k in tags]
             fe["tags"] = tags
@@ -5822,19 +6192,19 @@ class HttpCli(object):
 
             if "nodirsz" not in vf:
                 tagset.add(".files")
-                vdir = "%s/" % (rd,) if rd else ""
-                q = "select sz, nf from ds where rd=? limit 1"
+                dsz = lsm[1] if lsm else {}
                 for fe in dirs:
-                    try:
-                        hit = icur.execute(q, (vdir + fe["name"],)).fetchone()
-                        (fe["sz"], fe["tags"][".files"]) = hit
-                    except:
-                        pass  # 404 or mojibake
+                    zt = dsz.get(fe["name"])
+                    if zt and zt[0] >= 0:
+                        (fe["sz"], fe["tags"][".files"]) = zt
 
             taglist = [k for k in lmte if k in tagset]
         else:
             taglist = list(tagset)
 
+        if len(files) + len(dirs) >= LS_BIG:
+            self.conn.hsrv.ls_lat.append(time.time() - t0_ls)
+
         logues, readmes = self._add_logues(vn, abspath, lnames)
         ls_ret["logues"] = j2a["logues"] = logues
         ls_ret["readmes"] = cgv["readmes"] = readmes
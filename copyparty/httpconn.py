@@ -77,6 +77,8 @@ class HttpConn(object):
         self.stopping = False
         self.nreq: int = -1  # mypy404
         self.nbyte: int = 0  # mypy404
+        self.parked: float = 0.0  # when it was parked by hsrv
+        self.npark: int = 0
         self.u2idx: Optional[U2idx] = None
         self.log_func: "Util.RootLogger" = hsrv.log  # mypy404
         self.log_src: str = "httpconn"  # mypy404
@@ -87,6 +89,14 @@ class HttpConn(object):
 
     def shutdown(self) -> None:
         self.stopping = True
+        if self.parked:
+            # makes it readable; hsrv.thr_park wakes it up and it gets dropped
+            try:
+                self.s.shutdown(socket.SHUT_RDWR)
+                return
+            except:
+                pass
+
         try:
             shut_socket(self.log, self.s, 1)
         except:
@@ -145,7 +155,8 @@ class HttpConn(object):
 
         return not method or not bool(PTN_HTTP.match(method))
 
-    def run(self) -> None:
+    def run(self) -> bool:
+        """returns true if the connection was left idle for hsrv to park"""
         self.s.settimeout(10)
 
         self.sr = None
@@ -160,7 +171,7 @@ class HttpConn(object):
         if is_https:
             if self.sr:
                 self.log("TODO: cannot do https in jython", c="1;31")
-                return
+                return False
 
             self.log_src = self.log_src.replace("[36m", "[35m")
             try:
@@ -210,17 +221,33 @@ class HttpConn(object):
                 else:
                     self.log("handshake\033[0m " + em, c=5)
 
-                return
+                return False
 
         if not self.sr:
             self.sr = Util.Unrecv(self.s, self.log)
 
+        return self.run_reqs()
+
+    def run_reqs(self) -> bool:
+        """
+        handles requests until the client disconnects (returns false),
+        or until it goes idle between keepalive requests (returns true)
+        """
+        assert self.sr  # !rm
         while not self.stopping:
             self.nreq += 1
             self.cli = HttpCli(self)
             if not self.cli.run():
-                return
+                return False
 
             if self.u2idx:
                 self.hsrv.put_u2idx(str(self.addr), self.u2idx)
                 self.u2idx = None
+
+            # can't park if the next request is already buffered
+            # (pipelining, or tls records which have been decrypted)
+            pending = getattr(self.s, "pending", None)
+            if self.hsrv.park_sel and not self.sr.buf and not (pending and pending()):
+                return True
+
+        return False
@@ -9,9 +9,17 @@ import socket
 import sys
 import threading
 import time
+from collections import deque
 
 import queue
 
+try:
+    import selectors
+
+    HAVE_SEL = True
+except:
+    HAVE_SEL = False
+
 from .__init__ import ANYWIN, CORES, EXE, MACOS, PY2, TYPE_CHECKING, EnvParams, unicode
 
 try:
@@ -57,10 +65,12 @@ except SyntaxError:
 
 from .httpconn import HttpConn
 from .metrics import Metrics
+from .rescache import ResCache
 from .u2idx import U2idx
 from .util import (
     E_SCK,
     FHC,
+    BufPool,
     CachedDict,
     Daemon,
     Garda,
@@ -151,13 +161,26 @@ class HttpSrv(object):
         )
         self.t_periodic: Optional[threading.Thread] = None
 
+        # idle keepalive connections wait in a selector instead of a thread
+        self.park_sel: Optional["selectors.BaseSelector"] = None
+        self.park_q: list[HttpConn] = []
+        self.npark = 0  # exact
+        if HAVE_SEL and not ANYWIN and not self.args.no_park:
+            self.park_sel = selectors.DefaultSelector()
+            self.park_r, self.park_w = socket.socketpair()
+            self.park_r.setblocking(False)
+            self.park_w.setblocking(False)
+            self.park_sel.register(self.park_r, selectors.EVENT_READ)
+
         self.u2fh = FHC()
+        self.rbufs = BufPool(self.args.s_rd_sz, CORES * 4)
         self.u2sc: dict[str, tuple[int, "hashlib._Hash"]] = {}
         self.pipes = CachedDict(0.2)
         self.metrics = Metrics(self)
         self.nreq = 0
         self.nsus = 0
         self.nban = 0
+        self.ls_lat: deque[float] = deque(maxlen=1000)  # big folders
         self.srvs: list[socket.socket] = []
         self.ncli = 0  # exact
         self.clients: set[HttpConn] = set()  # laggy
@@ -224,6 +247,15 @@ class HttpSrv(object):
         self.th_cfg: dict[str, set[str]] = {}
         Daemon(self.post_init, "hsrv-init2")
 
+        self.res: Optional[ResCache] = None
+        if not PY2 and not self.args.no_rescache:
+            self.res = ResCache(self.E, self.log)
+            Daemon(self.res.build, "hsrv-res")
+
+        self.t_park: Optional[threading.Thread] = None
+        if self.park_sel:
+            self.t_park = Daemon(self.thr_park, self.name + "-park")
+
     def post_init(self) -> None:
         try:
             x = self.broker.ask("thumbsrv.getcfg")
@@ -261,7 +293,7 @@ class HttpSrv(object):
             with self.u2mutex, self.mutex:
                 self.u2fh.clean()
                 if self.tp_q:
-                    self.tp_ncli = max(self.ncli, self.tp_ncli - 2)
+                    self.tp_ncli = max(self.ncli - self.npark, self.tp_ncli - 2)
                     if self.tp_nthr > self.tp_ncli + 8:
                         self.stop_threads(4)
 
@@ -407,7 +439,7 @@ class HttpSrv(object):
             self.accept(sck, addr)
 
     def accept(self, sck: socket.socket, addr: tuple[str, int]) -> None:
-        """takes an incoming tcp connection and creates a thread to handle it"""
+        """takes an incoming tcp connection and parks it, or gives it a thread"""
         now = time.time()
 
         if now - (self.tp_time or now) > 300:
@@ -416,6 +448,9 @@ class HttpSrv(object):
             self.tp_time = 0
             self.tp_q = None
 
+        # with parking, new connections also wait for their first request there
+        cli = HttpConn(sck, addr, self) if self.park_sel else None
+
         with self.mutex:
             self.ncli += 1
             if not self.t_periodic:
@@ -425,15 +460,16 @@ class HttpSrv(object):
 
                 self.t_periodic = Daemon(self.periodic, name)
 
-            if self.tp_q:
-                self.tp_time = self.tp_time or now
-                self.tp_ncli = max(self.tp_ncli, self.ncli)
-                if self.tp_nthr < self.ncli + 4:
-                    self.start_threads(8)
-
-                self.tp_q.put((sck, addr))
+            if cli:
+                self.clients.add(cli)
+            elif self.tp_q:
+                self.tp_put(now, (sck, addr))
                 return
 
+        if cli:
+            self.park(cli)
+            return
+
         if not self.args.no_htp:
             t = "looks like the httpserver threadpool died; please make an issue on github and tell me the story of how you pulled that off, thanks and dog bless\n"
             self.log(self.name, t, 1)
@@ -444,6 +480,142 @@ class HttpSrv(object):
             (sck, addr),
         )
 
+    def tp_put(self, now: float, task: tuple[Any, ...]) -> None:
+        """hand a client to the threadpool; caller must hold mutex"""
+        assert self.tp_q  # !rm
+        nact = self.ncli - self.npark
+        self.tp_time = self.tp_time or now
+        self.tp_ncli = max(self.tp_ncli, nact)
+        if self.tp_nthr < nact + 4:
+            self.start_threads(8)
+
+        self.tp_q.put(task)
+
+    def park(self, cli: HttpConn) -> None:
+        """
+        an idle keepalive connection; let thr_park wait for its
+        next request so it doesn't tie up a thread in the meantime
+        """
+        with self.mutex:
+            if self.stopping:
+                cli.parked = 0
+                drop = True
+            else:
+                drop = False
+                self.npark += 1
+                self.park_q.append(cli)
+
+        if drop:
+            self.drop_client(cli, 0)
+            return
+
+        try:
+            self.park_w.send(b"x")
+        except:
+            pass  # full; thr_park will get to it
+
+    def thr_park(self) -> None:
+        """
+        waits for parked connections to become readable, then hands them back
+        to the threadpool; anything that stays idle for --s-thead is dropped
+        """
+        assert self.park_sel  # !rm
+        sel = self.park_sel
+        ev_rd = selectors.EVENT_READ
+        # (deadline, cli, npark) in the order they were parked
+        expq: deque[tuple[float, HttpConn, int]] = deque()
+        t_idle = self.args.s_thead
+        while not self.stopping:
+            try:
+                evs = sel.select(1)
+            except Exception as ex:
+                self.log(self.name, "park: select failed: %r" % (ex,), 3)
+                time.sleep(0.1)
+                continue
+
+            now = time.time()
+            wake = []
+            for key, _ in evs:
+                cli = key.data
+                if not cli:
+                    try:
+                        while self.park_r.recv(4096):
+                            pass
+                    except:
+                        pass
+                    continue
+
+                sel.unregister(key.fileobj)
+                cli.parked = 0
+                wake.append(cli)
+
+            with self.mutex:
+                zl = self.park_q
+                self.park_q = []
+
+            for cli in zl:
+                try:
+                    sel.register(cli.s, ev_rd, cli)
+                except Exception as ex:
+                    cli.log("park: %r" % (ex,), 3)
+                    wake.append(cli)
+                    continue
+
+                cli.npark += 1
+                cli.parked = now
+                expq.append((now + t_idle, cli, cli.npark))
+
+            drop = []
+            while expq and expq[0][0] < now:
+                _, cli, npark = expq.popleft()
+                if cli.parked and cli.npark == npark:
+                    try:
+                        sel.unregister(cli.s)
+                    except:
+                        pass
+                    cli.parked = 0
+                    drop.append(cli)
+
+            if self.stopping:
+                drop += wake
+                wake = []
+
+            if not wake and not drop:
+                continue
+
+            with self.mutex:
+                self.npark -= len(wake) + len(drop)
+                for cli in wake:
+                    if self.tp_q:
+                        self.tp_put(now, (cli.s, cli.addr, cli))
+                    else:
+                        Daemon(self.thr_client, "httpconn-ka", (cli.s, cli.addr, cli))
+
+            # idle for --s-thead; nothing in flight, so don't linger
+            for cli in drop:
+                try:
+                    self.drop_client(cli, 0)
+                except Exception as ex:
+                    cli.log("park: drop failed: %r" % (ex,), 3)
+
+        # stopping; nobody will wake the rest of them up
+        drop = [x.data for x in list(sel.get_map().values()) if x.data]
+        with self.mutex:
+            drop += self.park_q
+            self.park_q = []
+            self.npark -= len(drop)
+
+        for cli in drop:
+            cli.parked = 0
+            try:
+                self.drop_client(cli, 0)
+            except Exception as ex:
+                cli.log("park: drop failed: %r" % (ex,), 3)
+
+        sel.close()
+        self.park_r.close()
+        self.park_w.close()
+
     def thr_poolw(self) -> None:
         assert self.tp_q  # !rm
         while True:
@@ -455,10 +627,10 @@ class HttpSrv(object):
                 self.tp_time = 0
 
             try:
-                sck, addr = task
+                addr = task[1]
                 me = threading.current_thread()
                 me.name = "httpconn-%s-%d" % (addr[0].split(".", 2)[-1][-6:], addr[1])
-                self.thr_client(sck, addr)
+                self.thr_client(*task)
                 me.name = self.name + "-poolw"
             except Exception as ex:
                 if str(ex).startswith("client d/c "):
@@ -491,21 +663,35 @@ class HttpSrv(object):
         for t in thrs:
             t.join()
 
+        if self.t_park:
+            try:
+                self.park_w.send(b"x")
+            except:
+                pass
+            self.t_park.join(5)
+
         self.log(self.name, "ok bye")
 
-    def thr_client(self, sck: socket.socket, addr: tuple[str, int]) -> None:
-        """thread managing one tcp client"""
-        cli = HttpConn(sck, addr, self)
-        with self.mutex:
-            self.clients.add(cli)
+    def thr_client(
+        self, sck: socket.socket, addr: tuple[str, int], cli: Optional[HttpConn] = None
+    ) -> None:
+        """thread managing one tcp client (or a parked one that woke up)"""
+        if cli:
+            run = cli.run if cli.nreq < 0 else cli.run_reqs
+        else:
+            cli = HttpConn(sck, addr, self)
+            run = cli.run
+            with self.mutex:
+                self.clients.add(cli)
 
         # print("{}\n".format(len(self.clients)), end="")
         fno = sck.fileno()
+        parked = False
         try:
             if self.args.log_conn:
                 self.log("%s %s" % addr, "|%sC-crun" % ("-" * 4,), c="90")
 
-            cli.run()
+            parked = run()
 
         except (OSError, socket.error) as ex:
             if ex.errno not in E_SCK:
@@ -516,29 +702,36 @@ class HttpSrv(object):
                 )
 
         finally:
-            sck = cli.s
-            if self.args.log_conn:
-                self.log("%s %s" % addr, "|%sC-cdone" % ("-" * 5,), c="90")
+            if parked:
+                self.park(cli)
+            else:
+                self.drop_client(cli)
 
-            try:
-                fno = sck.fileno()
-                shut_socket(cli.log, sck)
-            except (OSError, socket.error) as ex:
-                if not MACOS:
-                    self.log(
-                        "%s %s" % addr,
-                        "shut({}): {}".format(fno, ex),
-                        c="90",
-                    )
-                if ex.errno not in E_SCK:
-                    raise
-            finally:
-                with self.mutex:
-                    self.clients.remove(cli)
-                    self.ncli -= 1
+    def drop_client(self, cli: HttpConn, tshut: int = 3) -> None:
+        sck = cli.s
+        addr = cli.addr
+        if self.args.log_conn:
+            self.log("%s %s" % addr, "|%sC-cdone" % ("-" * 5,), c="90")
+
+        try:
+            fno = sck.fileno()
+            shut_socket(cli.log, sck, tshut)
+        except (OSError, socket.error) as ex:
+            if not MACOS:
+                self.log(
+                    "%s %s" % addr,
+                    "shut({}): {}".format(fno, ex),
+                    c="90",
+                )
+            if ex.errno not in E_SCK:
+                raise
+        finally:
+            with self.mutex:
+                self.clients.remove(cli)
+                self.ncli -= 1
 
-                if cli.u2idx:
-                    self.put_u2idx(str(addr), cli.u2idx)
+            if cli.u2idx:
+                self.put_u2idx(str(addr), cli.u2idx)
 
     def cachebuster(self) -> str:
         if time.time() - self.cb_ts < 1:
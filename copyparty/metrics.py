@@ -5,6 +5,7 @@ import json
 import time
 
 from .__init__ import TYPE_CHECKING
+from .th_srv import TH_DEP_BKTS, TH_LAT_BKTS
 from .util import Pebkac, get_df, unhumanize
 
 if TYPE_CHECKING:
@@ -60,6 +61,10 @@ class Metrics(object):
             zs = "# TYPE %s gauge\n# UNIT %s bytes\n# HELP %s %s"
             ret.append(zs % (k, k, k, desc))
 
+        def adduh(k: str, typ: str, unit: str, desc: str) -> None:
+            zs = "# TYPE %s %s\n# UNIT %s %s\n# HELP %s %s"
+            ret.append(zs % (k, typ, k, unit, k, desc))
+
         def addv(k: str, v: str) -> None:
             ret.append("%s %s" % (k, v))
 
@@ -90,6 +95,16 @@ class Metrics(object):
         t = "number of IPs banned since last restart"
         addg("cpp_total_bans", str(self.hsrv.nban), t)
 
+        lat = sorted(self.hsrv.ls_lat)
+        if lat:
+            t = "time to build listings of big folders (1000+ entries; recent 1000)"
+            adduh("cpp_ls_big_seconds", "summary", "seconds", t)
+            for zf in (0.5, 0.99):
+                zs = "{:.3f}".format(lat[int(len(lat) * zf)])
+                addv('cpp_ls_big_seconds{quantile="%s"}' % (zf,), zs)
+            addv("cpp_ls_big_seconds_count", str(len(lat)))
+            addv("cpp_ls_big_seconds_sum", "{:.3f}".format(sum(lat)))
+
         if not args.nos_vst:
             x = self.hsrv.broker.ask("up2k.get_state", True, "")
             vs = json.loads(x.get())
@@ -127,6 +142,78 @@ class Metrics(object):
             except:
                 pass
 
+            zil = vs.get("thpre") or [0, 0, 0]
+            t = "number of files queued for thumbnail pre-generation"
+            addg("cpp_thpre_files", str(zil[0]), t)
+
+            t = "number of thumbnails created by pre-generation"
+            addc("cpp_thpre_done", str(zil[1]), t)
+
+            t = "number of files skipped by pre-generation (queue was full)"
+            addc("cpp_thpre_drop", str(zil[2]), t)
+
+            # per priority class; interactive, prefetch, bulk
+            thq = vs.get("thq") or {}
+            if thq:
+                cls = {"i": "interactive", "p": "prefetch", "b": "bulk"}
+
+                t = "number of thumbnails/transcodes waiting for a worker"
+                addh("cpp_thumb_queued", "gauge", t)
+                for k, v in thq.items():
+                    addv('cpp_thumb_queued{cls="%s"}' % (cls[k],), str(v["q"]))
+
+                t = "number of thumbnails/transcodes being created"
+                addh("cpp_thumb_running", "gauge", t)
+                for k, v in thq.items():
+                    addv('cpp_thumb_running{cls="%s"}' % (cls[k],), str(v["run"]))
+
+                t = "time from queued until a thumbnail/transcode was ready"
+                adduh("cpp_thumb_latency_seconds", "histogram", "seconds", t)
+                for k, v in thq.items():
+                    zs = 'cpp_thumb_latency_seconds_bucket{cls="%s",le="%s"}'
+                    n = 0
+                    for le, nb in zip(TH_LAT_BKTS + ("+Inf",), v["lat"]):
+                        n += nb
+                        addv(zs % (cls[k], le), str(n))
+                    zs = 'cpp_thumb_latency_seconds_%s{cls="%s"}'
+                    addv(zs % ("count", cls[k]), str(n))
+                    addv(zs % ("sum", cls[k]), "{:.3f}".format(v["lsum"]))
+
+                t = "number of jobs already queued when a job was added"
+                addh("cpp_thumb_depth", "histogram", t)
+                for k, v in thq.items():
+                    zs = 'cpp_thumb_depth_bucket{cls="%s",le="%s"}'
+                    n = 0
+                    for le, nb in zip(TH_DEP_BKTS + ("+Inf",), v["dep"]):
+                        n += nb
+                        addv(zs % (cls[k], le), str(n))
+                    addv('cpp_thumb_depth_count{cls="%s"}' % (cls[k],), str(n))
+
+            # [acquired, contended, wait_sec, maxwait_sec] per up2k mutex
+            locks = vs.get("locks") or {}
+            if locks:
+                t = "number of times an up2k mutex was taken"
+                addh("cpp_lock_acquired", "counter", t)
+                for k, v in locks.items():
+                    addv('cpp_lock_acquired_total{lock="%s"}' % (k,), str(v[0]))
+
+                t = "number of times someone had to wait for an up2k mutex"
+                addh("cpp_lock_contended", "counter", t)
+                for k, v in locks.items():
+                    addv('cpp_lock_contended_total{lock="%s"}' % (k,), str(v[1]))
+
+                t = "total time spent waiting for an up2k mutex"
+                adduh("cpp_lock_wait_seconds", "counter", "seconds", t)
+                for k, v in locks.items():
+                    zs = "{:.3f}".format(v[2])
+                    addv('cpp_lock_wait_seconds_total{lock="%s"}' % (k,), zs)
+
+                t = "longest wait for an up2k mutex"
+                adduh("cpp_lock_maxwait_seconds", "gauge", "seconds", t)
+                for k, v in locks.items():
+                    zs = "{:.3f}".format(v[3])
+                    addv('cpp_lock_maxwait_seconds{lock="%s"}' % (k,), zs)
+
         if not args.nos_hdd:
             addbh("cpp_disk_size_bytes", "total HDD size of volume")
             addbh("cpp_disk_free_bytes", "free HDD space in volume")
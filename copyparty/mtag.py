@@ -9,15 +9,21 @@ import shutil
 import subprocess as sp
 import sys
 import tempfile
+import threading
+from collections import deque
+from queue import Empty, Queue
 
 from .__init__ import ANYWIN, EXE, PY2, WINDOWS, E, unicode
 from .authsrv import VFS
 from .bos import bos
 from .util import (
     FFMPEG_URL,
+    NICES,
     REKOBO_LKEY,
     VF_CAREFUL,
+    Daemon,
     fsenc,
+    killtree,
     min_ex,
     pybin,
     retchk,
@@ -69,6 +75,7 @@ CBZ_01 = re.compile(r"(^|[^0-9v])0+[01]\b")
 
 class MParser(object):
     def __init__(self, cmdline: str) -> None:
+        self.cmdline = cmdline
         self.tag, args = cmdline.split("=", 1)
         self.tags = self.tag.split(",")
 
@@ -79,6 +86,7 @@ class MParser(object):
         self.audio = "y"
         self.pri = 0  # priority; higher = later
         self.ext = []
+        self.worker = False  # long-lived; line-json over stdin/stdout
 
         while True:
             try:
@@ -123,9 +131,173 @@ class MParser(object):
                 self.pri = int(arg[1:] or "1")
                 continue
 
+            if arg == "w":
+                self.worker = True
+                continue
+
             raise Exception()
 
 
+class MtpWorker(object):
+    """
+    one long-lived mtp process (the w flag); for each file it gets
+    a line of json on stdin, {"id": 1, "path": "/abs/path", "tags": {...}}
+    where tags is only included for p-flagged parsers, and replies
+    with one line on stdout, {"v": value} or {"err": "reason"},
+    which should also echo the id; anything unexpected kills it
+    """
+
+    def __init__(self, log: "NamedLogger", parser: MParser, env: dict[str, str]):
+        self.log = log
+        self.parser = parser
+        self.dead = False
+        self.nreq = 0
+        self.q: Queue[Optional[bytes]] = Queue()
+        self.err: deque[str] = deque(maxlen=20)
+
+        cmd = [parser.bin, "--mtp-worker"]
+        if parser.bin.endswith(".py"):
+            cmd = [pybin] + cmd
+
+        ka: dict[str, Any] = {}
+        if WINDOWS:
+            ka["creationflags"] = 0x4000  # nice
+        elif NICES:
+            cmd = [NICES] + cmd
+
+        self.p = sp.Popen(
+            [sfsenc(x) for x in cmd],
+            stdin=sp.PIPE,
+            stdout=sp.PIPE,
+            stderr=sp.PIPE,
+            env=env,
+            **ka
+        )
+
+        if not ANYWIN:
+            try:
+                with open("/proc/%d/oom_score_adj" % (self.p.pid,), "wb") as f:
+                    f.write(b"300\n")
+            except:
+                pass
+
+        Daemon(self._rx, "mtp-rx", (self.p.stdout, self.q))
+        Daemon(self._rx, "mtp-rxe", (self.p.stderr, None))
+
+    def _rx(self, f: Any, q: Optional[Queue[Optional[bytes]]]) -> None:
+        try:
+            for ln in f:
+                if q:
+                    if ln.strip():
+                        q.put(ln)
+                else:
+                    self.err.append(ln.decode("utf-8", "replace").rstrip())
+        except:
+            pass
+
+        if q:
+            q.put(None)
+
+    def run(self, req: dict[str, Any]) -> Any:
+        """returns the value for req; raises if it dies or times out"""
+        self.nreq += 1
+        req["id"] = self.nreq
+        try:
+            assert self.p.stdin  # !rm
+            self.p.stdin.write(json.dumps(req).encode("utf-8") + b"\n")
+            self.p.stdin.flush()
+            ln = self.q.get(timeout=self.parser.timeout)
+        except Empty:
+            self.stop(True)
+            raise Exception("timeout after %d sec" % (self.parser.timeout,))
+        except:
+            ln = None
+
+        if ln is None:
+            self.dead = True
+            rc = self.p.poll()
+            raise Exception("crashed (rc=%s): %s" % (rc, "\n".join(self.err)))
+
+        try:
+            zd = json.loads(ln)
+            if not isinstance(zd, dict) or zd.get("id", self.nreq) != self.nreq:
+                raise Exception()
+        except:
+            # out of sync; the real reply could still be on its way
+            self.dead = True
+            zs = ln.decode("utf-8", "replace").strip()[:200]
+            raise Exception("unexpected reply: %r" % (zs,))
+
+        if "err" in zd:
+            raise Exception(zd["err"])
+
+        return zd.get("v")
+
+    def stop(self, timeout: bool = False) -> None:
+        self.dead = True
+        try:
+            assert self.p.stdin  # !rm
+            self.p.stdin.close()
+        except:
+            pass
+
+        kill = self.parser.kill if timeout else "m"
+        if kill == "n":
+            return  # let it finish; it exits on stdin eof
+        elif kill == "m":
+            self.p.kill()
+        else:
+            killtree(self.p.pid)
+
+        try:
+            self.p.wait(1)
+        except:
+            pass
+
+
+class MtpPool(object):
+    """
+    idle MtpWorkers for one parser; there is at most one
+    per tagger thread, since each thread holds on to one
+    """
+
+    def __init__(self, log: "NamedLogger", parser: MParser, env: dict[str, str]):
+        self.log = log
+        self.parser = parser
+        self.env = env
+        self.mutex = threading.Lock()
+        self.idle: list[MtpWorker] = []
+        self.nspawn = 0
+
+    def run(self, req: dict[str, Any]) -> Any:
+        with self.mutex:
+            wrk = self.idle.pop() if self.idle else None
+
+        if not wrk:
+            self.nspawn += 1
+            if self.nspawn > 1:
+                t = "starting mtp worker #%d for %s"
+                self.log(t % (self.nspawn, self.parser.bin), 6)
+            wrk = MtpWorker(self.log, self.parser, self.env)
+
+        try:
+            return wrk.run(req)
+        finally:
+            if wrk.dead:
+                wrk.stop()
+            else:
+                with self.mutex:
+                    self.idle.append(wrk)
+
+    def stop(self) -> None:
+        with self.mutex:
+            wrks = self.idle
+            self.idle = []
+
+        for wrk in wrks:
+            wrk.stop()
+
+
 def au_unpk(
     log: "NamedLogger", fmt_map: dict[str, str], abspath: str, vn: Optional[VFS] = None
 ) -> str:
@@ -366,6 +538,8 @@ class MTag(object):
         self.log_func = log_func
         self.args = args
         self.usable = True
+        self.mtp_mutex = threading.Lock()
+        self.mtp_pools: dict[str, MtpPool] = {}  # parser cmdline: pool
         self.prefer_mt = not args.no_mtag_ff
         self.backend = (
             "ffprobe" if args.no_mutagen or (HAVE_FFPROBE and EXE) else "mutagen"
@@ -665,27 +839,43 @@ class MTag(object):
         ret: dict[str, Any] = {}
         for tagname, parser in sorted(parsers.items(), key=lambda x: (x[1].pri, x[0])):
             try:
-                cmd = [parser.bin, ap]
-                if parser.bin.endswith(".py"):
-                    cmd = [pybin] + cmd
-
-                args = {
-                    "env": env,
-                    "nice": True,
-                    "oom": 300,
-                    "timeout": parser.timeout,
-                    "kill": parser.kill,
-                    "capture": parser.capture,
-                }
-
-                if parser.pri:
-                    zd = oth_tags.copy()
-                    zd.update(ret)
-                    args["sin"] = json.dumps(zd).encode("utf-8", "replace")
-
-                bcmd = [sfsenc(x) for x in cmd[:-1]] + [fsenc(cmd[-1])]
-                rc, v, err = runcmd(bcmd, **args)  # type: ignore
-                retchk(rc, bcmd, err, self.log, 5, self.args.mtag_v)
+                if parser.worker:
+                    req: dict[str, Any] = {"path": ap}
+                    if parser.pri:
+                        zd = oth_tags.copy()
+                        zd.update(ret)
+                        req["tags"] = zd
+
+                    v = self._mtp_pool(parser, env).run(req)
+                    if isinstance(v, dict):
+                        v = json.dumps(v)
+                    elif v is None:
+                        continue
+
+                    v = unicode(v)
+                else:
+                    cmd = [parser.bin, ap]
+                    if parser.bin.endswith(".py"):
+                        cmd = [pybin] + cmd
+
+                    args = {
+                        "env": env,
+                        "nice": True,
+                        "oom": 300,
+                        "timeout": parser.timeout,
+                        "kill": parser.kill,
+                        "capture": parser.capture,
+                    }
+
+                    if parser.pri:
+                        zd = oth_tags.copy()
+                        zd.update(ret)
+                        args["sin"] = json.dumps(zd).encode("utf-8", "replace")
+
+                    bcmd = [sfsenc(x) for x in cmd[:-1]] + [fsenc(cmd[-1])]
+                    rc, v, err = runcmd(bcmd, **args)  # type: ignore
+                    retchk(rc, bcmd, err, self.log, 5, self.args.mtag_v)
+
                 v = v.strip()
                 if not v:
                     continue
@@ -706,3 +896,20 @@ class MTag(object):
             wunlink(self.log, ap, VF_CAREFUL)
 
         return ret
+
+    def _mtp_pool(self, parser: MParser, env: dict[str, str]) -> MtpPool:
+        with self.mtp_mutex:
+            pool = self.mtp_pools.get(parser.cmdline)
+            if not pool:
+                pool = MtpPool(self.log, parser, env)
+                self.mtp_pools[parser.cmdline] = pool
+
+            return pool
+
+    def shutdown(self) -> None:
+        with self.mtp_mutex:
+            pools = list(self.mtp_pools.values())
+            self.mtp_pools = {}
+
+        for pool in pools:
+            pool.stop()
@@ -0,0 +1,158 @@
+# coding: utf-8
+from __future__ import print_function, unicode_literals
+
+import gzip
+import hashlib
+import time
+
+from .__init__ import RES, TYPE_CHECKING, EnvParams
+from .util import (
+    formatdate,
+    guess_mime,
+    has_resource,
+    load_resource,
+    min_ex,
+    stat_resource,
+    ub64enc,
+)
+
+try:
+    try:
+        import brotli
+    except ImportError:
+        import brotlicffi as brotli  # type: ignore
+
+    HAVE_BROTLI = True
+except:
+    HAVE_BROTLI = False
+
+try:
+    try:
+        from compression import zstd  # type: ignore  # py3.14
+
+        def zstd_compress(buf: bytes) -> bytes:
+            return zstd.compress(buf, level=19)
+
+    except ImportError:
+        import zstandard
+
+        def zstd_compress(buf: bytes) -> bytes:
+            return zstandard.ZstdCompressor(level=19).compress(buf)
+
+    HAVE_ZSTD = True
+except:
+    HAVE_ZSTD = False
+
+if True:  # pylint: disable=using-constant-test
+    from typing import Optional
+
+if TYPE_CHECKING:
+    from .util import RootLogger
+
+
+class CachedRes(object):
+    """one embedded resource, with all of its content-encodings"""
+
+    def __init__(
+        self, mime: str, ts: float, editions: list[tuple[str, str, bytes]]
+    ) -> None:
+        self.mime = mime
+        self.ts = ts
+        self.lastmod = formatdate(int(ts)) if ts > 0 else ""
+        self.editions = editions  # [(encoding, etag, body)], smallest first
+        self.etags = set(x[1] for x in editions)
+        self.compressed = len(editions) > 1
+
+    def pick(self, accept: set[str]) -> tuple[str, str, bytes]:
+        """returns the smallest edition the client can handle"""
+        for edition in self.editions:
+            if not edition[0] or edition[0] in accept:
+                return edition
+
+        raise Exception("unreachable")
+
+
+class ResCache(object):
+    """
+    all the embedded web resources (copyparty.RES), loaded and compressed at
+    startup so they can be sent with a single sendall; gzip always, and also
+    brotli and zstd if those modules are available
+    """
+
+    def __init__(self, E: EnvParams, log: "RootLogger") -> None:
+        self.E = E
+        self.log_func = log
+        self.cache: dict[str, CachedRes] = {}
+
+    def log(self, msg: str, c: int = 0) -> None:
+        self.log_func("rescache", msg, c)
+
+    def build(self) -> None:
+        t0 = time.time()
+        cache = {}
+        nbytes = 0
+        for name in sorted(RES):
+            try:
+                res = self._load(name)
+            except:
+                self.log("failed to load %s: %s" % (name, min_ex()), 3)
+                continue
+
+            if res:
+                cache[name] = res
+                nbytes += sum(len(x[2]) for x in res.editions)
+
+        encs = ["gzip"]
+        if HAVE_BROTLI:
+            encs.append("br")
+        if HAVE_ZSTD:
+            encs.append("zstd")
+
+        t = "%d resources (%s) in %.2f sec; %d KiB"
+        zs = ", ".join(encs)
+        self.log(t % (len(cache), zs, time.time() - t0, nbytes // 1024))
+        self.cache = cache
+
+    def _load(self, name: str) -> Optional[CachedRes]:
+        ts = 0.0
+        plain = gz = b""
+        for ext in ("", ".gz"):
+            if not has_resource(self.E, name + ext):
+                continue
+
+            st = stat_resource(self.E, name + ext)
+            if st:
+                ts = max(ts, st.st_mtime)
+
+            with load_resource(self.E, name + ext) as f:
+                if ext:
+                    gz = f.read()
+                else:
+                    plain = f.read()
+
+        if gz and not plain:
+            plain = gzip.decompress(gz)
+        elif not plain:
+            return None
+
+        etag = ub64enc(hashlib.sha512(plain).digest()[:12]).decode("ascii")
+        editions = [("", '"%s"' % (etag,), plain)]
+        if name.endswith((".gif", ".png", ".mp3", ".woff", ".woff2")):
+            return CachedRes(guess_mime(name), ts, editions)
+
+        if not gz:
+            gz = gzip.compress(plain, 9)
+
+        zl = [("gzip", gz)]
+        if HAVE_BROTLI:
+            zl.append(("br", brotli.compress(plain)))
+        if HAVE_ZSTD:
+            zl.append(("zstd", zstd_compress(plain)))
+
+        for enc, buf in zl:
+            # not worth it unless it saves at least 10%
+            if len(buf) < len(plain) * 0.9:
+                editions.append((enc, '"%s-%s"' % (etag, enc), buf))
+
+        editions.sort(key=lambda x: len(x[2]))
+        return CachedRes(guess_mime(name), ts, editions)
@@ -9,7 +9,7 @@ from queue import Queue
 
 from .authsrv import AuthSrv
 from .bos import bos
-from .sutil import StreamArc, errdesc
+from .sutil import CmpStream, ParCmp, StreamArc, errdesc
 from .util import Daemon, fsenc, min_ex
 
 if True:  # pylint: disable=using-constant-test
@@ -39,6 +39,27 @@ class QFile(object):  # inherit io.StringIO for painful typing
             self.nq += len(buf)
 
 
+class ParFile(object):
+    """file-like object which compresses into a QFile with ParCmp"""
+
+    def __init__(self, qfile: QFile, fmt: str, lv: int, nthr: int) -> None:
+        self.qfile = qfile
+        self.pc = ParCmp(nthr)
+        self.cs = CmpStream(self.pc, fmt, lv)
+
+    def write(self, buf: bytes) -> None:
+        self.cs.write(buf)
+        for zb in self.pc.get():
+            self.qfile.write(zb)
+
+    def close(self) -> None:
+        self.cs.finish()
+        for zb in self.pc.get(True):
+            self.qfile.write(zb)
+
+        self.pc.close()
+
+
 class StreamTar(StreamArc):
     """construct in-memory tar file from the given path"""
 
@@ -72,21 +93,18 @@ class StreamTar(StreamArc):
         except:
             lv = -1
 
-        arg = {"name": None, "fileobj": self.qfile, "mode": "w", "format": fmt}
-        if cmp == "gz":
-            fun = tarfile.TarFile.gzopen
-            arg["compresslevel"] = lv if lv >= 0 else 3
-        elif cmp == "bz2":
-            fun = tarfile.TarFile.bz2open
-            arg["compresslevel"] = lv if lv >= 0 else 2
-        elif cmp == "xz":
-            fun = tarfile.TarFile.xzopen
-            arg["preset"] = lv if lv >= 0 else 1
-        else:
-            fun = tarfile.open
-            arg["mode"] = "w|"
+        # compression is done in parallel by ParFile, one block per thread
+        self.pfile: Optional[ParFile] = None
+        fobj: Any = self.qfile
+        if cmp in ("gz", "bz2", "xz"):
+            if lv < 0:
+                lv = {"gz": 3, "bz2": 2, "xz": 1}[cmp]
+
+            nthr = max(1, self.args.arc_mt)
+            fobj = self.pfile = ParFile(self.qfile, cmp, lv, nthr)
 
-        self.tar = fun(**arg)
+        arg = {"name": None, "fileobj": fobj, "mode": "w|", "format": fmt}
+        self.tar = tarfile.open(**arg)
 
         Daemon(self._gen, "star-gen")
 
@@ -153,4 +171,6 @@ class StreamTar(StreamArc):
             self.ser(self.errf)
 
         self.tar.close()
+        if self.pfile:
+            self.pfile.close()
         self.qfile.write(None)
@@ -3,16 +3,29 @@ from __future__ import print_function, unicode_literals
 
 import os
 import tempfile
+import time
+import zlib
+from collections import deque
 from datetime import datetime
 
 from .__init__ import CORES
 from .authsrv import VFS, AuthSrv
 from .bos import bos
 from .th_cli import ThumbCli
-from .util import UTC, vjoin, vol_san
+from .util import UTC, spack, vjoin, vol_san
+
+try:
+    import bz2
+except:
+    bz2 = None  # type: ignore
+
+try:
+    import lzma
+except:
+    lzma = None  # type: ignore
 
 if True:  # pylint: disable=using-constant-test
-    from typing import Any, Generator, Optional
+    from typing import Any, Callable, Generator, Optional, Union
 
     from .util import NamedLogger
 
@@ -38,6 +51,148 @@ class StreamArc(object):
         self.stopped = True
 
 
+def cmp_block(fmt: str, lv: int, buf: bytes, zdict: bytes, last: bool) -> bytes:
+    """compress one block of a ParCmp stream; runs in the threadpool"""
+    if fmt == "xz":
+        return lzma.compress(buf, preset=lv)  # type: ignore
+
+    if fmt == "bz2":
+        return bz2.compress(buf, lv)  # type: ignore
+
+    # raw deflate; primed with the tail of the previous block so the
+    # ratio is close to a single stream, and sync-flushed so the
+    # blocks can be glued together (only the last one is final)
+    if zdict:
+        co = zlib.compressobj(lv, zlib.DEFLATED, -15, 8, 0, zdict)
+    else:
+        co = zlib.compressobj(lv, zlib.DEFLATED, -15)
+
+    return co.compress(buf) + co.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+
+class ParCmp(object):
+    """
+    pigz-style parallel compression with ordered output; the output is a
+    queue of bytes, futures (blocks being compressed by up to nthr threads;
+    the cpu budget of one download) and thunks, which are called once
+    everything before them has been written, so they can produce headers
+    which depend on the final position or size of something. ct is called
+    with each buffer, in order, as it leaves the queue, and the length is
+    added to the .csz of the stream it belongs to (if any)
+    """
+
+    def __init__(self, nthr: int, ct: Optional[Callable[[bytes], Any]] = None) -> None:
+        self.ct = ct
+        self.tp: Any = None
+        if nthr > 1:
+            try:
+                from concurrent.futures import ThreadPoolExecutor
+
+                self.tp = ThreadPoolExecutor(max_workers=nthr)
+            except:
+                pass
+
+        self.win = nthr * 2
+        self.nfut = 0
+        self.q: deque[Any] = deque()
+
+    def put(self, item: Union[bytes, Callable[[], bytes]], owner: Any = None) -> None:
+        self.q.append((item, owner))
+
+    def submit(self, owner: Any, *args: Any) -> None:
+        if not self.tp:
+            self.q.append((cmp_block(*args), owner))
+        else:
+            self.q.append((self.tp.submit(cmp_block, *args), owner))
+            self.nfut += 1
+
+    def get(self, flush: bool = False) -> list[bytes]:
+        """
+        everything which is ready, in order; blocks until the number of
+        unfinished blocks is within the window (or zero if flush)
+        """
+        ret = []
+        q = self.q
+        while q:
+            x, owner = q[0]
+            if isinstance(x, bytes):
+                pass
+            elif callable(x):
+                x = x()
+            elif x.done() or flush or self.nfut > self.win:
+                x = x.result()
+                self.nfut -= 1
+            else:
+                break
+
+            q.popleft()
+            if owner:
+                owner.csz += len(x)
+            if self.ct:
+                self.ct(x)
+            if x:
+                ret.append(x)
+
+        return ret
+
+    def close(self) -> None:
+        if self.tp:
+            self.tp.shutdown(False)
+            self.tp = None
+
+
+class CmpStream(object):
+    """
+    one compressed stream fed through a ParCmp, split into blocks;
+    gz is a gzip member, raw is a deflate stream for a zip entry,
+    xz and bz2 are concatenated streams (one per block)
+    """
+
+    def __init__(self, pc: ParCmp, fmt: str, lv: int) -> None:
+        self.pc = pc
+        self.fmt = fmt
+        self.lv = lv
+        self.bsz = 8 * 1024 * 1024 if fmt == "xz" else 1024 * 1024
+        self.bufs: list[bytes] = []
+        self.nbuf = 0
+        self.zdict = b""
+        self.crc = 0
+        self.isize = 0
+        self.csz = 0  # compressed size; final once it has all left the ParCmp
+
+        if fmt == "gz":
+            # no filename, mtime now, unknown os
+            zb = b"\x1f\x8b\x08\x00" + spack(b"<L", int(time.time())) + b"\x00\xff"
+            pc.put(zb, self)
+
+    def write(self, buf: bytes) -> None:
+        self.bufs.append(buf)
+        self.nbuf += len(buf)
+        if self.nbuf >= self.bsz:
+            self._submit(False)
+
+    def _submit(self, last: bool) -> None:
+        buf = b"".join(self.bufs)
+        self.bufs = []
+        self.nbuf = 0
+        if not buf and self.fmt in ("xz", "bz2"):
+            return
+
+        if self.fmt in ("gz", "raw"):
+            self.crc = zlib.crc32(buf, self.crc)
+            self.isize += len(buf)
+
+        self.pc.submit(self, self.fmt, self.lv, buf, self.zdict, last)
+        if self.fmt in ("gz", "raw"):
+            self.zdict = (self.zdict + buf)[-32768:] if len(buf) < 32768 else buf[-32768:]
+
+    def finish(self) -> None:
+        self._submit(True)
+        self.crc &= 0xFFFFFFFF
+        if self.fmt == "gz":
+            self.pc.put(spack(b"<LL", self.crc, self.isize & 0xFFFFFFFF), self)
+
+
 def gfilter(
     fgen: Generator[dict[str, Any], None, None],
     thumbcli: ThumbCli,
@@ -48,10 +203,15 @@ def gfilter(
     from concurrent.futures import ThreadPoolExecutor
 
     pend = []
+    gone: list[bool] = []
+
+    def alive() -> bool:
+        return not gone
+
     with ThreadPoolExecutor(max_workers=CORES) as tp:
         try:
             for f in fgen:
-                task = tp.submit(enthumb, thumbcli, uname, vtop, f, fmt)
+                task = tp.submit(enthumb, thumbcli, uname, vtop, f, fmt, alive)
                 pend.append((task, f))
                 if pend[0][0].done() or len(pend) > CORES * 4:
                     task, f = pend.pop(0)
@@ -67,6 +227,10 @@ def gfilter(
                 except:
                     pass
                 yield f
+        except GeneratorExit:
+            # client disconnected; cancel the conversions still queued
+            gone.append(True)
+            raise
         except Exception as ex:
             thumbcli.log("gfilter flushing ({})".format(ex))
             for task, f in pend:
@@ -78,7 +242,12 @@ def gfilter(
 
 
 def enthumb(
-    thumbcli: ThumbCli, uname: str, vtop: str, f: dict[str, Any], fmt: str
+    thumbcli: ThumbCli,
+    uname: str,
+    vtop: str,
+    f: dict[str, Any],
+    fmt: str,
+    alive: Optional[Callable[[], bool]] = None,
 ) -> dict[str, Any]:
     rem = f["vp"]
     ext = rem.rsplit(".", 1)[-1].lower()
@@ -90,7 +259,7 @@ def enthumb(
     vp = vjoin(vtop, rem.split("/", 1)[1])
     vn, rem = thumbcli.asrv.vfs.get(vp, uname, True, False)
     dbv, vrem = vn.get_dbv(rem)
-    thp = thumbcli.get(dbv, vrem, f["st"].st_mtime, fmt)
+    thp = thumbcli.get(dbv, vrem, f["st"].st_mtime, fmt, "b", uname, alive)
     if not thp:
         raise Exception()
 
@@ -31,6 +31,7 @@ from .authsrv import BAD_CFG, AuthSrv
 from .cert import ensure_cert
 from .mtag import HAVE_FFMPEG, HAVE_FFPROBE, HAVE_MUTAGEN
 from .pwhash import HAVE_ARGON2
+from .rescache import HAVE_BROTLI, HAVE_ZSTD
 from .tcpsrv import TcpSrv
 from .th_srv import (
     HAVE_AVIF,
@@ -68,6 +69,7 @@ from .util import (
     start_log_thrs,
     start_stackmon,
     ub64enc,
+    unhumanize,
 )
 
 if TYPE_CHECKING:
@@ -340,6 +342,9 @@ class SvcHub(object):
             args.au_unpk = {}
 
         args.th_poke = min(args.th_poke, args.th_maxage, args.ac_maxage)
+        args.th_maxsz = unhumanize(args.th_maxsz)
+        if not 0 <= args.th_webp_m <= 6:
+            raise Exception("--th-webp-m must be between 0 and 6")
 
         zms = ""
         if not args.https_only:
@@ -638,6 +643,8 @@ class SvcHub(object):
             (HAVE_FFMPEG, "ffmpeg", t_ff + ", good-but-slow image thumbnails"),
             (HAVE_FFPROBE, "ffprobe", t_ff + ", read audio/media tags"),
             (HAVE_MUTAGEN, "mutagen", "read audio tags (ffprobe is better but slower)"),
+            (HAVE_BROTLI, "brotli", "smaller web-ui downloads (brotli-compressed)"),
+            (HAVE_ZSTD, "zstandard", "smaller web-ui downloads (zstd-compressed)"),
             (HAVE_ARGON2, "argon2", "secure password hashing (advanced users only)"),
             (HAVE_HEIF, "pillow-heif", "read .heif images with pillow (rarely useful)"),
             (HAVE_AVIF, "pillow-avif", "read .avif images with pillow (rarely useful)"),
@@ -1,22 +1,30 @@
 # coding: utf-8
 from __future__ import print_function, unicode_literals
 
+import bisect
 import calendar
+import hashlib
+import re
 import stat
 import time
 import zlib
 
 from .authsrv import AuthSrv
 from .bos import bos
-from .sutil import StreamArc, errdesc
-from .util import min_ex, sanitize_fn, spack, sunpack, yieldfile
+from .sutil import CmpStream, ParCmp, StreamArc, errdesc
+from .util import fsenc, min_ex, sanitize_fn, spack, sunpack, ub64enc, yieldfile
 
 if True:  # pylint: disable=using-constant-test
-    from typing import Any, Generator, Optional
+    from typing import Any, Generator, Optional, Union
 
     from .util import NamedLogger
 
 
+# deflated entries get zip64 headers from this size and up, since the
+# compressed size is not known in advance (and deflate can grow the data)
+DFL_Z64 = 0xFFFFFFFF - 0x1000000
+
+
 def dostime2unix(buf: bytes) -> int:
     t, d = sunpack(b"<HH", buf)
 
@@ -46,10 +54,10 @@ def unixtime2dos(ts: int) -> bytes:
         return b"\x00\x00\x21\x00"
 
 
-def gen_fdesc(sz: int, crc32: int, z64: bool) -> bytes:
+def gen_fdesc(sz: int, crc32: int, z64: bool, csz: int = -1) -> bytes:
     ret = b"\x50\x4b\x07\x08"
     fmt = b"<LQQ" if z64 else b"<LLL"
-    ret += spack(fmt, crc32, sz, sz)
+    ret += spack(fmt, crc32, sz if csz < 0 else csz, sz)
     return ret
 
 
@@ -61,24 +69,37 @@ def gen_hdr(
     utf8: bool,
     icrc32: int,
     pre_crc: bool,
+    csz: int = -1,
 ) -> bytes:
     """
     does regular file headers
     and the central directory meme if h_pos is set
-    (h_pos = absolute position of the regular header)
+    (h_pos = absolute position of the regular header);
+    csz is the deflated size, or -1 if stored (not compressed),
+    or -2 if deflated and not known yet (a streaming local header)
     """
 
     # appnote 4.5 / zip 3.0 (2008) / unzip 6.0 (2009) says to add z64
     # extinfo for values which exceed H, but that becomes an off-by-one
     # (can't tell if it was clamped or exactly maxval), make it obvious
-    z64 = sz >= 0xFFFFFFFF
-    z64v = [sz, sz] if z64 else []
+    dfl = csz != -1
+    if csz == -1:
+        z64 = sz >= 0xFFFFFFFF
+        csz = sz
+    elif csz == -2:
+        # deflate can grow the data slightly; leave some room
+        z64 = sz >= DFL_Z64
+        csz = sz = 0
+    else:
+        z64 = sz >= 0xFFFFFFFF or csz >= 0xFFFFFFFF
+
+    z64v = [sz, csz] if z64 else []
     if h_pos and h_pos >= 0xFFFFFFFF:
         # central, also consider ptr to original header
         z64v.append(h_pos)
 
     # confusingly this doesn't bump if h_pos
-    req_ver = b"\x2d\x00" if z64 else b"\x0a\x00"
+    req_ver = b"\x2d\x00" if z64 else b"\x14\x00" if dfl else b"\x0a\x00"
 
     if icrc32:
         crc32 = spack(b"<L", icrc32)
@@ -96,13 +117,15 @@ def gen_hdr(
     ret += b"\x08" if utf8 else b"\x00"  # appnote 6.3.2 (2007)
 
     # 2b compression, 4b time, 4b crc
-    ret += b"\x00\x00" + unixtime2dos(lastmod) + crc32
+    ret += b"\x08\x00" if dfl else b"\x00\x00"
+    ret += unixtime2dos(lastmod) + crc32
 
     # spec says to put zeros when !crc if bit3 (streaming)
     # however infozip does actual sz and it even works on winxp
     # (same reasoning for z64 extradata later)
     vsz = 0xFFFFFFFF if z64 else sz
-    ret += spack(b"<LL", vsz, vsz)
+    vcsz = 0xFFFFFFFF if z64 else csz
+    ret += spack(b"<LL", vcsz, vsz)
 
     # windows support (the "?" replace below too)
     fn = sanitize_fn(fn, "/")
@@ -143,7 +166,7 @@ def gen_hdr(
 
 
 def gen_ecdr(
-    items: list[tuple[str, int, int, int, int]], cdir_pos: int, cdir_end: int
+    items: list[tuple[str, int, int, int, int, int]], cdir_pos: int, cdir_end: int
 ) -> tuple[bytes, bool]:
     """
     summary of all file headers,
@@ -173,7 +196,7 @@ def gen_ecdr(
 
 
 def gen_ecdr64(
-    items: list[tuple[str, int, int, int, int]], cdir_pos: int, cdir_end: int
+    items: list[tuple[str, int, int, int, int, int]], cdir_pos: int, cdir_end: int
 ) -> bytes:
     """
     z64 end of central directory
@@ -229,7 +252,18 @@ class StreamZip(StreamArc):
         self.pre_crc = pre_crc
 
         self.pos = 0
-        self.items: list[tuple[str, int, int, int, int]] = []
+        self.items: list[tuple[str, int, int, int, int, int]] = []
+
+        # caller can sendmsg lists of buffers and sendfile (ap, lower, upper)
+        self.vec = bool(kwargs.get("vec"))
+
+        # deflate (?zip=dfl or dfl:9); parallel, with ParCmp
+        self.dfl = -1
+        self.pc: Optional[ParCmp] = None
+        m = re.search(r"dfl[:,]?([0-9]?)", kwargs.get("cmp") or "")
+        if m and not pre_crc:
+            self.dfl = int(m.group(1) or 3)
+            self.pc = ParCmp(max(1, self.args.arc_mt), self._ct)
 
     def _ct(self, buf: bytes) -> bytes:
         self.pos += len(buf)
@@ -246,26 +280,46 @@ class StreamZip(StreamArc):
         sz = st.st_size
         ts = st.st_mtime
 
+        if self.pc:
+            for x in self.ser_dfl(name, src, sz, ts, self.pc):
+                yield x
+            return
+
+        bufs = None
         crc = 0
-        if self.pre_crc:
+        if sz < 65536:
+            # small file; read it once, crc and all
+            with open(fsenc(src), "rb", 0) as f:
+                bufs = [f.read()]
+            crc = zlib.crc32(bufs[0]) & 0xFFFFFFFF
+        elif self.pre_crc:
             for buf in yieldfile(src, self.args.iobuf):
                 crc = zlib.crc32(buf, crc)
 
             crc &= 0xFFFFFFFF
 
         h_pos = self.pos
-        buf = gen_hdr(None, name, sz, ts, self.utf8, crc, self.pre_crc)
+        hcrc = crc if self.pre_crc else 0
+        buf = gen_hdr(None, name, sz, ts, self.utf8, hcrc, self.pre_crc)
         yield self._ct(buf)
 
-        for buf in yieldfile(src, self.args.iobuf):
-            if not self.pre_crc:
-                crc = zlib.crc32(buf, crc)
+        if bufs is not None:
+            if bufs[0]:
+                yield self._ct(bufs[0])
+        elif self.pre_crc and self.vec:
+            # crc is known, so the caller can sendfile the data
+            self.pos += sz
+            yield (src, 0, sz)
+        else:
+            for buf in yieldfile(src, self.args.iobuf):
+                if not self.pre_crc:
+                    crc = zlib.crc32(buf, crc)
 
-            yield self._ct(buf)
+                yield self._ct(buf)
 
-        crc &= 0xFFFFFFFF
+            crc &= 0xFFFFFFFF
 
-        self.items.append((name, sz, ts, crc, h_pos))
+        self.items.append((name, sz, ts, crc, h_pos, -1))
 
         z64 = sz >= 4 * 1024 * 1024 * 1024
 
@@ -273,10 +327,70 @@ class StreamZip(StreamArc):
             buf = gen_fdesc(sz, crc, z64)
             yield self._ct(buf)
 
-    def gen(self) -> Generator[bytes, None, None]:
+    def ser_dfl(
+        self, name: str, src: str, sz: int, ts: float, pc: ParCmp
+    ) -> Generator[bytes, None, None]:
+        """
+        deflated entry; the blocks are compressed in parallel, so the
+        header and descriptor are thunks which run when it is their turn
+        """
+        cs = CmpStream(pc, "raw", self.dfl)
+        h_pos = [0]
+
+        def hdr() -> bytes:
+            h_pos[0] = self.pos
+            return gen_hdr(None, name, sz, ts, self.utf8, 0, False, -2)
+
+        def desc() -> bytes:
+            self.items.append((name, sz, ts, cs.crc, h_pos[0], cs.csz))
+            return gen_fdesc(sz, cs.crc, sz >= DFL_Z64, cs.csz)
+
+        pc.put(hdr)
+        for buf in yieldfile(src, self.args.iobuf):
+            cs.write(buf)
+            for zb in pc.get():
+                yield zb
+
+        cs.finish()
+        pc.put(desc)
+        for zb in pc.get():
+            yield zb
+
+    def gen(self) -> Generator[Any, None, None]:
+        """
+        yields bytes, or if vec: lists of bytes to sendmsg,
+        and (abspath, lower, upper) to sendfile
+        """
+        vec = self.vec
+        maxsz = 65536 if vec else 16384
+        mbuf: list[bytes] = []
+        mlen = 0
+        zg = self._gen()
+        try:
+            for x in zg:
+                if isinstance(x, tuple):
+                    if mbuf:
+                        yield mbuf if vec else b"".join(mbuf)
+                        mbuf = []
+                        mlen = 0
+                    yield x
+                    continue
+
+                mbuf.append(x)
+                mlen += len(x)
+                if mlen >= maxsz or len(mbuf) >= 1000:
+                    yield mbuf if vec else b"".join(mbuf)
+                    mbuf = []
+                    mlen = 0
+
+            if mbuf:
+                yield mbuf if vec else b"".join(mbuf)
+        finally:
+            zg.close()
+
+    def _gen(self) -> Generator[Any, None, None]:
         errf: dict[str, Any] = {}
         errors = []
-        mbuf = b""
         try:
             for f in self.fgen:
                 if "err" in f:
@@ -285,19 +399,16 @@ class StreamZip(StreamArc):
 
                 try:
                     for x in self.ser(f):
-                        mbuf += x
-                        if len(mbuf) >= 16384:
-                            yield mbuf
-                            mbuf = b""
+                        yield x
                 except GeneratorExit:
                     raise
                 except:
                     ex = min_ex(5, True).replace("\n", "\n-- ")
                     errors.append((f["vp"], ex))
 
-            if mbuf:
-                yield mbuf
-                mbuf = b""
+            if self.pc:
+                for x in self.pc.get(True):
+                    yield x
 
             if errors:
                 errf, txt = errdesc(self.asrv.vfs, errors)
@@ -305,26 +416,170 @@ class StreamZip(StreamArc):
                 for x in self.ser(errf):
                     yield x
 
+                if self.pc:
+                    for x in self.pc.get(True):
+                        yield x
+
             cdir_pos = self.pos
-            for name, sz, ts, crc, h_pos in self.items:
-                buf = gen_hdr(h_pos, name, sz, ts, self.utf8, crc, self.pre_crc)
-                mbuf += self._ct(buf)
-                if len(mbuf) >= 16384:
-                    yield mbuf
-                    mbuf = b""
+            for name, sz, ts, crc, h_pos, csz in self.items:
+                buf = gen_hdr(h_pos, name, sz, ts, self.utf8, crc, self.pre_crc, csz)
+                yield self._ct(buf)
             cdir_end = self.pos
 
             _, need_64 = gen_ecdr(self.items, cdir_pos, cdir_end)
             if need_64:
                 ecdir64_pos = self.pos
                 buf = gen_ecdr64(self.items, cdir_pos, cdir_end)
-                mbuf += self._ct(buf)
+                yield self._ct(buf)
 
                 buf = gen_ecdr64_loc(ecdir64_pos)
-                mbuf += self._ct(buf)
+                yield self._ct(buf)
 
             ecdr, _ = gen_ecdr(self.items, cdir_pos, cdir_end)
-            yield mbuf + self._ct(ecdr)
+            yield self._ct(ecdr)
         finally:
+            if self.pc:
+                self.pc.close()
             if errf:
                 bos.unlink(errf["ap"])
+
+
+class StoreZip(object):
+    """
+    uncompressed zip with the whole layout decided up front (from stat
+    and known crc32s) so it has a size and any byterange can be produced;
+    the output is identical to StreamZip(pre_crc=True) with the same files
+
+    files: [name, abspath, size, lastmod, crc32 (or None if unknown)]
+    """
+
+    def __init__(
+        self, log: "NamedLogger", iobuf: int, files: list[list[Any]], utf8: bool
+    ) -> None:
+        self.log = log
+        self.iobuf = iobuf
+        self.files = files
+        self.utf8 = utf8
+        self.new_crcs: list[int] = []  # indexes into files
+
+        # absolute positions of each local header, data, and descriptor
+        self.hpos: list[int] = []
+        self.dpos: list[int] = []
+        pos = 0
+        for name, _, sz, ts, _ in files:
+            self.hpos.append(pos)
+            pos += len(gen_hdr(None, name, sz, ts, utf8, 0, True))
+            self.dpos.append(pos)
+            pos += sz
+            if sz >= 4 * 1024 * 1024 * 1024:
+                pos += len(gen_fdesc(sz, 0, True))
+
+        self.cdir_pos = pos
+        self.size = pos + len(self._tail(False))
+
+        zsl = ["%d/%d/%d/%s" % (utf8, x[2], x[3], x[0]) for x in files]
+        zb = "\n".join(zsl).encode("utf-8", "replace")
+        self.etag = ub64enc(hashlib.sha512(zb).digest()[:12]).decode("ascii")
+        self.lastmod = max([x[3] for x in files] or [0])
+
+    def crc(self, n: int) -> int:
+        f = self.files[n]
+        if f[4] is None:
+            crc = 0
+            for buf in yieldfile(f[1], self.iobuf):
+                crc = zlib.crc32(buf, crc)
+
+            f[4] = crc & 0xFFFFFFFF
+            self.new_crcs.append(n)
+
+        return f[4]
+
+    def _tail(self, real: bool) -> bytes:
+        """central directory and the end-records; crc32 is 0 unless real"""
+        items = []
+        ret = []
+        pos = self.cdir_pos
+        for n, (name, _, sz, ts, _) in enumerate(self.files):
+            crc = self.crc(n) if real else 0
+            items.append((name, sz, ts, crc, self.hpos[n], -1))
+            buf = gen_hdr(self.hpos[n], name, sz, ts, self.utf8, crc, True)
+            ret.append(buf)
+            pos += len(buf)
+
+        cdir_end = pos
+        _, need_64 = gen_ecdr(items, self.cdir_pos, cdir_end)
+        if need_64:
+            ret.append(gen_ecdr64(items, self.cdir_pos, cdir_end))
+            ret.append(gen_ecdr64_loc(cdir_end))
+
+        ret.append(gen_ecdr(items, self.cdir_pos, cdir_end)[0])
+        return b"".join(ret)
+
+    def gen(
+        self, lower: int, upper: int
+    ) -> Generator[Union[list[bytes], tuple[str, int, int]], None, None]:
+        """
+        yields the bytes from lower to upper as lists of buffers (to
+        sendmsg); file contents larger than 64 KiB are yielded as
+        (abspath, ofs, end) to sendfile
+        """
+        mbuf: list[bytes] = []
+        mlen = 0
+        n = max(0, bisect.bisect_right(self.hpos, lower) - 1)
+        while n < len(self.files) and self.hpos[n] < upper:
+            name, ap, sz, ts, _ = self.files[n]
+            h0 = self.hpos[n]
+            d0 = self.dpos[n]
+            d1 = d0 + sz
+            data = None
+            if sz and sz < 65536 and lower < d1:
+                # small file; one read for both the crc and the data
+                with open(fsenc(ap), "rb", 0) as f:
+                    data = f.read(sz)
+                if len(data) != sz:
+                    raise Exception("file shrunk: %s" % (ap,))
+                if self.files[n][4] is None:
+                    self.files[n][4] = zlib.crc32(data) & 0xFFFFFFFF
+                    self.new_crcs.append(n)
+
+            if lower < d0:
+                buf = gen_hdr(None, name, sz, ts, self.utf8, self.crc(n), True)
+                mbuf.append(buf[max(0, lower - h0) : upper - h0])
+
+            a = max(lower, d0) - d0
+            b = min(upper, d1) - d0
+            if a < b and data is not None:
+                mbuf.append(data[a:b])
+                mlen += b - a
+            elif a < b and b - a < 65536:
+                with open(fsenc(ap), "rb", 0) as f:
+                    f.seek(a)
+                    buf = f.read(b - a)
+                if len(buf) != b - a:
+                    raise Exception("file shrunk: %s" % (ap,))
+                mbuf.append(buf)
+                mlen += len(buf)
+            elif a < b:
+                if mbuf:
+                    yield mbuf
+                    mbuf = []
+                    mlen = 0
+                yield ap, a, b
+
+            if sz >= 4 * 1024 * 1024 * 1024 and upper > d1:
+                buf = gen_fdesc(sz, self.crc(n), True)
+                mbuf.append(buf[max(0, lower - d1) : upper - d1])
+
+            if mlen >= 65536 or len(mbuf) >= 1000:
+                yield mbuf
+                mbuf = []
+                mlen = 0
+
+            n += 1
+
+        if upper > self.cdir_pos:
+            buf = self._tail(True)
+            mbuf.append(buf[max(0, lower - self.cdir_pos) : upper - self.cdir_pos])
+
+        if mbuf:
+            yield mbuf
@@ -6,11 +6,11 @@ import os
 from .__init__ import TYPE_CHECKING
 from .authsrv import VFS
 from .bos import bos
-from .th_srv import HAVE_WEBP, thumb_path
+from .th_srv import HAVE_WEBP, th_fmt, thumb_path
 from .util import Cooldown
 
 if True:  # pylint: disable=using-constant-test
-    from typing import Optional, Union
+    from typing import Callable, Optional, Union
 
 if TYPE_CHECKING:
     from .httpsrv import HttpSrv
@@ -47,7 +47,21 @@ class ThumbCli(object):
     def log(self, msg: str, c: Union[int, str] = 0) -> None:
         self.log_func("thumbcli", msg, c)
 
-    def get(self, dbv: VFS, rem: str, mtime: float, fmt: str) -> Optional[str]:
+    def get(
+        self,
+        dbv: VFS,
+        rem: str,
+        mtime: float,
+        fmt: str,
+        prio: str = "i",
+        uname: str = "",
+        alive: Optional[Callable[[], bool]] = None,
+    ) -> Optional[str]:
+        """
+        prio: i=interactive, p=prefetch, b=bulk (see th_srv.TH_PRIOS);
+        alive: checked while waiting, cancels the conversion if it
+        returns False and nobody else is waiting for it
+        """
         ptop = dbv.realpath
         ext = rem.rsplit(".")[-1].lower()
         if ext not in self.thumbable or "dthumb" in dbv.flags:
@@ -74,39 +88,11 @@ class ThumbCli(object):
         if is_img and "dithumb" in dbv.flags:
             return None
 
-        preferred = self.args.th_dec[0] if self.args.th_dec else ""
-
         if rem.startswith(".hist/th/") and rem.split(".")[-1] in ["webp", "jpg", "png"]:
             return os.path.join(ptop, rem)
 
         if fmt[:1] in "jw":
-            sfmt = fmt[:1]
-
-            if sfmt == "j" and self.args.th_no_jpg:
-                sfmt = "w"
-
-            if sfmt == "w":
-                if (
-                    self.args.th_no_webp
-                    or (is_img and not self.can_webp)
-                    or (self.args.th_ff_jpg and (not is_img or preferred == "ff"))
-                ):
-                    sfmt = "j"
-
-            vf_crop = dbv.flags["crop"]
-            vf_th3x = dbv.flags["th3x"]
-
-            if "f" in vf_crop:
-                sfmt += "f" if "n" in vf_crop else ""
-            else:
-                sfmt += "f" if "f" in fmt else ""
-
-            if "f" in vf_th3x:
-                sfmt += "3" if "y" in vf_th3x else ""
-            else:
-                sfmt += "3" if "3" in fmt else ""
-
-            fmt = sfmt
+            fmt = th_fmt(self.args, dbv.flags, fmt, is_img, self.can_webp)
 
         elif fmt[:1] == "p" and not is_au and not is_vid:
             t = "cannot thumbnail [%s]: png only allowed for waveforms"
@@ -156,5 +142,14 @@ class ThumbCli(object):
         if not bos.path.getsize(os.path.join(ptop, rem)):
             return None
 
-        x = self.broker.ask("thumbsrv.get", ptop, rem, mtime, fmt)
-        return x.get()  # type: ignore
+        tmax = 1 if alive else 0
+        zt = (ptop, rem, mtime, fmt, prio, uname, tmax)
+        ret = self.broker.ask("thumbsrv.get", *(zt + (False,))).get()
+        while ret == "":
+            if not alive():  # type: ignore
+                self.broker.say("thumbsrv.cancel", ptop, rem, mtime, fmt)
+                return None
+
+            ret = self.broker.ask("thumbsrv.get", *(zt + (True,))).get()
+
+        return ret  # type: ignore
@@ -1,15 +1,16 @@
 # coding: utf-8
 from __future__ import print_function, unicode_literals
 
+import argparse
 import hashlib
 import logging
 import os
 import shutil
+import stat
 import subprocess as sp
 import threading
 import time
-
-from queue import Queue
+from collections import deque
 
 from .__init__ import ANYWIN, PY2, TYPE_CHECKING
 from .authsrv import VFS
@@ -18,13 +19,17 @@ from .mtag import HAVE_FFMPEG, HAVE_FFPROBE, au_unpk, ffprobe
 from .util import BytesIO  # type: ignore
 from .util import (
     FFMPEG_URL,
+    HAVE_SQLITE3,
     Cooldown,
     Daemon,
+    ODict,
     afsenc,
     fsenc,
+    humansize,
     min_ex,
     runcmd,
     statdir,
+    sunpack,
     ub64enc,
     vsplit,
     wrename,
@@ -32,11 +37,16 @@ from .util import (
 )
 
 if True:  # pylint: disable=using-constant-test
-    from typing import Optional, Union
+    from typing import Any, Optional, Union
+
+    from .util import RootLogger
 
 if TYPE_CHECKING:
     from .svchub import SvcHub
 
+if HAVE_SQLITE3:
+    import sqlite3
+
 if PY2:
     range = xrange  # type: ignore
 
@@ -110,6 +120,12 @@ except:
 
 th_dir_cache = {}
 
+# scheduling classes, most important first;
+# interactive (?th=), prefetch (thpre), bulk (archive transcodes)
+TH_PRIOS = ("i", "p", "b")
+TH_LAT_BKTS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+TH_DEP_BKTS = (0, 1, 4, 16, 64, 256, 1024)
+
 
 def thumb_path(histpath: str, rem: str, mtime: float, fmt: str, ffa: set[str]) -> str:
     # base16 = 16 = 256
@@ -149,6 +165,282 @@ def thumb_path(histpath: str, rem: str, mtime: float, fmt: str, ffa: set[str]) -
     return "%s/%s/%s/%s.%x.%s" % (histpath, cat, rd, fn, int(mtime), fmt)
 
 
+def th_fmt(
+    args: argparse.Namespace,
+    flags: dict[str, Any],
+    fmt: str,
+    is_img: bool,
+    can_webp: bool,
+) -> str:
+    """the thumbnail format to actually produce for a j/w request"""
+    preferred = args.th_dec[0] if args.th_dec else ""
+    sfmt = fmt[:1]
+
+    if sfmt == "j" and args.th_no_jpg:
+        sfmt = "w"
+
+    if sfmt == "w":
+        if (
+            args.th_no_webp
+            or (is_img and not can_webp)
+            or (args.th_ff_jpg and (not is_img or preferred == "ff"))
+        ):
+            sfmt = "j"
+
+    vf_crop = flags["crop"]
+    vf_th3x = flags["th3x"]
+
+    if "f" in vf_crop:
+        sfmt += "f" if "n" in vf_crop else ""
+    else:
+        sfmt += "f" if "f" in fmt else ""
+
+    if "f" in vf_th3x:
+        sfmt += "3" if "y" in vf_th3x else ""
+    else:
+        sfmt += "3" if "3" in fmt else ""
+
+    return sfmt
+
+
+def exif_thumb(buf: bytes) -> Optional[bytes]:
+    """the jpeg thumbnail in IFD1 of an exif blob (jpeg APP1), if any"""
+    if buf[:6] == b"Exif\x00\x00":
+        buf = buf[6:]
+
+    bo = buf[:2]
+    if bo == b"II":
+        e = "<"
+    elif bo == b"MM":
+        e = ">"
+    else:
+        return None
+
+    fH = (e + "H").encode("ascii")
+    fI = (e + "I").encode("ascii")
+    fHH = (e + "HH").encode("ascii")
+    try:
+        # skip past IFD0 to find IFD1
+        ofs = sunpack(fI, buf[4:8])[0]
+        n = sunpack(fH, buf[ofs : ofs + 2])[0]
+        ofs += 2 + n * 12
+        ofs = sunpack(fI, buf[ofs : ofs + 4])[0]
+        if not ofs:
+            return None
+
+        pos = sz = 0
+        n = sunpack(fH, buf[ofs : ofs + 2])[0]
+        for p in range(ofs + 2, ofs + 2 + n * 12, 12):
+            tag, typ = sunpack(fHH, buf[p : p + 4])
+            if typ == 3:
+                val = sunpack(fH, buf[p + 8 : p + 10])[0]
+            else:
+                val = sunpack(fI, buf[p + 8 : p + 12])[0]
+
+            if tag == 0x201:
+                pos = val
+            elif tag == 0x202:
+                sz = val
+    except:
+        return None
+
+    if not pos or not sz or pos + sz > len(buf):
+        return None
+
+    return buf[pos : pos + sz]
+
+
+class ThJob(object):
+    def __init__(
+        self, abspath: str, tpath: str, fmt: str, vn: VFS, prio: str, uname: str
+    ) -> None:
+        self.abspath = abspath
+        self.tpath = tpath
+        self.fmt = fmt
+        self.vn = vn
+        self.prio = prio
+        self.uname = uname
+        self.nref = 0  # clients waiting for it
+        self.t0 = time.time()
+        self.running = False
+        self.cond: Optional[threading.Condition] = None
+
+
+class ThQueue(object):
+    """
+    pending conversions; strict priority between classes,
+    round-robin between users within each class.
+    mutex(main) me
+    """
+
+    def __init__(self) -> None:
+        # prio -> uname -> jobs
+        self.q: dict[str, dict[str, deque[ThJob]]] = {k: ODict() for k in TH_PRIOS}
+        self.n = {k: 0 for k in TH_PRIOS}
+
+    def put(self, job: ThJob) -> None:
+        uq = self.q[job.prio]
+        try:
+            uq[job.uname].append(job)
+        except:
+            uq[job.uname] = deque([job])
+        self.n[job.prio] += 1
+
+    def pop(self, prios: tuple[str, ...]) -> Optional[ThJob]:
+        for prio in prios:
+            uq = self.q[prio]
+            if not uq:
+                continue
+
+            uname = next(iter(uq))
+            jobs = uq.pop(uname)
+            job = jobs.popleft()
+            if jobs:
+                uq[uname] = jobs  # to the back of the line
+            self.n[prio] -= 1
+            return job
+
+        return None
+
+    def drop(self, job: ThJob) -> None:
+        uq = self.q[job.prio]
+        jobs = uq[job.uname]
+        jobs.remove(job)
+        if not jobs:
+            del uq[job.uname]
+        self.n[job.prio] -= 1
+
+
+class ThIdx(object):
+    """
+    index of the thumbnails (th) and transcodes (ac) in a histpath,
+    so the cleaner can find the expired and least-recently-used
+    files without walking the whole cache; th.db next to up2k.db.
+    rows are (cat, dir, filename, size, last-access)
+    """
+
+    def __init__(self, log: "RootLogger", histpath: str) -> None:
+        self.log_func = log
+        self.histpath = histpath
+        self.mutex = threading.Lock()
+        self.new = False  # no index yet; cleaner will import the existing files
+        self.nbytes = 0
+
+        bos.makedirs(histpath)
+        db_path = os.path.join(histpath, "th.db")
+        for n in range(2):
+            try:
+                db = sqlite3.connect(db_path, timeout=2, check_same_thread=False)
+                cur = db.cursor()
+                try:
+                    cur.execute("select count(*) from th").fetchone()
+                except:
+                    self._create(cur)
+                    self.new = True
+                break
+            except Exception as ex:
+                if n:
+                    raise
+                t = "thumbnail index corrupt; deleting and recreating: %r"
+                self.log(t % (ex,), 3)
+                try:
+                    cur.close()  # type: ignore
+                except:
+                    pass
+                wunlink(self.log, db_path, {})
+
+        try:
+            cur.execute("pragma journal_mode=wal")
+            cur.execute("pragma synchronous=normal")
+        except:
+            pass
+
+        self.cur = cur
+        self.nbytes = cur.execute("select sum(sz) from th").fetchone()[0] or 0
+
+    def log(self, msg: str, c: Union[int, str] = 0) -> None:
+        self.log_func("thumb", msg, c)
+
+    def _create(self, cur: "sqlite3.Cursor") -> None:
+        for cmd in [
+            r"create table th (c text, d text, f text, sz int, at int)",
+            r"create unique index th_cdf on th(c, d, f)",
+            r"create index th_cat on th(c, at)",
+            r"create index th_at on th(at)",
+        ]:
+            cur.execute(cmd)
+        cur.connection.commit()
+
+    def add(
+        self, c: str, d: str, f: str, sz: int, at: int
+    ) -> list[tuple[str, str, str, int]]:
+        """returns the older versions of f (source file was modified), which
+        have been forgotten and should be deleted"""
+        with self.mutex:
+            q = "select c, d, f, sz from th where c=? and d=? and substr(f,1,25)=?"
+            ret = self.cur.execute(q, (c, d, f[:25])).fetchall()
+            for zt in ret:
+                self.cur.execute("delete from th where c=? and d=? and f=?", zt[:3])
+                self.nbytes -= zt[3]
+
+            ret = [x for x in ret if x[2] != f]
+            q = "insert into th values (?,?,?,?,?)"
+            self.cur.execute(q, (c, d, f, sz, at))
+            self.nbytes += sz
+            self.cur.connection.commit()
+            return ret
+
+    def add_many(self, rows: list[tuple[str, str, str, int, int]]) -> None:
+        with self.mutex:
+            q = "insert or replace into th values (?,?,?,?,?)"
+            self.cur.executemany(q, rows)
+            self.cur.connection.commit()
+            self.nbytes = self.cur.execute("select sum(sz) from th").fetchone()[0] or 0
+
+    def poke(self, c: str, d: str, f: str, at: int) -> None:
+        """f is blank to poke all files in d"""
+        with self.mutex:
+            if f:
+                q = "update th set at=? where c=? and d=? and f=?"
+                self.cur.execute(q, (at, c, d, f))
+            else:
+                q = "update th set at=? where c=? and d=?"
+                self.cur.execute(q, (at, c, d))
+            self.cur.connection.commit()
+
+    def expired(self, c: str, cutoff: int, n: int) -> list[tuple[str, str, str, int]]:
+        with self.mutex:
+            q = "select c, d, f, sz from th where c=? and at<? order by at limit ?"
+            return self.cur.execute(q, (c, cutoff, n)).fetchall()
+
+    def lru(self, n: int) -> list[tuple[str, str, str, int]]:
+        with self.mutex:
+            q = "select c, d, f, sz from th order by at limit ?"
+            return self.cur.execute(q, (n,)).fetchall()
+
+    def nulls(self) -> list[tuple[str, str, str, int]]:
+        with self.mutex:
+            q = "select c, d, f, sz from th where sz=0"
+            return self.cur.execute(q).fetchall()
+
+    def rm(self, rows: list[tuple[str, str, str, int]]) -> None:
+        with self.mutex:
+            q = "delete from th where c=? and d=? and f=?"
+            for zt in rows:
+                self.cur.execute(q, zt[:3])
+                self.nbytes -= zt[3]
+            self.cur.connection.commit()
+
+    def ndir(self, c: str, d: str) -> int:
+        with self.mutex:
+            q = "select count(*) from th where c=? and d=?"
+            return self.cur.execute(q, (c, d)).fetchone()[0]
+
+    def close(self) -> None:
+        with self.mutex:
+            self.cur.connection.close()
+
+
 class ThumbSrv(object):
     def __init__(self, hub: "SvcHub") -> None:
         self.hub = hub
@@ -157,19 +449,38 @@ class ThumbSrv(object):
         self.log_func = hub.log
 
         self.poke_cd = Cooldown(self.args.th_poke)
+        self.webp_m = ("%d" % (self.args.th_webp_m,)).encode("ascii")
 
         self.mutex = threading.Lock()
-        self.busy: dict[str, list[threading.Condition]] = {}
+        self.busy: dict[str, ThJob] = {}
         self.ram: dict[str, float] = {}
         self.memcond = threading.Condition(self.mutex)
         self.stopping = False
         self.rm_nullthumbs = True  # forget failed conversions on startup
         self.nthr = max(1, self.args.th_mt)
 
-        self.q: Queue[Optional[tuple[str, str, str, VFS]]] = Queue(self.nthr * 4)
+        # prefetch/bulk jobs leave one worker for interactive ones
+        self.nthr_lo = max(1, self.nthr - 1)
+        self.q = ThQueue()
+        self.qcond = threading.Condition(self.mutex)
+        self.nrun = {k: 0 for k in TH_PRIOS}
+        self.lat = {k: [0] * (len(TH_LAT_BKTS) + 1) for k in TH_PRIOS}
+        self.lat_sum = {k: 0.0 for k in TH_PRIOS}
+        self.dep = {k: [0] * (len(TH_DEP_BKTS) + 1) for k in TH_PRIOS}
+        self.n_cancel = 0
         for n in range(self.nthr):
             Daemon(self.worker, "thumb-{}-{}".format(n, self.nthr))
 
+        # pre-generation (volflag thpre); fed by up2k, and only
+        # gets to use the workers when nobody else is waiting
+        self.pre_q: deque[tuple[str, str, float]] = deque()
+        self.pre_cond = threading.Condition(self.mutex)
+        self.n_pre_done = 0
+        self.n_pre_drop = 0
+        d = next((x for x in self.args.th_dec if x in ("vips", "pil")), None)
+        self.can_webp = HAVE_WEBP or d == "vips"
+        Daemon(self.pre_thr, "thumb-pre")
+
         want_ff = not self.args.no_vthumb or not self.args.no_athumb
         if want_ff and (not HAVE_FFMPEG or not HAVE_FFPROBE):
             missing = []
@@ -185,7 +496,11 @@ class ThumbSrv(object):
             if ANYWIN and self.args.no_acode:
                 self.log("download FFmpeg to fix it:\033[0m " + FFMPEG_URL, 3)
 
-        if self.args.th_clean:
+        # histpath -> index of the thumbnails/transcodes in it
+        self.idxs: dict[str, Optional[ThIdx]] = {}
+        self.idx_mutex = threading.Lock()
+        self.clean_cond = threading.Condition(self.mutex)
+        if self.args.th_clean or self.args.th_maxsz:
             Daemon(self.cleaner, "thumb.cln")
 
         self.fmt_pil, self.fmt_vips, self.fmt_ffi, self.fmt_ffv, self.fmt_ffa = [
@@ -224,8 +539,12 @@ class ThumbSrv(object):
 
     def shutdown(self) -> None:
         self.stopping = True
-        for _ in range(self.nthr):
-            self.q.put(None)
+        with self.mutex:
+            self.pre_cond.notify_all()
+            self.qcond.notify_all()
+            for job in self.busy.values():
+                if job.cond:
+                    job.cond.notify_all()
 
     def stopped(self) -> bool:
         with self.mutex:
@@ -236,7 +555,23 @@ class ThumbSrv(object):
         w, h = vn.flags["thsize"].split("x")
         return int(w) * mul, int(h) * mul
 
-    def get(self, ptop: str, rem: str, mtime: float, fmt: str) -> Optional[str]:
+    def get(
+        self,
+        ptop: str,
+        rem: str,
+        mtime: float,
+        fmt: str,
+        prio: str = "i",
+        uname: str = "",
+        tmax: float = 0,
+        rejoin: bool = False,
+    ) -> Optional[str]:
+        """
+        returns the thumbnail path, or None if it could not be created;
+        with tmax, gives up waiting after tmax seconds and returns ""
+        (still in progress), and the client must then either
+        get(..., rejoin=True) to resume waiting, or cancel()
+        """
         histpath = self.asrv.vfs.histtab.get(ptop)
         if not histpath:
             self.log("no histpath for [{}]".format(ptop))
@@ -244,41 +579,37 @@ class ThumbSrv(object):
 
         tpath = thumb_path(histpath, rem, mtime, fmt, self.fmt_ffa)
         abspath = os.path.join(ptop, rem)
-        cond = threading.Condition(self.mutex)
-        do_conv = False
         with self.mutex:
-            try:
-                self.busy[tpath].append(cond)
-                self.log("joined waiting room for %s" % (tpath,))
-            except:
-                thdir = os.path.dirname(tpath)
-                bos.makedirs(os.path.join(thdir, "w"))
-
-                inf_path = os.path.join(thdir, "dir.txt")
-                if not bos.path.exists(inf_path):
-                    with open(inf_path, "wb") as f:
-                        f.write(afsenc(os.path.dirname(abspath)))
-
-                self.busy[tpath] = [cond]
-                do_conv = True
-
-        if do_conv:
-            allvols = list(self.asrv.vfs.all_vols.values())
-            vn = next((x for x in allvols if x.realpath == ptop), None)
-            if not vn:
-                self.log("ptop [{}] not in {}".format(ptop, allvols), 3)
-                vn = self.asrv.vfs.all_aps[0][1]
-
-            self.q.put((abspath, tpath, fmt, vn))
-            self.log("conv {} :{} \033[0m{}".format(tpath, fmt, abspath), c=6)
-
-        while not self.stopping:
-            with self.mutex:
-                if tpath not in self.busy:
-                    break
+            job = self.busy.get(tpath)
+            if job:
+                if not rejoin:
+                    job.nref += 1
+                    self.log("joined waiting room for %s" % (tpath,))
+                    if TH_PRIOS.index(prio) < TH_PRIOS.index(job.prio):
+                        self._bump(job, prio)
+            elif not rejoin:
+                vn = self._getvol(ptop)
+                self._mkthdir(tpath, abspath)
+                job = ThJob(abspath, tpath, fmt, vn, prio, uname)
+                job.nref = 1
+                self._put(job)
+                self.log("conv {} :{} \033[0m{}".format(tpath, fmt, abspath), c=6)
+
+            if job:
+                if not job.cond:
+                    job.cond = threading.Condition(self.mutex)
+
+                t0 = time.time()
+                while not self.stopping and tpath in self.busy:
+                    if tmax:
+                        td = tmax - (time.time() - t0)
+                        if td <= 0:
+                            return ""
+                        job.cond.wait(td)
+                    else:
+                        job.cond.wait()
 
-            with cond:
-                cond.wait(3)
+                job.nref -= 1
 
         try:
             st = bos.stat(tpath)
@@ -290,6 +621,162 @@ class ThumbSrv(object):
 
         return None
 
+    def cancel(self, ptop: str, rem: str, mtime: float, fmt: str) -> None:
+        """the client gave up (disconnected) after get() returned "\""""
+        histpath = self.asrv.vfs.histtab.get(ptop)
+        if not histpath:
+            return
+
+        tpath = thumb_path(histpath, rem, mtime, fmt, self.fmt_ffa)
+        with self.mutex:
+            job = self.busy.get(tpath)
+            if not job:
+                return
+
+            job.nref -= 1
+            if job.nref > 0 or job.running:
+                return
+
+            self.q.drop(job)
+            del self.busy[tpath]
+            self.n_cancel += 1
+            self.pre_cond.notify()
+
+        self.log("cancelled %s" % (tpath,), 6)
+
+    def _getvol(self, ptop: str) -> VFS:
+        allvols = list(self.asrv.vfs.all_vols.values())
+        vn = next((x for x in allvols if x.realpath == ptop), None)
+        if not vn:
+            self.log("ptop [{}] not in {}".format(ptop, allvols), 3)
+            vn = self.asrv.vfs.all_aps[0][1]
+        return vn
+
+    def _put(self, job: ThJob) -> None:
+        """mutex(main) me"""
+        depth = self.q.n[job.prio]
+        bkt = next((n for n, x in enumerate(TH_DEP_BKTS) if depth <= x), -1)
+        self.dep[job.prio][bkt] += 1
+        self.busy[job.tpath] = job
+        self.q.put(job)
+        self.qcond.notify()
+
+    def _bump(self, job: ThJob, prio: str) -> None:
+        """mutex(main) me; someone is now waiting for a background job"""
+        if job.running:
+            return
+
+        self.q.drop(job)
+        job.prio = prio
+        self.q.put(job)
+        self.qcond.notify()
+
+    def _next_job(self) -> Optional[ThJob]:
+        """mutex(main) me"""
+        if self.nrun["p"] + self.nrun["b"] < self.nthr_lo:
+            return self.q.pop(TH_PRIOS)
+
+        return self.q.pop(("i",))
+
+    def q_state(self) -> dict[str, dict[str, Any]]:
+        """queued/running per class, and histograms of latency
+        (queued until done) and queue depth (when a job was added)"""
+        with self.mutex:
+            ret = {}
+            for k in TH_PRIOS:
+                ret[k] = {
+                    "q": self.q.n[k],
+                    "run": self.nrun[k],
+                    "lat": self.lat[k][:],
+                    "lsum": round(self.lat_sum[k], 3),
+                    "dep": self.dep[k][:],
+                }
+            return ret
+
+    def _mkthdir(self, tpath: str, abspath: str) -> None:
+        """mutex(main) me"""
+        thdir = os.path.dirname(tpath)
+        bos.makedirs(os.path.join(thdir, "w"))
+
+        inf_path = os.path.join(thdir, "dir.txt")
+        if not bos.path.exists(inf_path):
+            with open(inf_path, "wb") as f:
+                f.write(afsenc(os.path.dirname(abspath)))
+
+    def pregen(self, ptop: str, rem: str, mtime: float) -> None:
+        """queue a thumbnail to be created in the background (volflag thpre)"""
+        with self.mutex:
+            if len(self.pre_q) >= self.args.th_pre_q:
+                self.n_pre_drop += 1
+                return
+
+            self.pre_q.append((ptop, rem, mtime))
+            self.pre_cond.notify()
+
+    def pre_state(self) -> tuple[int, int, int]:
+        """pregen progress; queued, created, dropped (queue was full)"""
+        with self.mutex:
+            return len(self.pre_q), self.n_pre_done, self.n_pre_drop
+
+    def pre_thr(self) -> None:
+        ram = self.args.th_ram_max
+        while True:
+            with self.mutex:
+                # stay behind interactive requests, and leave
+                # at least half of th_ram_max for them as well
+                while not self.stopping and (
+                    not self.pre_q
+                    or self.q.n["i"]
+                    or self.nrun["i"]
+                    or len(self.busy) >= self.nthr
+                    or sum(self.ram.values()) > ram / 2
+                ):
+                    self.pre_cond.wait(3)
+
+                if self.stopping:
+                    return
+
+                ptop, rem, mtime = self.pre_q.popleft()
+
+            try:
+                self._pregen(ptop, rem, mtime)
+            except Exception as ex:
+                self.log("pregen failed for %s: %r" % (rem, ex), 3)
+
+    def _pregen(self, ptop: str, rem: str, mtime: float) -> None:
+        allvols = list(self.asrv.vfs.all_vols.values())
+        vn = next((x for x in allvols if x.realpath == ptop), None)
+        histpath = self.asrv.vfs.histtab.get(ptop)
+        if not vn or not histpath or "thpre" not in vn.flags:
+            return
+
+        # same rules as ThumbCli.get for the default grid-view thumbnail
+        ext = rem.rsplit(".", 1)[-1].lower()
+        is_vid = ext in self.fmt_ffv
+        is_au = ext in self.fmt_ffa
+        is_img = not is_vid and not is_au
+        if (
+            ext not in self.thumbable
+            or "dthumb" in vn.flags
+            or (is_vid and "dvthumb" in vn.flags)
+            or (is_au and "dathumb" in vn.flags)
+            or (is_img and "dithumb" in vn.flags)
+        ):
+            return
+
+        fmt = th_fmt(self.args, vn.flags, "w", is_img, self.can_webp)
+        tpath = thumb_path(histpath, rem, mtime, fmt, self.fmt_ffa)
+        if bos.path.exists(tpath):
+            return
+
+        abspath = os.path.join(ptop, rem)
+        with self.mutex:
+            if tpath in self.busy:
+                return
+
+            self._mkthdir(tpath, abspath)
+            self._put(ThJob(abspath, tpath, fmt, vn, "p", ""))
+
     def getcfg(self) -> dict[str, set[str]]:
         return {
             "thumbable": self.thumbable,
@@ -306,24 +793,36 @@ class ThumbSrv(object):
             t = "file too big; need %.2f GiB RAM, but --th-ram-max is only %.1f"
             raise Exception(t % (need, ram))
 
-        while True:
-            with self.mutex:
+        with self.mutex:
+            while True:
                 used = sum([v for k, v in self.ram.items() if k != ttpath]) + need
                 if used < ram:
                     # self.log("XXX self.ram: %s" % (self.ram,), 5)
                     self.ram[ttpath] = need
                     return
-            with self.memcond:
                 # self.log("at RAM limit; used %.2f GiB, need %.2f more" % (used-need, need), 1)
                 self.memcond.wait(3)
 
     def worker(self) -> None:
-        while not self.stopping:
-            task = self.q.get()
-            if not task:
-                break
+        while True:
+            with self.mutex:
+                job = None
+                while not self.stopping:
+                    job = self._next_job()
+                    if job:
+                        break
+                    self.qcond.wait()
+
+                if not job:
+                    break
 
-            abspath, tpath, fmt, vn = task
+                job.running = True
+                self.nrun[job.prio] += 1
+
+            abspath = job.abspath
+            tpath = job.tpath
+            fmt = job.fmt
+            vn = job.vn
             ext = abspath.split(".")[-1].lower()
             png_ok = False
             funs = []
@@ -393,34 +892,51 @@ class ThumbSrv(object):
             if abspath != ap_unpk:
                 wunlink(self.log, ap_unpk, vn.flags)
 
+            over = False
             try:
                 wrename(self.log, ttpath, tpath, vn.flags)
+                over = self._idx_add(tpath)
             except:
                 pass
 
             with self.mutex:
-                subs = self.busy[tpath]
+                if over:
+                    self.clean_cond.notify()
                 del self.busy[tpath]
                 self.ram.pop(ttpath, None)
-
-            for x in subs:
-                with x:
-                    x.notify_all()
-
-            with self.memcond:
+                prio = job.prio
+                self.nrun[prio] -= 1
+                td = time.time() - job.t0
+                bkt = next((n for n, x in enumerate(TH_LAT_BKTS) if td <= x), -1)
+                self.lat[prio][bkt] += 1
+                self.lat_sum[prio] += td
+                if prio == "p":
+                    self.n_pre_done += 1
+
+                if job.cond:
+                    job.cond.notify_all()
                 self.memcond.notify_all()
+                self.pre_cond.notify()
+                self.qcond.notify()
 
         with self.mutex:
             self.nthr -= 1
 
-    def fancy_pillow(self, im: "Image.Image", fmt: str, vn: VFS) -> "Image.Image":
+    def fancy_pillow(
+        self,
+        im: "Image.Image",
+        fmt: str,
+        vn: VFS,
+        src: Optional["Image.Image"] = None,
+    ) -> "Image.Image":
+        """src: the original image, if im is its embedded exif thumbnail"""
         # exif_transpose is expensive (loads full image + unconditional copy)
         res = self.getres(vn, fmt)
         r = max(*res) * 2
         im.thumbnail((r, r), resample=Image.LANCZOS)
         try:
             k = next(k for k, v in ExifTags.TAGS.items() if v == "Orientation")
-            exif = im.getexif()
+            exif = (src or im).getexif()
             rot = int(exif[k])
             del exif[k]
         except:
@@ -440,11 +956,62 @@ class ThumbSrv(object):
 
         return im
 
+    def exif_pil(
+        self, im: "Image.Image", res: tuple[int, int], fmt: str
+    ) -> Optional["Image.Image"]:
+        """the thumbnail embedded in a jpeg, if it is big enough"""
+        buf = exif_thumb(im.info.get("exif") or b"")
+        if not buf:
+            return None
+
+        eim = Image.open(BytesIO(buf))
+        iw, ih = im.size
+        ew, eh = eim.size
+
+        # same aspect ratio (some cameras letterbox them, or the
+        # image was cropped without updating the exif)
+        if abs(iw * eh - ih * ew) * 50 > iw * eh:
+            return None
+
+        dw, dh = res
+        try:
+            if im.getexif().get(0x0112, 1) in (5, 6, 7, 8):
+                dw, dh = dh, dw
+        except:
+            pass
+
+        zw = float(dw) / iw
+        zh = float(dh) / ih
+        if "f" in fmt:
+            z = min(zw, zh, 1)
+        else:
+            z = min(max(zw, zh), 1)
+
+        if ew + 1 < iw * z or eh + 1 < ih * z:
+            return None
+
+        return eim
+
     def conv_pil(self, abspath: str, tpath: str, fmt: str, vn: VFS) -> None:
         self.wait4ram(0.2, tpath)
         with Image.open(fsenc(abspath)) as im:
+            src = None
+            if im.format == "JPEG":
+                res = self.getres(vn, fmt)
+                if self.args.th_exif:
+                    eim = self.exif_pil(im, res, fmt)
+                    if eim:
+                        src = im
+                        im = eim
+
+                if not src:
+                    # let libjpeg decode at 1/2, 1/4 or 1/8 size
+                    # (thumbnail() would only go to 2x this)
+                    r = max(*res) * 2
+                    im.draft(im.mode, (r, r))
+
             try:
-                im = self.fancy_pillow(im, fmt, vn)
+                im = self.fancy_pillow(im, fmt, vn, src)
             except Exception as ex:
                 self.log("fancy_pillow {}".format(ex), "90")
                 im.thumbnail(self.getres(vn, fmt))
@@ -459,7 +1026,7 @@ class ThumbSrv(object):
                 # method 4 = ffmpeg-default
                 # method 6 = max, slow
                 fmts.extend(("RGBA", "LA"))
-                args["method"] = 6
+                args["method"] = self.args.th_webp_m
             else:
                 # default q = 75
                 args["progressive"] = True
@@ -489,6 +1056,13 @@ class ThumbSrv(object):
                     raise
 
         assert img  # type: ignore  # !rm
+        if tpath.endswith(".webp"):
+            try:
+                img.write_to_file(tpath, Q=40, effort=self.args.th_webp_m)
+                return
+            except:
+                pass  # libvips older than 8.12
+
         img.write_to_file(tpath, Q=40)
 
     def conv_ffmpeg(self, abspath: str, tpath: str, fmt: str, vn: VFS) -> None:
@@ -539,7 +1113,7 @@ class ThumbSrv(object):
                 b"-q:v",
                 b"50",  # default=75
                 b"-compression_level:v",
-                b"6",  # default=4, 0=fast, 6=max
+                self.webp_m,  # default=4, 0=fast, 6=max
             ]
 
         cmd += [fsenc(tpath)]
@@ -700,7 +1274,7 @@ class ThumbSrv(object):
                 b"-q:v",
                 b"50",  # default=75
                 b"-compression_level:v",
-                b"6",  # default=4, 0=fast, 6=max
+                self.webp_m,  # default=4, 0=fast, 6=max
             ]
 
         cmd += [fsenc(tpath)]
@@ -847,11 +1421,76 @@ class ThumbSrv(object):
                     break
         return ret
 
+    def _get_idx(self, histpath: str) -> Optional[ThIdx]:
+        with self.idx_mutex:
+            try:
+                return self.idxs[histpath]
+            except:
+                pass
+
+            idx = None
+            if HAVE_SQLITE3:
+                try:
+                    idx = ThIdx(self.log_func, histpath)
+                except Exception as ex:
+                    t = "cannot index thumbnails in %s; will scan it instead: %r"
+                    self.log(t % (histpath, ex), 3)
+
+            self.idxs[histpath] = idx
+            return idx
+
+    def _idx_loc(self, path: str) -> Optional[tuple[ThIdx, str, str, str]]:
+        """index, cat, dir, filename of a thumbnail/transcode or its dir"""
+        for histpath in set(self.asrv.vfs.histtab.values()):
+            if not path.startswith(histpath + "/"):
+                continue
+
+            zs = path[len(histpath) + 1 :].replace("\\", "/")
+            zsl = zs.split("/")
+            if zsl[0] not in ("th", "ac") or len(zsl) < 4:
+                return None
+
+            idx = self._get_idx(histpath)
+            if not idx:
+                return None
+
+            if "." in zsl[-1]:
+                return idx, zsl[0], "/".join(zsl[1:-1]), zsl[-1]
+
+            return idx, zsl[0], "/".join(zsl[1:]), ""
+
+        return None
+
+    def _idx_add(self, tpath: str) -> bool:
+        """returns True if the cache is now too big"""
+        loc = self._idx_loc(tpath)
+        if not loc:
+            return False
+
+        idx, c, d, f = loc
+        sz = bos.path.getsize(tpath)
+        for zt in idx.add(c, d, f, sz, int(time.time())):
+            fp = os.path.join(idx.histpath, zt[0], zt[1], zt[2])
+            self.log("rm replaced [{}]".format(fp))
+            try:
+                bos.unlink(fp)
+            except:
+                pass
+
+        maxsz = self.args.th_maxsz
+        return bool(maxsz and idx.nbytes > maxsz)
+
     def poke(self, tdir: str) -> None:
         if not self.poke_cd.poke(tdir):
             return
 
         ts = int(time.time())
+        loc = self._idx_loc(tdir)
+        if loc:
+            idx, c, d, f = loc
+            idx.poke(c, d, f, ts)
+            return
+
         try:
             for _ in range(4):
                 bos.utime(tdir, (ts, ts))
@@ -874,11 +1513,20 @@ class ThumbSrv(object):
                 except Exception as ex:
                     self.log("\033[Jcln err in %s: %r" % (histpath, ex), 3)
 
-            self.log("\033[Jcln ok; rm {} dirs".format(ndirs))
+            self.log("\033[Jcln ok; rm {} files/dirs".format(ndirs))
             self.rm_nullthumbs = False
-            time.sleep(interval)
+            with self.mutex:
+                # woken up early by worker if th_maxsz is exceeded
+                self.clean_cond.wait(interval or None)
 
     def clean(self, histpath: str) -> int:
+        idx = self._get_idx(histpath)
+        if idx:
+            return self._clean_idx(idx)
+
+        if not self.args.th_clean:
+            return 0
+
         ret = 0
         for cat in ["th", "ac"]:
             top = os.path.join(histpath, cat)
@@ -889,6 +1537,131 @@ class ThumbSrv(object):
 
         return ret
 
+    def _clean_idx(self, idx: ThIdx) -> int:
+        if idx.new:
+            self._idx_import(idx)
+            idx.new = False
+
+        ret = 0
+        if self.rm_nullthumbs:
+            ret += self._idx_rm(idx, idx.nulls())
+
+        if self.args.th_clean:
+            now = time.time()
+            for cat in ["th", "ac"]:
+                cutoff = int(now - getattr(self.args, cat + "_maxage"))
+                while True:
+                    rows = idx.expired(cat, cutoff, 1000)
+                    if not rows:
+                        break
+                    ret += self._idx_rm(idx, rows)
+
+        # least recently used first, until 10% below the limit
+        maxsz = self.args.th_maxsz
+        if maxsz and idx.nbytes > maxsz:
+            nbytes = idx.nbytes
+            n = 0
+            while idx.nbytes > maxsz * 0.9:
+                rows = idx.lru(100)
+                if not rows:
+                    break
+
+                zi = idx.nbytes - int(maxsz * 0.9)
+                for nrm, zt in enumerate(rows):
+                    zi -= zt[3]
+                    if zi <= 0:
+                        rows = rows[: nrm + 1]
+                        break
+
+                n += self._idx_rm(idx, rows)
+
+            t = "cache was %s, limit is %s; rm %d files"
+            self.log(t % (humansize(nbytes), humansize(maxsz), n))
+            ret += n
+
+        return ret
+
+    def _idx_rm(self, idx: ThIdx, rows: list[tuple[str, str, str, int]]) -> int:
+        dirs = set()
+        for c, d, f, _ in rows:
+            try:
+                bos.unlink(os.path.join(idx.histpath, c, d, f))
+            except:
+                pass
+            dirs.add((c, d))
+
+        idx.rm(rows)
+
+        # and the folders which are now empty (only dir.txt and w/ left)
+        for c, d in dirs:
+            if idx.ndir(c, d):
+                continue
+
+            dp = os.path.join(idx.histpath, c, d)
+            cmp = dp.lower().replace("\\", "/")
+            with self.mutex:
+                zsl = [k.lower().replace("\\", "/") for k in self.busy]
+                if any(x.startswith(cmp) for x in zsl):
+                    continue
+
+                shutil.rmtree(dp, ignore_errors=True)
+                try:
+                    for _ in range(2):
+                        dp = os.path.dirname(dp)
+                        os.rmdir(dp)
+                except:
+                    pass
+
+        return len(rows)
+
+    def _idx_import(self, idx: ThIdx) -> None:
+        """first run with an index; add the files which are already there"""
+        rows: list[tuple[str, str, str, int, int]] = []
+        for cat in ["th", "ac"]:
+            top = os.path.join(idx.histpath, cat)
+            if bos.path.isdir(top):
+                self._idx_scan(cat, top, "", 0, rows)
+
+        if rows:
+            t = "adding %d existing thumbnails/transcodes in %s to the index"
+            self.log(t % (len(rows), idx.histpath))
+
+        idx.add_many(rows)
+
+    def _idx_scan(
+        self,
+        cat: str,
+        top: str,
+        rd: str,
+        dmtime: float,
+        rows: list[tuple[str, str, str, int, int]],
+    ) -> None:
+        exts = ["jpg", "webp", "png"] if cat == "th" else ["opus", "caf", "mp3"]
+        dp = os.path.join(top, rd) if rd else top
+        try:
+            g = statdir(self.log_func, not self.args.no_scandir, False, dp, False)
+            ents = list(g)
+        except:
+            return
+
+        for f, inf in ents:
+            if stat.S_ISDIR(inf.st_mode):
+                if f != "w":
+                    zs = rd + "/" + f if rd else f
+                    self._idx_scan(cat, top, zs, inf.st_mtime, rows)
+                continue
+
+            try:
+                b64, ts, ext = f.split(".")
+                if len(b64) != 24 or len(ts) != 8 or ext not in exts:
+                    raise Exception()
+            except:
+                continue
+
+            # thumbnail folders were poked (mtime), transcodes expire individually
+            at = dmtime if cat == "th" else inf.st_mtime
+            rows.append((cat, rd, f, inf.st_size, int(at)))
+
     def _clean(self, cat: str, thumbpath: str) -> int:
         # self.log("cln {}".format(thumbpath))
         exts = ["jpg", "webp", "png"] if cat == "th" else ["opus", "caf", "mp3"]
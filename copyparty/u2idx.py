@@ -7,20 +7,23 @@ import re
 import threading
 import time
 from operator import itemgetter
+from queue import Queue
 
-from .__init__ import ANYWIN, PY2, TYPE_CHECKING, unicode
+from .__init__ import ANYWIN, CORES, PY2, TYPE_CHECKING, unicode
 from .authsrv import LEELOO_DALLAS, VFS
 from .bos import bos
 from .up2k import up2k_wark_from_hashlist
 from .util import (
     HAVE_SQLITE3,
     Daemon,
+    ODict,
     Pebkac,
     absreal,
     gen_filekey,
     min_ex,
     quotep,
     s3dec,
+    s3enc,
     vjoin,
 )
 
@@ -33,7 +36,7 @@ except:
     pass
 
 if True:  # pylint: disable=using-constant-test
-    from typing import Any, Optional, Union
+    from typing import Any, Generator, Optional, Union
 
 if TYPE_CHECKING:
     from .httpsrv import HttpSrv
@@ -41,6 +44,23 @@ if TYPE_CHECKING:
 if PY2:
     range = xrange  # type: ignore
 
+# like-searches which the trigram index can answer (see up2k._add_fts_tab)
+PTN_FTS = re.compile(
+    r"up\.fn like +(?P<fe>(?:'%'\|\|)?\?(?:\|\|'%')?) |"
+    r"exists\(select 1 from mt where mt\.w = mtw and (?P<mk>\+mt\.k = '[^']*' and )?"
+    r"mt\.v like +(?P<me>(?:'%'\|\|)?\?(?:\|\|'%')?) \) "
+)
+PTN_FTS_WC = re.compile(r"[%_]")
+
+
+def in_excl(rd: str, excl: set[str]) -> bool:
+    """is rd (or any of its parents) in excl"""
+    while rd:
+        if rd in excl:
+            return True
+        rd = rd.rsplit("/", 1)[0] if "/" in rd else ""
+    return False
+
 
 class U2idx(object):
     def __init__(self, hsrv: "HttpSrv") -> None:
@@ -56,13 +76,17 @@ class U2idx(object):
         assert sqlite3  # type: ignore  # !rm
 
         self.active_id = ""
-        self.active_cur: Optional["sqlite3.Cursor"] = None
+        self.active_curs: list["sqlite3.Cursor"] = []
         self.cur: dict[str, "sqlite3.Cursor"] = {}
         self.mem_cur = sqlite3.connect(":memory:", check_same_thread=False).cursor()
         self.mem_cur.execute(r"create table a (b text)")
 
         self.sh_cur: Optional["sqlite3.Cursor"] = None
 
+        # (ptop, rd) => (data_version, files, dirsizes)
+        self.ls_cache: ODict[tuple[str, str], tuple[int, Any, Any]] = ODict()
+        self.ls_nc: set[str] = set()
+
         self.p_end = 0.0
         self.p_dur = 0.0
 
@@ -142,6 +166,7 @@ class U2idx(object):
                 db = sqlite3.connect(uri, timeout=2, uri=True, check_same_thread=False)
                 cur = db.cursor()
                 cur.execute('pragma table_info("up")').fetchone()
+                self.ls_nc.add(vn.realpath)  # nolock; cannot detect changes
                 self.log("ro: {}".format(db_path))
             except:
                 self.log("could not open read-only: {}\n{}".format(uri, min_ex()))
@@ -157,6 +182,77 @@ class U2idx(object):
         self.cur[ptop] = cur
         return cur
 
+    def ls_meta(
+        self, vn: VFS, rd: str, dnames: list[str]
+    ) -> Optional[
+        tuple[dict[str, tuple[str, int, dict[str, Any]]], dict[str, tuple[int, int]]]
+    ]:
+        """
+        database info for a folder listing, two queries total;
+        returns ({fn: (up_ip, up_at, tags)}, {subdir: (sz, nf)})
+        where subdir sizes are only looked up for dnames (if any)
+        """
+        cur = self.get_cur(vn)
+        if not cur:
+            return None
+
+        ptop = vn.realpath
+        ckey = (ptop, rd)
+        dver = -1
+        if self.args.ls_cache and ptop not in self.ls_nc:
+            # changes whenever up2k (or anyone else) commits to this db
+            dver = cur.execute("pragma data_version").fetchone()[0]
+            zt = self.ls_cache.pop(ckey, None)
+            if zt and zt[0] == dver and not [x for x in dnames if x not in zt[2]]:
+                self.ls_cache[ckey] = zt
+                return zt[1], zt[2]
+
+        erd, _ = s3enc(self.mem_cur, rd, "")
+        files: dict[str, tuple[str, int, dict[str, Any]]] = {}
+        q = "select up.fn, up.ip, up.at, mt.k, mt.v from up left join mt on mt.w = substr(up.w,1,16) and +mt.k != 'x' where up.rd = ?"
+        for fn, ip, at, k, v in cur.execute(q, (erd,)):
+            try:
+                zt = files[fn]
+            except:
+                zt = files[fn] = (ip, at, {})
+            if k is not None:
+                zt[2][k] = v
+
+        if erd != rd or [x for x in files if x.startswith("//")]:
+            files = {s3dec(rd, k)[1]: v for k, v in files.items()}
+
+        dsz: dict[str, tuple[int, int]] = {}
+        vdir = "%s/" % (rd,) if rd else ""
+        zsl = []
+        for zs in dnames:
+            try:
+                zs.encode("utf-8")
+                zsl.append(vdir + zs)
+            except:
+                pass  # mojibake
+
+        nvdir = len(vdir)
+        try:
+            for n in range(0, len(zsl), 500):
+                zsl2 = zsl[n : n + 500]
+                q = "select rd, sz, nf from ds where rd in (%s)"
+                q = q % (",".join(["?"] * len(zsl2)),)
+                for drd, sz, nf in cur.execute(q, zsl2):
+                    dsz[drd[nvdir:]] = (sz, nf)
+        except:
+            pass  # no dirsz in db
+
+        if dver >= 0:
+            for zs in dnames:
+                if zs not in dsz:
+                    dsz[zs] = (-1, -1)  # negative lookup
+
+            self.ls_cache[ckey] = (dver, files, dsz)
+            while len(self.ls_cache) > self.args.ls_cache:
+                self.ls_cache.pop(next(iter(self.ls_cache)))
+
+        return files, dsz
+
     def search(
         self, uname: str, vols: list[VFS], uq: str, lim: int
     ) -> tuple[list[dict[str, Any]], list[str], bool]:
@@ -300,11 +396,55 @@ class U2idx(object):
             else:
                 q += " lower({}) {} ? ) ".format(field, oper)
 
+        fq = self._fts_q(q, va)
         try:
-            return self.run_query(uname, vols, q, va, have_mt, True, lim)
+            return self.run_query(uname, vols, q, va, have_mt, True, lim, fq)
         except Exception as ex:
             raise Pebkac(500, repr(ex))
 
+    def _fts_q(
+        self, q: str, va: list[Union[str, int]]
+    ) -> Optional[tuple[str, list[Union[str, int]]]]:
+        """
+        same query but with the like-searches going through the fts index;
+        the original condition is kept to filter the (superset of) hits
+        """
+        ret = []
+        rva = va[:]
+        ofs = 0
+        for m in PTN_FTS.finditer(q):
+            n = q.count("?", 0, m.start())
+            v = va[n]
+            if not isinstance(v, unicode) or not [
+                x for x in PTN_FTS_WC.split(v) if len(x) > 2
+            ]:
+                continue  # trigrams need 3 letters in a row
+
+            fe, mk, me = m.group("fe", "mk", "me")
+            if fe:
+                zs = "(up.rowid in (select rowid from upf where upf.fn like {0}) and up.fn like {0}) "
+                zs = zs.format(fe)
+            else:
+                zs = "substr(up.w,1,16) in (select mt.w from mt where mt.rowid in (select rowid from mtf where mtf.v like {0}) and {1}mt.v like {0}) "
+                zs = zs.format(me, mk or "")
+
+            ret.append(q[ofs : m.start()] + zs)
+            ofs = m.end()
+            rva.insert(n + len(rva) - len(va), v)
+
+        if not ret:
+            return None
+
+        ret.append(q[ofs:])
+        return "".join(ret), rva
+
+    def _fts_ok(self, vol: VFS, cur: "sqlite3.Cursor") -> bool:
+        if "fts" not in vol.flags:
+            return False
+
+        zs = "select 1 from sqlite_master where name = 'upf'"
+        return bool(cur.execute(zs).fetchone())
+
     def run_query(
         self,
         uname: str,
@@ -314,6 +454,7 @@ class U2idx(object):
         have_mt: bool,
         sort: bool,
         lim: int,
+        fq: Optional[tuple[str, list[Union[str, int]]]] = None,
     ) -> tuple[list[dict[str, Any]], list[str], bool]:
         if self.args.srch_dbg:
             t = "searching across all %s volumes in which the user has 'r' (full read access):\n  %s"
@@ -329,10 +470,16 @@ class U2idx(object):
         if not uq or not uv:
             uq = "select * from up"
             uv = []
-        elif have_mt:
-            uq = "select up.*, substr(up.w,1,16) mtw from up where " + uq
+            fq = None
         else:
-            uq = "select up.* from up where " + uq
+            if have_mt:
+                zs = "select up.*, substr(up.w,1,16) mtw from up where "
+            else:
+                zs = "select up.* from up where "
+
+            uq = zs + uq
+            if fq:
+                fq = (zs + fq[0], fq[1])
 
         self.log("qs: {!r} {!r}".format(uq, uv))
 
@@ -346,48 +493,159 @@ class U2idx(object):
             clamped = False
 
         taglist = {}
-        for vol in vols:
-            if lim < 0:
-                break
+        more = False
+        zg = self._run_vols(uname, vols, uq, uv, fq, lim)
+        try:
+            for vtop, sret, vmore, vtags in zg:
+                n = len(ret)
+                taglist.update(vtags)
+                for rp, hit in sret:
+                    if rp in seen_rps:
+                        continue
+
+                    lim -= 1
+                    if lim < 0:
+                        break
 
-            vtop = vol.vpath
-            ptop = vol.realpath
-            flags = vol.flags
+                    seen_rps.add(rp)
+                    ret.append(hit)
 
-            cur = self.get_cur(vol)
-            if not cur:
-                continue
+                if lim < 0:
+                    break
 
-            excl = []
-            for vp2 in self.asrv.vfs.all_vols.keys():
-                if vp2.startswith((vtop + "/").lstrip("/")) and vtop != vp2:
-                    excl.append(vp2[len(vtop) :].lstrip("/"))
+                more = more or vmore
 
-            if self.args.srch_dbg:
-                t = "searching in volume /%s (%s), excludelist %s"
-                self.log(t % (vtop, ptop, excl), 5)
+                if self.args.srch_dbg:
+                    t = "in volume '/%s': got %d hits, %d total so far"
+                    self.log(t % (vtop, len(ret) - n, len(ret)), 5)
+        finally:
+            # stop the other volumes right away, not whenever zg is collected
+            zg.close()
+            done_flag.append(True)
+            self.active_id = ""
+
+        if sort:
+            ret.sort(key=itemgetter("rp"))
+
+        return ret, list(taglist.keys()), (lim < 0 or more) and not clamped
+
+    def _run_vols(
+        self,
+        uname: str,
+        vols: list[VFS],
+        uq: str,
+        uv: list[Union[str, int]],
+        fq: Optional[tuple[str, list[Union[str, int]]]],
+        lim: int,
+    ) -> Generator[
+        tuple[str, list[tuple[str, dict[str, Any]]], bool, dict[str, bool]], None, None
+    ]:
+        """
+        searches all volumes at the same time (they are separate dbs),
+        yielding the results of each volume in order
+        """
+        vols = list(vols)
+        nthr = min(len(vols), max(2, CORES))
+        if nthr < 2:
+            for vol in vols:
+                yield self._run_vol(uname, vol, uq, uv, fq, lim)
+            return
+
+        jobs: Queue[int] = Queue()
+        rets: list[Queue[Any]] = [Queue() for _ in vols]
+        for n in range(len(vols)):
+            jobs.put(n)
+
+        stop: list[bool] = []
+
+        def worker() -> None:
+            while not stop:
+                try:
+                    n = jobs.get(False)
+                except:
+                    return
+                try:
+                    rets[n].put(self._run_vol(uname, vols[n], uq, uv, fq, lim))
+                except Exception as ex:
+                    rets[n].put(ex)
+
+        thrs = [Daemon(worker, "u2idx-srch-%d" % (n,)) for n in range(nthr)]
+
+        try:
+            for q in rets:
+                zt = q.get()
+                if isinstance(zt, Exception):
+                    raise zt
+                yield zt
+        finally:
+            # got enough hits (or failed); cancel the stragglers and wait
+            # for them, since the cursors are reused by the next search
+            stop.append(True)
+            for cur in list(self.active_curs):
+                try:
+                    cur.connection.interrupt()
+                except:
+                    pass
+
+            for thr in thrs:
+                thr.join()
+
+    def _run_vol(
+        self,
+        uname: str,
+        vol: VFS,
+        uq: str,
+        uv: list[Union[str, int]],
+        fq: Optional[tuple[str, list[Union[str, int]]]],
+        lim: int,
+    ) -> tuple[str, list[tuple[str, dict[str, Any]]], bool, dict[str, bool]]:
+        """returns vpath, up to lim (rp, hit), more-available, taglist"""
+        vtop = vol.vpath
+        ptop = vol.realpath
+        flags = vol.flags
 
-            self.active_cur = cur
+        cur = self.get_cur(vol)
+        if not cur:
+            return vtop, [], False, {}
 
-            vuv = []
-            for v in uv:
-                if v == "\nrd":
-                    v = vtop + "/"
+        excl = set()
+        for vp2 in self.asrv.vfs.all_vols.keys():
+            if vp2.startswith((vtop + "/").lstrip("/")) and vtop != vp2:
+                excl.add(vp2[len(vtop) :].lstrip("/"))
 
-                vuv.append(v)
+        if self.args.srch_dbg:
+            t = "searching in volume /%s (%s), excludelist %s"
+            self.log(t % (vtop, ptop, list(excl)), 5)
 
-            sret = []
-            fk = flags.get("fk")
-            dots = flags.get("dotsrch") and uname in vol.axs.udot
-            fk_alg = 2 if "fka" in flags else 1
-            c = cur.execute(uq, tuple(vuv))
+        vuq, vuv = uq, uv
+        if fq and self._fts_ok(vol, cur):
+            vuq, vuv = fq
+            if self.args.srch_dbg:
+                self.log("using fts index: {!r} {!r}".format(vuq, vuv), 5)
+
+        vuv2 = []
+        for v in vuv:
+            if v == "\nrd":
+                v = vtop + "/"
+
+            vuv2.append(v)
+
+        sret = []
+        seen_rps: set[str] = set()
+        more = False
+        fk = flags.get("fk")
+        dots = flags.get("dotsrch") and uname in vol.axs.udot
+        fk_alg = 2 if "fka" in flags else 1
+        self.active_curs.append(cur)
+        try:
+            c = cur.execute(vuq, tuple(vuv2))
             for hit in c:
                 w, ts, sz, rd, fn, ip, at = hit[:7]
 
                 if rd.startswith("//") or fn.startswith("//"):
                     rd, fn = s3dec(rd, fn)
 
-                if rd in excl or any([x for x in excl if rd.startswith(x + "/")]):
+                if excl and in_excl(rd, excl):
                     if self.args.srch_dbg:
                         zs = vjoin(vjoin(vtop, rd), fn)
                         t = "database inconsistency in volume '/%s'; ignoring: %s"
@@ -418,8 +676,8 @@ class U2idx(object):
                         ino,
                     )[:fk]
 
-                lim -= 1
-                if lim < 0:
+                if len(sret) >= lim:
+                    more = True
                     break
 
                 if self.args.srch_dbg:
@@ -436,33 +694,31 @@ class U2idx(object):
                         )
 
                 seen_rps.add(rp)
-                sret.append({"ts": int(ts), "sz": sz, "rp": rp + suf, "w": w[:16]})
-
-            for hit in sret:
-                w = hit["w"]
-                del hit["w"]
-                tags = {}
-                q2 = "select k, v from mt where w = ? and +k != 'x'"
-                for k, v2 in cur.execute(q2, (w,)):
+                zd = {"ts": int(ts), "sz": sz, "rp": rp + suf, "tags": {}}
+                sret.append((rp, zd, w[:16]))
+
+            # tags for all the hits at once, in batches below the sqlite arg limit
+            taglist: dict[str, bool] = {}
+            hits: dict[str, list[dict[str, Any]]] = {}
+            for _, zd, w in sret:
+                try:
+                    hits[w].append(zd)
+                except:
+                    hits[w] = [zd]
+
+            ws = list(hits)
+            for n in range(0, len(ws), 500):
+                zsl = ws[n : n + 500]
+                q = "select w, k, v from mt where w in (%s) and +k != 'x'"
+                q = q % (",".join(["?"] * len(zsl)),)
+                for w, k, v2 in cur.execute(q, zsl):
                     taglist[k] = True
-                    tags[k] = v2
-
-                hit["tags"] = tags
-
-            ret.extend(sret)
-            # print("[{}] {}".format(ptop, sret))
-
-            if self.args.srch_dbg:
-                t = "in volume '/%s': got %d hits, %d total so far"
-                self.log(t % (vtop, len(sret), len(ret)), 5)
-
-        done_flag.append(True)
-        self.active_id = ""
-
-        if sort:
-            ret.sort(key=itemgetter("rp"))
+                    for zd in hits[w]:
+                        zd["tags"][k] = v2
+        finally:
+            self.active_curs.remove(cur)
 
-        return ret, list(taglist.keys()), lim < 0 and not clamped
+        return vtop, [(x[0], x[1]) for x in sret], more, taglist
 
     def terminator(self, identifier: str, done_flag: list[bool]) -> None:
         for _ in range(self.timeout):
@@ -471,5 +727,5 @@ class U2idx(object):
                 return
 
         if identifier == self.active_id:
-            assert self.active_cur  # !rm
-            self.active_cur.connection.interrupt()
+            for cur in list(self.active_curs):
+                cur.connection.interrupt()
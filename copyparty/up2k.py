@@ -15,6 +15,7 @@ import tempfile
 import threading
 import time
 import traceback
+import zlib
 from copy import deepcopy
 
 from queue import Queue
@@ -24,6 +25,7 @@ from .authsrv import LEELOO_DALLAS, SEESLOG, VFS, AuthSrv
 from .bos import bos
 from .cfg import vf_bmap, vf_cmap, vf_vmap
 from .fsutil import Fstab
+from .fswatch import HAVE_INOTIFY, FsWatch
 from .mtag import MParser, MTag
 from .util import (
     HAVE_SQLITE3,
@@ -33,12 +35,16 @@ from .util import (
     MTHash,
     Pebkac,
     ProgressPrinter,
+    StatLock,
     absreal,
     alltrace,
     atomic_move,
+    crc32_combine,
+    crc32_op,
     db_ex_chk,
     dir_is_empty,
     djoin,
+    fcopy,
     fsenc,
     gen_filekey,
     gen_filekey_dbg,
@@ -48,6 +54,7 @@ from .util import (
     pathmod,
     quotep,
     rand_name,
+    reflink,
     ren_open,
     rmdirs,
     rmdirs_up,
@@ -79,8 +86,11 @@ if HAVE_SQLITE3:
 
 DB_VER = 5
 
+# not worth journaling; reset when the snap is loaded
+SNAP_VOLATILE = set(["hash", "need", "busy", "poke", "t0c"])
+
 if True:  # pylint: disable=using-constant-test
-    from typing import Any, Optional, Pattern, Union
+    from typing import Any, Generator, Optional, Pattern, Union
 
 if TYPE_CHECKING:
     from .svchub import SvcHub
@@ -99,6 +109,59 @@ class Dbw(object):
         self.c = c
         self.n = n
         self.t = t
+        # scan stats; num-dirs, listing-time, num-hashed, bytes-hashed, hash-time
+        self.nd = 0
+        self.tls = 0.0
+        self.nh = 0
+        self.bh = 0
+        self.th = 0.0
+
+
+class IdxTask(object):
+    """folder-listing or file-hashing job for the e2ds threadpool"""
+
+    def __init__(self, fun: Any, args: tuple[Any, ...]) -> None:
+        self.fun = fun
+        self.args = args
+        self.ev = threading.Event()
+        self.ret: Any = None
+        self.ex: Optional[Exception] = None
+
+    def get(self) -> Any:
+        self.ev.wait()
+        if self.ex:
+            raise self.ex
+        return self.ret
+
+
+class ChunkIdx(object):
+    """lookup tables for the chunks of an up2k job; never persisted"""
+
+    def __init__(self, job: dict[str, Any]) -> None:
+        self.job = job
+        self.hash: list[str] = job["hash"]
+        self.need_list: list[str] = job["need"]
+        self.need = set(self.need_list)
+
+        # chash => chunk numbers (one chunk may occur multiple times)
+        self.ofs: dict[str, list[int]] = {}
+        # unique chashes in order of appearance, and position in that list
+        self.uniq: list[str] = []
+        self.upos: dict[str, int] = {}
+        for n, chash in enumerate(self.hash):
+            try:
+                self.ofs[chash].append(n)
+            except:
+                self.ofs[chash] = [n]
+                self.upos[chash] = len(self.uniq)
+                self.uniq.append(chash)
+
+    def valid(self, job: dict[str, Any]) -> bool:
+        return (
+            self.job is job
+            and self.hash is job["hash"]
+            and self.need_list is job["need"]
+        )
 
 
 class Mpqe(object):
@@ -139,7 +202,7 @@ class Up2k(object):
         self.gt0 = 0
         self.gt1 = 0
         self.stop = False
-        self.mutex = threading.Lock()
+        self.mutex = StatLock()
         self.reload_mutex = threading.Lock()
         self.reload_flag = 0
         self.reloading = False
@@ -149,7 +212,7 @@ class Up2k(object):
         self.need_rescan: set[str] = set()
         self.db_act = 0.0
 
-        self.reg_mutex = threading.Lock()
+        self.reg_mutex = StatLock()
         self.registry: dict[str, dict[str, dict[str, Any]]] = {}
         self.flags: dict[str, dict[str, Any]] = {}
         self.droppable: dict[str, list[str]] = {}
@@ -160,6 +223,12 @@ class Up2k(object):
         self.busy_aps: dict[str, int] = {}
         self.dupesched: dict[str, list[tuple[str, str, float]]] = {}
         self.snap_prev: dict[str, Optional[tuple[int, float]]] = {}
+        self.snap_mutex = threading.Lock()
+        # journaling; last-written job metadata, droppables, and confirmed chunks
+        self.snap_jobs: dict[str, dict[str, list[Any]]] = {}
+        self.snap_drp: dict[str, list[str]] = {}
+        self.snap_cc: dict[str, list[tuple[str, str]]] = {}
+        self.chunk_idx: dict[tuple[str, str], ChunkIdx] = {}
 
         self.mtag: Optional[MTag] = None
         self.entags: dict[str, set[str]] = {}
@@ -170,7 +239,7 @@ class Up2k(object):
         ] = Queue()
         self.tagq: Queue[tuple[str, str, str, str, int, str, float]] = Queue()
         self.tag_event = threading.Condition()
-        self.hashq_mutex = threading.Lock()
+        self.hashq_mutex = StatLock()
         self.n_hashq = 0
         self.n_tagq = 0
         self.mpool_used = False
@@ -179,6 +248,7 @@ class Up2k(object):
         self.xiu_busy = False  # currently running hook
         self.xiu_asleep = True  # needs rescan_cond poke to schedule self
         self.fx_backlog: list[tuple[str, dict[str, str], str]] = []
+        self.fsw: Optional[FsWatch] = None
 
         self.cur: dict[str, "sqlite3.Cursor"] = {}
         self.mem_cur = None
@@ -201,10 +271,16 @@ class Up2k(object):
         self.fstab = Fstab(self.log_func, self.args)
         self.gen_fk = self._gen_fk if self.args.log_fk else gen_filekey
 
+        self.ipool: Optional[Queue[IdxTask]] = None
+        if self.args.scan_mt > 0:
+            self.ipool = Queue()
+            for n in range(self.args.scan_mt):
+                Daemon(self._idx_thr, "up2k-idx-%d" % (n,), (self.ipool,))
+
         if self.args.hash_mt < 2:
             self.mth: Optional[MTHash] = None
         else:
-            self.mth = MTHash(self.args.hash_mt)
+            self.mth = MTHash(self.args.hash_mt, not self.args.no_pread)
 
         if self.args.no_fastboot:
             self.deferred_init()
@@ -323,7 +399,8 @@ class Up2k(object):
                     except:
                         pass
                 if uname and up_en:
-                    ups = self._active_uploads(uname)
+                    with self.reg_mutex:
+                        ups = self._active_uploads(uname)
             finally:
                 self.mutex.release()
         else:
@@ -341,15 +418,33 @@ class Up2k(object):
             "hashq": self.n_hashq,
             "tagq": self.n_tagq,
             "mtpq": mtpq,
+            "thpre": self._th_pre_state(),
+            "thq": self._th_q_state(),
             "ups": ups,
             "dbwu": "{:.2f}".format(self.db_act),
             "dbwt": "{:.2f}".format(
                 min(1000 * 24 * 60 * 60 - 1, time.time() - self.db_act)
             ),
+            "locks": {
+                "main": self.mutex.stats(),
+                "reg": self.reg_mutex.stats(),
+                "hashq": self.hashq_mutex.stats(),
+            },
         }
         return json.dumps(ret, separators=(",\n", ": "))
 
+    def _th_pre_state(self) -> tuple[int, int, int]:
+        """thumbnail pregen; queued, created, dropped"""
+        thsrv = getattr(self.hub, "thumbsrv", None)
+        return thsrv.pre_state() if thsrv else (0, 0, 0)
+
+    def _th_q_state(self) -> dict[str, dict[str, Any]]:
+        """thumbnailer queue per priority class"""
+        thsrv = getattr(self.hub, "thumbsrv", None)
+        return thsrv.q_state() if thsrv else {}
+
     def _active_uploads(self, uname: str) -> list[tuple[float, int, int, str]]:
+        """mutex(main,reg) me"""
         ret = []
         for vtop in self.vfs.aread.get(uname) or []:
             vfs = self.vfs.all_vols.get(vtop)
@@ -892,6 +987,8 @@ class Up2k(object):
         vols = live_vols
         need_vac = {}
 
+        self._fsw_sync(list(all_vols.values()))
+
         need_mtag = False
         for vol in vols:
             if "e2t" in vol.flags:
@@ -992,7 +1089,7 @@ class Up2k(object):
             cur, _ = reg
             with self.mutex:
                 cur.connection.commit()
-                cur.execute("vacuum")
+                self._vacuum(cur)
 
         if self.stop:
             return False
@@ -1111,17 +1208,14 @@ class Up2k(object):
         reg = {}
         drp = None
         emptylist = []
+        fps: dict[str, list[Any]] = {}
         snap = os.path.join(histpath, "up2k.snap")
-        if bos.path.exists(snap):
-            with gzip.GzipFile(snap, "rb") as f:
-                j = f.read().decode("utf-8")
-
-            reg2 = json.loads(j)
-            try:
-                drp = reg2["droppable"]
-                reg2 = reg2["registry"]
-            except:
-                pass
+        have_jnl = bos.path.exists(snap + ".jnl")
+        if have_jnl or bos.path.exists(snap):
+            reg2, drp = snap_load(snap)
+            if have_jnl and not self.args.no_snap:
+                # start the next journal from scratch
+                self._snap_write(snap, snap_body(reg2, drp))
 
             if reg2 and "dwrk" not in reg2[next(iter(reg2))]:
                 for job in reg2.values():
@@ -1130,6 +1224,7 @@ class Up2k(object):
             rm = []
             for k, job in reg2.items():
                 job["ptop"] = ptop
+                fps[k] = snap_fp(job)
                 if "done" in job:
                     job["need"] = job["hash"] = emptylist
                 else:
@@ -1163,6 +1258,12 @@ class Up2k(object):
             ta = [t] + self._vis_reg_progress(reg)
             self.log("\n".join(ta))
 
+        if self.args.snap_wri and not self.args.nw and not self.args.no_snap:
+            # what is on disk, to journal the differences against
+            self.snap_jobs[ptop] = fps
+            self.snap_drp[ptop] = (drp or [])[:]
+            self.snap_cc[ptop] = []
+
         self.flags[ptop] = flags
         self.vol_act[ptop] = 0.0
         self.registry[ptop] = reg
@@ -1216,6 +1317,7 @@ class Up2k(object):
             cur.connection.commit()
 
             self._verify_db_cache(cur, vpath)
+            self._add_fts_tab(cur, db_path, "fts" in flags)
 
             self.cur[ptop] = cur
             self.volsize[cur] = 0
@@ -1270,18 +1372,7 @@ class Up2k(object):
             db = Dbw(cur, 0, time.time())
             self.pp.n = next(db.c.execute("select count(w) from up"))[0]
 
-            excl = [
-                vol.realpath + "/" + d.vpath[len(vol.vpath) :].lstrip("/")
-                for d in all_vols
-                if d != vol and (d.vpath.startswith(vol.vpath + "/") or not vol.vpath)
-            ]
-            excl += [absreal(x) for x in excl]
-            excl += list(self.vfs.histtab.values())
-            if WINDOWS:
-                excl = [x.replace("/", "\\") for x in excl]
-            else:
-                # ~/.wine/dosdevices/z:/ and such
-                excl.extend(("/dev", "/proc", "/run", "/sys"))
+            excl = self._idx_excl(vol, all_vols)
 
             if self.args.re_dirsz:
                 db.c.execute("delete from ds")
@@ -1289,6 +1380,7 @@ class Up2k(object):
 
             rtop = absreal(top)
             n_add = n_rm = 0
+            t0 = time.time()
             try:
                 if dir_is_empty(self.log_func, not self.args.no_scandir, rtop):
                     t = "volume /%s at [%s] is empty; will not be indexed as this could be due to an offline filesystem"
@@ -1321,6 +1413,12 @@ class Up2k(object):
             if db.n:
                 self.log("commit {} new files".format(db.n))
 
+            if db.nd:
+                td = max(0.001, time.time() - t0)
+                t = "scan [%s] %.2fs: %d dirs listed in %.2fs (%.0f/s), %d files hashed in %.2fs (%s/s)"
+                zs = humansize(db.bh / max(0.001, db.th), True)
+                self.log(t % (top, td, db.nd, db.tls, db.nd / td, db.nh, db.th, zs))
+
             if self.args.no_dhash:
                 if db.c.execute("select d from dh").fetchone():
                     db.c.execute("delete from dh")
@@ -1328,6 +1426,11 @@ class Up2k(object):
             elif n_add or n_rm:
                 self._set_tagscan(db.c, True)
 
+            if n_add or n_rm:
+                # crcs of files which were deleted or have changed
+                zs = "delete from cr where w not in (select substr(w,1,16) from up)"
+                db.c.execute(zs)
+
             db.c.connection.commit()
 
             if (
@@ -1354,6 +1457,23 @@ class Up2k(object):
 
             return True, bool(n_add or n_rm or do_vac)
 
+    def _idx_excl(self, vol: VFS, all_vols: list[VFS]) -> list[str]:
+        """abspaths to skip when indexing vol; subvolumes and histpaths"""
+        excl = [
+            vol.realpath + "/" + d.vpath[len(vol.vpath) :].lstrip("/")
+            for d in all_vols
+            if d != vol and (d.vpath.startswith(vol.vpath + "/") or not vol.vpath)
+        ]
+        excl += [absreal(x) for x in excl]
+        excl += list(self.vfs.histtab.values())
+        if WINDOWS:
+            excl = [x.replace("/", "\\") for x in excl]
+        else:
+            # ~/.wine/dosdevices/z:/ and such
+            excl.extend(("/dev", "/proc", "/run", "/sys"))
+
+        return excl
+
     def _build_dir(
         self,
         db: Dbw,
@@ -1369,6 +1489,7 @@ class Up2k(object):
         cst: os.stat_result,
         dev: int,
         xvol: bool,
+        pre: Optional[IdxTask] = None,
     ) -> tuple[int, int, int]:
         if xvol and not rcdir.startswith(top):
             self.log("skip xvol: [{}] -> [{}]".format(cdir, rcdir), 6)
@@ -1400,8 +1521,19 @@ class Up2k(object):
         rds = rd + "/" if rd else ""
         cdirs = cdir + os.sep
 
-        g = statdir(self.log_func, not self.args.no_scandir, True, cdir, False)
-        gl = sorted(g)
+        t0 = time.time()
+        gl = pre.get() if pre else self._idx_ls(cdir)
+        db.tls += time.time() - t0
+        db.nd += 1
+
+        # with --scan-mt, read the next few subfolders while we do this one
+        pre_dirs: list[str] = []
+        pre_tasks: dict[str, IdxTask] = {}
+        if self.ipool:
+            pre_dirs = [cdirs + x[0] for x in gl if stat.S_ISDIR(x[1].st_mode)]
+            pre_dirs = [x for x in pre_dirs if x not in excl]
+            pre_dirs.reverse()
+
         partials = set([x[0] for x in gl if "PARTIAL" in x[0]])
         for iname, inf in gl:
             if self.stop:
@@ -1426,6 +1558,11 @@ class Up2k(object):
                 fat32 = False
 
             if stat.S_ISDIR(inf.st_mode):
+                while pre_dirs and len(pre_tasks) < self.args.scan_mt * 2:
+                    zs = pre_dirs.pop()
+                    pre_tasks[zs] = self._idx_put(self._idx_ls, (zs,))
+
+                pre_task = pre_tasks.pop(abspath, None)
                 rap = absreal(abspath)
                 if (
                     dev
@@ -1456,6 +1593,7 @@ class Up2k(object):
                         inf,
                         dev,
                         xvol,
+                        pre_task,
                     )
                     tfa += i1
                     tnf += i2
@@ -1549,25 +1687,41 @@ class Up2k(object):
             except Exception as ex:
                 self.log("cover {}/{} failed: {}".format(rd, cv, ex), 6)
 
+        # load everything the db knows about this folder in one go,
+        # then diff that against the listing
+        q = "select fn, w, mt, sz, ip, at from up where rd = ?"
+        try:
+            c = db.c.execute(q, (rd,))
+            drd = rd
+        except:
+            drd = "//" + w8b64enc(rd)
+            c = db.c.execute(q, (drd,))
+
+        db_files: dict[str, list[tuple[str, str, int, int, str, int]]] = {}
+        for zt in c:
+            dfn = zt[0]
+            if dfn.startswith("//"):
+                dfn = w8b64dec(dfn[2:])
+            try:
+                db_files[dfn].append(zt)
+            except:
+                db_files[dfn] = [zt]
+
         seen_files = set([x[2] for x in files])  # for dropcheck
+        todo: list[tuple[str, int, int, str, Any, str, int]] = []
+        db_rms: list[tuple[str, str]] = []
+        db_adds: list[tuple[str, int, int, str, str, str, int]] = []
         for sz, lmod, fn in files:
             if self.stop:
                 return -1, 0, 0
 
             rp = rds + fn
-            abspath = cdirs + fn
-            nohash = reh.search(abspath) if reh else False
+            nohash = reh.search(cdirs + fn) if reh else False
 
-            sql = "select w, mt, sz, ip, at from up where rd = ? and fn = ?"
-            try:
-                c = db.c.execute(sql, (rd, fn))
-            except:
-                c = db.c.execute(sql, s3enc(self.mem_cur, rd, fn))
-
-            in_db = list(c.fetchall())
+            in_db = db_files.get(fn)
             if in_db:
                 self.pp.n -= 1
-                dw, dts, dsz, ip, at = in_db[0]
+                _, dw, dts, dsz, ip, at = in_db[0]
                 if len(in_db) > 1:
                     t = "WARN: multiple entries: [{}] => [{}] |{}|\n{}"
                     rep_db = "\n".join([repr(x) for x in in_db])
@@ -1584,51 +1738,74 @@ class Up2k(object):
                     top, rp, dts, lmod, dsz, sz
                 )
                 self.log(t)
-                self.db_rm(db.c, rd, fn, 0)
+                db_rms.append((drd, in_db[0][0]))
                 tfa += 1
                 db.n += 1
-                in_db = []
             else:
                 dw = ""
                 ip = ""
                 at = 0
 
+            todo.append((fn, sz, lmod, dw, nohash, ip, at))
+
+        self._idx_rm(db, db_rms)
+
+        # hashing is done by the threadpool (if any) in the background,
+        # but the results are written to the db in order from this thread
+        jobs = [(x, (cdirs + x[0], x[1], x[4])) for x in todo]
+        thpre = "thpre" in self.flags[top]
+        db_crcs: list[tuple[str, int]] = []
+        for (fn, sz, lmod, dw, _, ip, at), zt, ex in self._idx_map(
+            db, self._idx_hash, jobs
+        ):
+            if self.stop:
+                self._idx_add(db, db_adds, db_crcs)
+                return -1, 0, 0
+
+            abspath = cdirs + fn
             self.pp.msg = "a%d %s" % (self.pp.n, abspath)
 
-            if nohash or not sz:
+            if ex:
+                self.log("hash: {} @ [{}]".format(repr(ex), abspath))
+                continue
+
+            if zt is None:
                 wark = up2k_wark_from_metadata(self.salt, sz, lmod, rd, fn)
             else:
-                if sz > 1024 * 1024:
-                    self.log("file: {}".format(abspath))
-
-                try:
-                    hashes, _ = self._hashlist_from_file(
-                        abspath, "a{}, ".format(self.pp.n)
-                    )
-                except Exception as ex:
-                    self.log("hash: {} @ [{}]".format(repr(ex), abspath))
-                    continue
-
+                hashes, crc = zt
                 if not hashes:
+                    self._idx_add(db, db_adds, db_crcs)
                     return -1, 0, 0
 
+                db.nh += 1
+                db.bh += sz
                 wark = up2k_wark_from_hashlist(self.salt, sz, hashes)
+                if not self.args.no_zipcrc:
+                    db_crcs.append((wark[:16], crc))
 
             if dw and dw != wark:
                 ip = ""
                 at = 0
+            elif ip and self.args.no_db_ip:
+                ip = "1.1.1.1"
 
-            # skip upload hooks by not providing vflags
-            self.db_add(db.c, {}, rd, fn, lmod, sz, "", "", wark, wark, "", "", ip, at)
+            # bypassing db_add; no upload hooks, and ds is already up to date
+            db_adds.append((wark, int(lmod), sz, drd, fn, ip, int(at or 0)))
             db.n += 1
             tfa += 1
+            if thpre and sz:
+                self._th_pre(top, rd, fn, lmod)
+
             td = time.time() - db.t
             if db.n >= 4096 or td >= 60:
+                self._idx_add(db, db_adds, db_crcs)
                 self.log("commit {} new files".format(db.n))
                 db.c.connection.commit()
                 db.n = 0
                 db.t = time.time()
 
+        self._idx_add(db, db_adds, db_crcs)
+
         if not self.args.no_dhash:
             db.c.execute("delete from dh where d = ?", (drd,))  # type: ignore
             db.c.execute("insert into dh values (?,?)", (drd, dhash))  # type: ignore
@@ -1668,23 +1845,292 @@ class Up2k(object):
             return tfa, tnf, rsz
 
         # drop missing files
-        q = "select fn from up where rd = ?"
-        try:
-            c = db.c.execute(q, (rd,))
-        except:
-            c = db.c.execute(q, ("//" + w8b64enc(rd),))
-
-        hits = [w8b64dec(x[2:]) if x.startswith("//") else x for (x,) in c]
-        rm_files = [x for x in hits if x not in seen_files]
+        rm_files = [v for k, v in db_files.items() if k not in seen_files]
         n_rm = len(rm_files)
-        for fn in rm_files:
-            self.db_rm(db.c, rd, fn, 0)
+        self._idx_rm(db, [(drd, x[0]) for zl in rm_files for x in zl])
 
         if n_rm:
             self.log("forgot {} deleted files".format(n_rm))
 
         return tfa, tnf, rsz
 
+    def _th_pre(self, ptop: str, rd: str, fn: str, lmod: float) -> None:
+        thsrv = getattr(self.hub, "thumbsrv", None)
+        if thsrv:
+            thsrv.pregen(ptop, vjoin(rd, fn), lmod)
+
+    def _idx_ls(self, cdir: str) -> list[tuple[str, os.stat_result]]:
+        g = statdir(self.log_func, not self.args.no_scandir, True, cdir, False)
+        return sorted(g)
+
+    def _idx_rm(self, db: Dbw, rms: list[tuple[str, str]]) -> None:
+        """drop (rd, fn) from up, both as they appear in the db"""
+        if not rms:
+            return
+
+        zi = db.c.executemany("delete from up where rd = ? and fn = ?", rms).rowcount
+        self.volnfiles[db.c] -= zi
+
+    def _idx_add(
+        self,
+        db: Dbw,
+        adds: list[tuple[str, int, int, str, str, str, int]],
+        crcs: Optional[list[tuple[str, int]]] = None,
+    ) -> None:
+        """
+        insert (w, mt, sz, rd, fn, ip, at) into up; rd as it appears in the db,
+        and (w16, crc32) into cr
+        """
+        if crcs:
+            self._crc_add(db.c, crcs)
+            del crcs[:]
+
+        if not adds:
+            return
+
+        for n, zt in enumerate(adds):
+            try:
+                zt[4].encode("utf-8")
+            except:
+                zs = "//" + w8b64enc(zt[4])
+                adds[n] = (zt[0], zt[1], zt[2], zt[3], zs, zt[5], zt[6])
+
+        db.c.executemany("insert into up values (?,?,?,?,?,?,?)", adds)
+        self.volnfiles[db.c] += len(adds)
+        self.volsize[db.c] += sum([x[2] for x in adds])
+
+        del adds[:]
+
+    def _idx_hash(
+        self, abspath: str, sz: int, nohash: Any
+    ) -> Optional[tuple[list[str], int]]:
+        if nohash or not sz:
+            return None
+
+        if sz > 1024 * 1024:
+            self.log("file: {}".format(abspath))
+
+        assert self.pp  # !rm
+        pf = "a{}, ".format(self.pp.n)
+        hashes, _, crc = self._hashlist_from_file(abspath, pf, True)
+        return hashes, crc
+
+    def _idx_put(self, fun: Any, args: tuple[Any, ...]) -> IdxTask:
+        assert self.ipool  # !rm
+        task = IdxTask(fun, args)
+        self.ipool.put(task)
+        return task
+
+    def _idx_map(
+        self, db: Dbw, fun: Any, jobs: list[tuple[Any, tuple[Any, ...]]]
+    ) -> Generator[tuple[Any, Any, Optional[Exception]], None, None]:
+        """run fun(*args) for each job; yields (tag, retval, exception) in order"""
+        pend: list[tuple[Any, IdxTask]] = []
+        nwin = self.args.scan_mt * 2
+        njob = 0
+        while njob < len(jobs) or pend:
+            t0 = time.time()
+            if not self.ipool:
+                tag, args = jobs[njob]
+                njob += 1
+                task = IdxTask(fun, args)
+                try:
+                    task.ret = fun(*args)
+                except Exception as ex:
+                    task.ex = ex
+                task.ev.set()
+            else:
+                while njob < len(jobs) and len(pend) < nwin:
+                    tag, args = jobs[njob]
+                    njob += 1
+                    pend.append((tag, self._idx_put(fun, args)))
+
+                tag, task = pend.pop(0)
+
+            task.ev.wait()
+            db.th += time.time() - t0
+            yield tag, task.ret, task.ex
+
+    def _idx_thr(self, q: Queue[IdxTask]) -> None:
+        while True:
+            task = q.get()
+            try:
+                task.ret = task.fun(*task.args)
+            except Exception as ex:
+                task.ex = ex
+            task.ev.set()
+
+    def _fsw_sync(self, all_vols: list[VFS]) -> None:
+        """start/stop watching volumes with the inotify volflag"""
+        wvols = {}
+        for vol in all_vols:
+            if "inotify" in vol.flags and vol.realpath in self.cur:
+                wvols[vol.realpath] = self._idx_excl(vol, all_vols)
+
+        if not wvols and not self.fsw:
+            return
+
+        if not HAVE_INOTIFY:
+            t = "cannot watch %d volumes for changes; inotify is only available on linux"
+            self.log(t % (len(wvols),), 3)
+            return
+
+        if not self.fsw:
+            self.fsw = FsWatch(
+                self.log_func,
+                self._fsw_file,
+                self._fsw_dir,
+                self._fsw_gone,
+                self._fsw_lost,
+            )
+
+        self.log("watching %d volumes for changes" % (len(wvols),))
+        self.fsw.set_vols(wvols)
+
+    def _fsw_vol(self, ptop: str) -> Optional[VFS]:
+        for vol in self.vfs.all_vols.values():
+            if vol.realpath == ptop:
+                return vol
+        return None
+
+    def _fsw_file(self, ptop: str, rd: str, fn: str) -> None:
+        """fswatch: file appeared or changed; reindex unless db agrees"""
+        vol = self._fsw_vol(ptop)
+        abspath = djoin(ptop, rd, fn)
+        if not vol or fn.endswith(".PARTIAL"):
+            return
+
+        rei = vol.flags.get("noidx")
+        if rei and rei.search(abspath):
+            return
+
+        try:
+            st = bos.stat(abspath)
+        except:
+            return
+
+        with self.mutex:
+            cur = self.cur.get(ptop)
+            if not cur:
+                return
+
+            # uploads in progress are copyparty's business
+            with self.reg_mutex:
+                for job in (self.registry.get(ptop) or {}).values():
+                    if job["prel"] == rd and fn in (job["name"], job.get("tnam")):
+                        return
+
+            q = "select mt, sz from up where rd = ? and fn = ?"
+            try:
+                zt = cur.execute(q, (rd, fn)).fetchone()
+            except:
+                zt = cur.execute(q, s3enc(self.mem_cur, rd, fn)).fetchone()
+
+            if zt and zt[0] == int(st.st_mtime) and zt[1] == st.st_size:
+                return
+
+            if zt:
+                # modified in place; db_add only knows about the new size
+                self.db_rm(cur, rd, fn, zt[1])
+                self._fsw_ds(cur, vol.flags, rd, -1, -zt[1])
+
+        self.hash_file(ptop, vol.vpath, vol.flags, rd, fn, "", 0, "", True)
+
+    def _fsw_dir(self, ptop: str, rd: str) -> None:
+        """fswatch: new folder; index everything inside"""
+        assert self.fsw  # !rm
+        excl = self.fsw.vols.get(ptop) or set()
+        todo = [rd]
+        while todo and not self.stop:
+            rd = todo.pop()
+            ap = djoin(ptop, rd)
+            if ap in excl:
+                continue
+
+            for fn, inf in statdir(self.log_func, True, True, ap, False):
+                if stat.S_ISDIR(inf.st_mode):
+                    todo.append(vjoin(rd, fn))
+                elif stat.S_ISREG(inf.st_mode):
+                    self._fsw_file(ptop, rd, fn)
+
+    def _fsw_gone(self, ptop: str, rd: str, fn: str) -> None:
+        """fswatch: file or folder disappeared; forget it"""
+        vol = self._fsw_vol(ptop)
+        if not vol or "noforget" in vol.flags:
+            return
+
+        vrem = vjoin(rd, fn)
+        with self.mutex, self.reg_mutex:
+            cur = self.cur.get(ptop)
+            if not cur:
+                return
+
+            q = "select w, sz from up where rd = ? and fn = ?"
+            try:
+                hits = cur.execute(q, (rd, fn)).fetchall()
+            except:
+                hits = cur.execute(q, s3enc(self.mem_cur, rd, fn)).fetchall()
+
+            for w, sz in hits:
+                self._forget_file(ptop, vrem, cur, w, True, sz, False)
+                self._fsw_ds(cur, vol.flags, rd, -1, -sz)
+
+            # and if it was a folder, everything inside
+            n = nsz = 0
+            q = "select count(w), sum(sz) from up where (rd=? or rd like ?||'/%')"
+            for erd in [vrem, "//" + w8b64enc(vrem)]:
+                try:
+                    erd_erd = (erd, erd)
+                    n, nsz = cur.execute(q, erd_erd).fetchone()
+                    break
+                except:
+                    pass
+
+            if n:
+                nsz = nsz or 0
+                self.log("forgetting %d files in deleted folder [%s]" % (n, vrem))
+                for q in (
+                    "delete from up where (rd=? or rd like ?||'/%')",
+                    "delete from dh where (d=? or d like ?||'/%')",
+                    "delete from ds where (rd=? or rd like ?||'/%')",
+                ):
+                    cur.execute(q, erd_erd)  # type: ignore
+                self.volnfiles[cur] -= n
+                self.volsize[cur] -= nsz
+                self._fsw_ds(cur, vol.flags, rd, -n, -nsz)
+
+            if hits or n:
+                cur.connection.commit()
+
+    def _fsw_ds(
+        self, cur: "sqlite3.Cursor", flags: dict[str, Any], rd: str, nf: int, sz: int
+    ) -> None:
+        """fswatch: adjust the folder-size of rd and all its parents"""
+        if "nodirsz" in flags:
+            return
+
+        q = "update ds set nf=nf+?, sz=sz+? where rd=?"
+        try:
+            while True:
+                cur.execute(q, (nf, sz, rd))
+                if not rd:
+                    break
+                rd = rd.rsplit("/", 1)[0] if "/" in rd else ""
+        except:
+            pass  # mojibake rd; fixed by the next rescan
+
+    def _fsw_lost(self, ptop: str) -> None:
+        """fswatch: kernel dropped events; schedule a rescan of the volume"""
+        vol = self._fsw_vol(ptop)
+        if not vol:
+            return
+
+        with self.mutex:
+            self.need_rescan.add(vol.vpath)
+
+        with self.rescan_cond:
+            self.rescan_cond.notify_all()
+
     def _drop_lost(self, cur: "sqlite3.Cursor", top: str, excl: list[str]) -> int:
         rm = []
         n_rm = 0
@@ -1863,7 +2309,7 @@ class Up2k(object):
                         self.log("file: {}".format(abspath))
 
                     try:
-                        hashes, _ = self._hashlist_from_file(abspath, pf)
+                        hashes, _, _ = self._hashlist_from_file(abspath, pf)
                     except Exception as ex:
                         self.log("hash: {} @ [{}]".format(repr(ex), abspath))
                         continue
@@ -2319,7 +2765,7 @@ class Up2k(object):
             cur.connection.commit()
             if n_done:
                 self.log("mtp: scanned {} files in {}".format(n_done, ptop), c=6)
-                cur.execute("vacuum")
+                self._vacuum(cur)
 
             wcur.close()
             cur.close()
@@ -2585,6 +3031,7 @@ class Up2k(object):
             self._add_cv_tab(cur)
             self._add_idx_up_vp(cur, db_path)
             self._add_ds_tab(cur)
+            self._add_cr_tab(cur)
 
             try:
                 nfiles = next(cur.execute("select count(w) from up"))[0]
@@ -2700,6 +3147,7 @@ class Up2k(object):
         self._add_xiu_tab(cur)
         self._add_cv_tab(cur)
         self._add_ds_tab(cur)
+        self._add_cr_tab(cur)
         self.log("created DB at {}".format(db_path))
         return cur
 
@@ -2791,7 +3239,7 @@ class Up2k(object):
 
         self.log("upgrading db [%s]: writing to disk..." % (db_path,))
         cur.connection.commit()
-        cur.execute("vacuum")
+        self._vacuum(cur)
 
     def _add_ds_tab(self, cur: "sqlite3.Cursor") -> None:
         # v5d -> v5e
@@ -2809,6 +3257,104 @@ class Up2k(object):
 
         cur.connection.commit()
 
+    def _add_cr_tab(self, cur: "sqlite3.Cursor") -> None:
+        # v5e -> v5f
+        # crc32 of each file by wark, for seekable zip downloads
+        try:
+            cur.execute("select w, v from cr limit 1").fetchone()
+            return
+        except:
+            pass
+
+        for cmd in [
+            r"create table cr (w text, v int)",
+            r"create unique index cr_w on cr(w)",
+        ]:
+            cur.execute(cmd)
+
+        cur.connection.commit()
+
+    def _add_fts_tab(self, cur: "sqlite3.Cursor", db_path: str, want: bool) -> None:
+        # optional; trigram index of filenames and tag values, for u2idx,
+        # kept in sync with up/mt by triggers so every writer is covered
+        zs = "select 1 from sqlite_master where name = 'upf'"
+        have = bool(cur.execute(zs).fetchone())
+        if have:
+            try:
+                cur.execute("select rowid from upf limit 1").fetchone()
+            except:
+                # db from another machine, and this sqlite has no fts5;
+                # the triggers must go or every write will fail
+                want = False
+            if want:
+                return
+        elif not want:
+            return
+
+        if want:
+            t = "building fts index [%s], this may take a while..."
+            self.log(t % (db_path,))
+        else:
+            self.log("dropping fts index [%s]" % (db_path,))
+
+        ok = False
+        for tab, src, col in (("upf", "up", "fn"), ("mtf", "mt", "v")):
+            # triggers first; they would break writes if the fts5 module is gone
+            for zs in ("i", "d", "u"):
+                cur.execute("drop trigger if exists %s_%s" % (tab, zs))
+            try:
+                cur.execute("drop table if exists " + tab)
+            except:
+                pass
+
+            if not want:
+                continue
+
+            try:
+                zs = "create virtual table %s using fts5(%s, content='%s', tokenize='trigram')"
+                cur.execute(zs % (tab, col, src))
+                ok = True
+            except Exception as ex:
+                t = "cannot create fts index (need sqlite 3.34+ with fts5): %r"
+                self.log(t % (ex,), 3)
+                break
+
+            ins = "insert into %s(rowid, %s) values (new.rowid, new.%s);"
+            ins = ins % (tab, col, col)
+            rm = "insert into %s(%s, rowid, %s) values ('delete', old.rowid, old.%s);"
+            rm = rm % (tab, tab, col, col)
+            for zs in [
+                "create trigger %s_i after insert on %s begin %s end" % (tab, src, ins),
+                "create trigger %s_d after delete on %s begin %s end" % (tab, src, rm),
+                "create trigger %s_u after update of %s on %s begin %s %s end"
+                % (tab, col, src, rm, ins),
+                "insert into %s(%s) values ('rebuild')" % (tab, tab),
+            ]:
+                cur.execute(zs)
+
+        cur.connection.commit()
+        if want and ok:
+            self.log("fts index [%s] ready" % (db_path,))
+
+    def _vacuum(self, cur: "sqlite3.Cursor") -> None:
+        """mutex(main) me"""
+        fts = cur.execute("select 1 from sqlite_master where name = 'upf'").fetchone()
+        if fts:
+            zs = "select max(rowid) from "
+            ids = [cur.execute(zs + x).fetchone()[0] for x in ("up", "mt")]
+
+        cur.execute("vacuum")
+
+        if fts:
+            # sqlite is allowed to renumber rows without an INTEGER PRIMARY KEY
+            # (it does not in practice); fts entries point at the old ones
+            for tab, src, mx in zip(("upf", "mtf"), ("up", "mt"), ids):
+                zs = "select max(rowid) from " + src
+                if cur.execute(zs).fetchone()[0] != mx:
+                    self.log("rowids changed in vacuum; rebuilding " + tab, 3)
+                    cur.execute("insert into %s(%s) values ('rebuild')" % (tab, tab))
+                    cur.connection.commit()
+
     def wake_rescanner(self):
         with self.rescan_cond:
             self.rescan_cond.notify_all()
@@ -2976,7 +3522,7 @@ class Up2k(object):
                     break
                 else:
                     self.log("asserting contents of %s" % (orig_ap,))
-                    hashes2, st = self._hashlist_from_file(orig_ap)
+                    hashes2, st, _ = self._hashlist_from_file(orig_ap)
                     wark2 = up2k_wark_from_hashlist(self.salt, st.st_size, hashes2)
                     if dwark != wark2:
                         t = "will not dedup (fs index desync): fs=%s, db=%s, file: %s\n%s"
@@ -3048,7 +3594,7 @@ class Up2k(object):
 
                 elif inc_ap != orig_ap and not data_ok and "done" in reg[wark]:
                     self.log("asserting contents of %s" % (orig_ap,))
-                    hashes2, _ = self._hashlist_from_file(orig_ap)
+                    hashes2, _, _ = self._hashlist_from_file(orig_ap)
                     wark2 = up2k_wark_from_hashlist(self.salt, st.st_size, hashes2)
                     if wark != wark2:
                         t = "will not dedup (fs index desync): fs=%s, idx=%s, file: %s\n%s"
@@ -3353,6 +3899,20 @@ class Up2k(object):
         if self.args.nw:
             return
 
+        if "reflink" in flags:
+            csrc = src if bos.path.isfile(src) else fsrc or src
+            try:
+                if self.fstab.can_reflink(os.path.dirname(dst)):
+                    if rm and bos.path.exists(dst):
+                        wunlink(self.log, dst, flags)
+
+                    reflink(csrc, dst)
+                    if lmod:
+                        bos.utime(dst, (int(time.time()), int(lmod)), False)
+                    return
+            except Exception as ex:
+                self.log("cannot reflink: " + repr(ex))
+
         linked = False
         try:
             if not flags.get("dedup"):
@@ -3420,7 +3980,7 @@ class Up2k(object):
                 t = "BUG: no valid sources to link from! orig(%s) fsrc(%s) link(%s)"
                 self.log(t, 1)
                 raise Exception(t % (src, fsrc, dst))
-            shutil.copy2(fsenc(csrc), fsenc(dst))
+            fcopy(csrc, dst, flags)
 
         if lmod and (not linked or SYMTIME):
             times = (int(time.time()), int(lmod))
@@ -3429,7 +3989,8 @@ class Up2k(object):
     def handle_chunks(
         self, ptop: str, wark: str, chashes: list[str]
     ) -> tuple[list[str], int, list[list[int]], str, float, int, bool]:
-        with self.mutex, self.reg_mutex:
+        # only touches the registry; no need to wait for the db
+        with self.reg_mutex:
             self.db_act = self.vol_act[ptop] = time.time()
             job = self.registry[ptop].get(wark)
             if not job:
@@ -3440,16 +4001,12 @@ class Up2k(object):
             if "t0c" not in job:
                 job["t0c"] = time.time()
 
+            ix = self._chunk_idx(ptop, job)
             if len(chashes) > 1 and len(chashes[1]) < 44:
                 # first hash is full-length; expand remaining ones
-                uniq = []
-                lut = set()
-                for chash in job["hash"]:
-                    if chash not in lut:
-                        uniq.append(chash)
-                        lut.add(chash)
+                uniq = ix.uniq
                 try:
-                    nchunk = uniq.index(chashes[0])
+                    nchunk = ix.upos[chashes[0]]
                 except:
                     raise Pebkac(400, "unknown chunk0 [%s]" % (chashes[0],))
                 expanded = [chashes[0]]
@@ -3463,18 +4020,18 @@ class Up2k(object):
                 chashes = expanded
 
             for chash in chashes:
-                if chash not in job["need"]:
+                if chash not in ix.need:
                     msg = "chash = {} , need:\n".format(chash)
                     msg += "\n".join(job["need"])
                     self.log(msg)
                     t = "already got that (%s) but thanks??"
-                    if chash not in job["hash"]:
+                    if chash not in ix.ofs:
                         t = "unknown chunk wtf: %s"
                     raise Pebkac(400, t % (chash,))
 
                 if chash in job["busy"]:
                     nh = len(job["hash"])
-                    idx = job["hash"].index(chash)
+                    idx = ix.ofs[chash][0]
                     t = "that chunk is already being written to:\n  {}\n  {} {}/{}\n  {}"
                     raise Pebkac(400, t.format(wark, chash, idx, nh, job["name"]))
 
@@ -3484,7 +4041,7 @@ class Up2k(object):
             coffsets = []
             nchunks = []
             for chash in chashes:
-                nchunk = [n for n, v in enumerate(job["hash"]) if v == chash]
+                nchunk = ix.ofs.get(chash)
                 if not nchunk:
                     raise Pebkac(400, "unknown chunk %s" % (chash,))
 
@@ -3513,29 +4070,34 @@ class Up2k(object):
 
         return chashes, chunksize, coffsets, path, job["lmod"], job["size"], job["sprs"]
 
+    def _chunk_idx(self, ptop: str, job: dict[str, Any]) -> ChunkIdx:
+        """mutex(reg) me"""
+        k = (ptop, job["wark"])
+        ix = self.chunk_idx.get(k)
+        if not ix or not ix.valid(job):
+            ix = self.chunk_idx[k] = ChunkIdx(job)
+        return ix
+
     def fast_confirm_chunks(
         self, ptop: str, wark: str, chashes: list[str]
     ) -> tuple[int, str]:
-        if not self.mutex.acquire(False):
-            return -1, ""
         if not self.reg_mutex.acquire(False):
-            self.mutex.release()
             return -1, ""
         try:
             return self._confirm_chunks(ptop, wark, chashes, chashes)
         finally:
             self.reg_mutex.release()
-            self.mutex.release()
 
     def confirm_chunks(
         self, ptop: str, wark: str, written: list[str], locked: list[str]
     ) -> tuple[int, str]:
-        with self.mutex, self.reg_mutex:
+        with self.reg_mutex:
             return self._confirm_chunks(ptop, wark, written, locked)
 
     def _confirm_chunks(
         self, ptop: str, wark: str, written: list[str], locked: list[str]
     ) -> tuple[int, str]:
+        """mutex(reg) me"""
         if True:
             self.db_act = self.vol_act[ptop] = time.time()
             try:
@@ -3549,9 +4111,16 @@ class Up2k(object):
             for chash in locked:
                 job["busy"].pop(chash, None)
 
+            ix = self._chunk_idx(ptop, job)
+            cc = self.snap_cc.get(ptop)
             try:
                 for chash in written:
+                    ix.need.remove(chash)
+                    # list is kept for the client protocol and the snap;
+                    # usually a hit at the very start of the list
                     job["need"].remove(chash)
+                    if cc is not None:
+                        cc.append((wark, chash))
             except Exception as ex:
                 # dead tcp connections can get here by timeout (OK)
                 return -2, "confirm_chunk, chash(%s) %r" % (chash, ex)  # type: ignore
@@ -3560,6 +4129,8 @@ class Up2k(object):
             if ret > 0:
                 return ret, src
 
+            self.chunk_idx.pop((ptop, wark), None)
+
             if self.args.nw:
                 self.regdrop(ptop, wark)
 
@@ -3653,7 +4224,7 @@ class Up2k(object):
             cur.connection.commit()
 
     def regdrop(self, ptop: str, wark: str) -> None:
-        """mutex(main,reg) me"""
+        """mutex(reg) me"""
         olds = self.droppable[ptop]
         if wark:
             olds.append(wark)
@@ -3719,8 +4290,30 @@ class Up2k(object):
             self.tagq.put((ptop, dwark, rd, fn, sz, ip, at))
             self.n_tagq += 1
 
+        if sz and "thpre" in vflags:
+            self._th_pre(ptop, rd, fn, lmod)
+
         return True
 
+    def crc_add(self, ptop: str, crcs: list[tuple[str, int]]) -> None:
+        """
+        remember the crc32 of some files (by wark[:16]) for StoreZip;
+        either from hashing, or computed by httpcli during a zip download
+        """
+        with self.mutex:
+            cur = self.cur.get(ptop)
+            if not cur:
+                return
+
+            try:
+                self._crc_add(cur, crcs)
+                cur.connection.commit()
+            except:
+                self.log("crc_add failed: %s" % (min_ex(),), 3)
+
+    def _crc_add(self, cur: "sqlite3.Cursor", crcs: list[tuple[str, int]]) -> None:
+        cur.executemany("insert or replace into cr values (?,?)", crcs)
+
     def db_rm(self, db: "sqlite3.Cursor", rd: str, fn: str, sz: int) -> None:
         sql = "delete from up where rd = ? and fn = ?"
         try:
@@ -4231,7 +4824,7 @@ class Up2k(object):
             b1, b2 = fsenc(sabs), fsenc(dabs)
             is_link = os.path.islink(b1)  # due to _relink
             try:
-                shutil.copy2(b1, b2)
+                fcopy(sabs, dabs, dvn.flags)
             except:
                 try:
                     wunlink(self.log, dabs, dvn.flags)
@@ -4525,7 +5118,7 @@ class Up2k(object):
             b1, b2 = fsenc(sabs), fsenc(dabs)
             is_link = os.path.islink(b1)  # due to _relink
             try:
-                shutil.copy2(b1, b2)
+                fcopy(sabs, dabs, dvn.flags)
             except:
                 try:
                     wunlink(self.log, dabs, dvn.flags)
@@ -4813,23 +5406,33 @@ class Up2k(object):
         return wark
 
     def _hashlist_from_file(
-        self, path: str, prefix: str = ""
-    ) -> tuple[list[str], os.stat_result]:
+        self, path: str, prefix: str = "", want_crc: bool = False
+    ) -> tuple[list[str], os.stat_result, int]:
+        """returns (hashlist, stat, crc32); crc32 is 0 unless want_crc"""
         st = bos.stat(path)
         fsz = st.st_size
         csz = up2k_chunksize(fsz)
         ret = []
+        crc = 0
+        want_crc = want_crc and not self.args.no_zipcrc
         suffix = " MB, {}".format(path)
         with open(fsenc(path), "rb", self.args.iobuf) as f:
             if self.mth and fsz >= 1024 * 512:
-                tlt = self.mth.hash(f, fsz, csz, self.pp, prefix, suffix)
+                tlt = self.mth.hash(f, fsz, csz, self.pp, prefix, suffix, want_crc)
                 ret = [x[0] for x in tlt]
                 fsz = 0
+                if want_crc:
+                    op = crc32_op(csz)
+                    crc = tlt[0][3]
+                    for _, _, zi, ccrc in tlt[1:]:
+                        if zi != csz:
+                            op = crc32_op(zi)
+                        crc = crc32_combine(crc, ccrc, op)
 
             while fsz > 0:
-                # same as `hash_at` except for `imutex` / bufsz
+                # same as `hash_at` except for pread / bufsz
                 if self.stop:
-                    return [], st
+                    return [], st, 0
 
                 if self.pp:
                     mb = fsz // (1024 * 1024)
@@ -4844,12 +5447,14 @@ class Up2k(object):
                         raise Exception("EOF at " + str(f.tell()))
 
                     hashobj.update(buf)
+                    if want_crc:
+                        crc = zlib.crc32(buf, crc)
                     rem -= len(buf)
 
                 digest = hashobj.digest()[:33]
                 ret.append(ub64enc(digest).decode("ascii"))
 
-        return ret, st
+        return ret, st, crc & 0xFFFFFFFF
 
     def _new_upload(self, job: dict[str, Any], vfs: VFS, depth: int) -> dict[str, str]:
         pdir = djoin(job["ptop"], job["prel"])
@@ -4989,15 +5594,46 @@ class Up2k(object):
                 self.do_snapshot()
 
     def do_snapshot(self) -> None:
-        with self.mutex, self.reg_mutex:
-            for k, reg in self.registry.items():
-                self._snap_reg(k, reg)
+        with self.snap_mutex:
+            snaps = []
+            with self.mutex, self.reg_mutex:
+                for k, reg in self.registry.items():
+                    zt = self._snap_reg(k, reg)
+                    if zt:
+                        snaps.append(zt)
+
+                for (ptop, wark), ix in list(self.chunk_idx.items()):
+                    if self.registry.get(ptop, {}).get(wark) is not ix.job:
+                        del self.chunk_idx[(ptop, wark)]
 
-    def _snap_reg(self, ptop: str, reg: dict[str, dict[str, Any]]) -> None:
+            # compress and write without holding up the uploads
+            for ptop, path, j, etag, t0 in snaps:
+                try:
+                    if etag:
+                        self._snap_write(path, j)
+                        self.snap_prev[ptop] = etag
+                        zs = "snap: %s |%d| %.2fs"
+                        self.log(zs % (path, etag[0], time.time() - t0))
+                    else:
+                        self._snap_append(path, j)
+                except:
+                    # journal is now out of sync; start over next time
+                    self.snap_jobs.pop(ptop, None)
+                    self.snap_prev.pop(ptop, None)
+                    raise
+
+    def _snap_reg(
+        self, ptop: str, reg: dict[str, dict[str, Any]]
+    ) -> Optional[tuple[str, str, bytes, Optional[tuple[int, float]], float]]:
+        """
+        mutex(main,reg) me;
+        drops abandoned uploads and returns the snapshot to write, if changed;
+        either the full registry (with an etag) or a journal of changes since
+        """
         now = time.time()
         histpath = self.vfs.histtab.get(ptop)
         if not histpath:
-            return
+            return None
 
         idrop = self.args.snap_drop * 60
         rm = [x for x in reg.values() if x["need"] and now - x["poke"] >= idrop]
@@ -5037,15 +5673,31 @@ class Up2k(object):
                     pass
 
         if self.args.nw or self.args.no_snap:
-            return
+            return None
 
         path = os.path.join(histpath, "up2k.snap")
+        cc = self.snap_cc.get(ptop)
+        if cc is not None:
+            self.snap_cc[ptop] = []
+
         if not reg:
-            if ptop not in self.snap_prev or self.snap_prev[ptop] is not None:
+            zb = ptop not in self.snap_prev or self.snap_prev[ptop] is not None
+            if zb or self.snap_jobs.get(ptop):
                 self.snap_prev[ptop] = None
-                if bos.path.exists(path):
-                    bos.unlink(path)
-            return
+                for zs in (path, path + ".jnl"):
+                    if bos.path.exists(zs):
+                        bos.unlink(zs)
+            if cc is not None:
+                self.snap_jobs[ptop] = {}
+                self.snap_drp[ptop] = []
+            return None
+
+        if bos.makedirs(histpath):
+            hidedir(histpath)
+
+        prev = self.snap_jobs.get(ptop)
+        if cc is not None and prev is not None:
+            return self._snap_jnl(ptop, path, reg, prev, cc, now)
 
         newest = float(
             max(x["t0"] if "done" in x else x["poke"] for _, x in reg.items())
@@ -5054,24 +5706,97 @@ class Up2k(object):
         )
         etag = (len(reg), newest)
         if etag == self.snap_prev.get(ptop):
-            return
+            return None
 
-        if bos.makedirs(histpath):
-            hidedir(histpath)
+        if cc is not None:
+            # full snapshot; journal from here on
+            self.snap_jobs[ptop] = {k: snap_fp(v) for k, v in reg.items()}
+            self.snap_drp[ptop] = self.droppable[ptop][:]
+
+        j = snap_body(reg, self.droppable[ptop])
+        return ptop, path, j, etag, now
+
+    def _snap_jnl(
+        self,
+        ptop: str,
+        path: str,
+        reg: dict[str, dict[str, Any]],
+        prev: dict[str, list[Any]],
+        cc: list[tuple[str, str]],
+        now: float,
+    ) -> Optional[tuple[str, str, bytes, Optional[tuple[int, float]], float]]:
+        """
+        mutex(main,reg) me;
+        collects everything that changed since the previous snapshot;
+        the cost depends on the number of changes, not the size of the registry
+        (apart from a quick look at each job's metadata, excluding chunks)
+        """
+        ret = []
+
+        chashes: dict[str, list[str]] = {}
+        for wark, chash in cc:
+            try:
+                chashes[wark].append(chash)
+            except:
+                chashes[wark] = [chash]
+
+        for wark, zsl in chashes.items():
+            ret.append(["c", wark, zsl])
+
+        for wark, job in reg.items():
+            fp = snap_fp(job)
+            if prev.get(wark) != fp:
+                prev[wark] = fp
+                ret.append(["j", job])
+
+        if len(prev) > len(reg):
+            for wark in [x for x in prev if x not in reg]:
+                del prev[wark]
+                ret.append(["d", wark])
+
+        drp = self.droppable[ptop]
+        if drp != self.snap_drp.get(ptop):
+            self.snap_drp[ptop] = drp[:]
+            ret.append(["drp", drp])
 
+        if not ret:
+            return None
+
+        zsl = [json.dumps(x, separators=(",", ":")) for x in ret]
+        j = ("\n".join(zsl) + "\n").encode("utf-8")
+        return ptop, path, j, None, now
+
+    def _snap_write(self, path: str, j: bytes) -> None:
+        """replace the full snapshot, and drop the journal which is now part of it"""
         path2 = "{}.{}".format(path, os.getpid())
-        body = {"droppable": self.droppable[ptop], "registry": reg}
-        j = json.dumps(body, sort_keys=True, separators=(",\n", ": ")).encode("utf-8")
-        # j = re.sub(r'"(need|hash)": \[\],\n', "", j)  # bytes=slow, utf8=hungry
-        j = j.replace(b'"need": [],\n', b"")  # surprisingly optimal
-        j = j.replace(b'"hash": [],\n', b"")
         with gzip.GzipFile(path2, "wb") as f:
             f.write(j)
 
         atomic_move(self.log, path2, path, VF_CAREFUL)
+        if bos.path.exists(path + ".jnl"):
+            bos.unlink(path + ".jnl")
+
+    def _snap_append(self, path: str, j: bytes) -> None:
+        jpath = path + ".jnl"
+        with open(fsenc(jpath), "ab") as f:
+            f.write(j)
+            jsz = f.tell()
+
+        try:
+            bsz = bos.path.getsize(path)
+        except:
+            bsz = 0
+
+        if jsz < max(bsz, 1024 * 1024):
+            return
 
-        self.log("snap: %s |%d| %.2fs" % (path, len(reg), time.time() - now))
-        self.snap_prev[ptop] = etag
+        # fold the journal into the full snapshot;
+        # only reads files, so the registry stays available meanwhile
+        t0 = time.time()
+        reg, drp = snap_load(path)
+        self._snap_write(path, snap_body(reg, drp))
+        t = "snap: %s |%d| compacted %d KiB journal in %.2fs"
+        self.log(t % (path, len(reg), jsz // 1024, time.time() - t0))
 
     def _tagger(self) -> None:
         with self.mutex:
@@ -5154,16 +5879,19 @@ class Up2k(object):
         abspath = djoin(ptop, rd, fn)
         self.log("hashing " + abspath)
         inf = bos.stat(abspath)
+        crcs = []
         if not inf.st_size:
             wark = up2k_wark_from_metadata(
                 self.salt, inf.st_size, int(inf.st_mtime), rd, fn
             )
         else:
-            hashes, _ = self._hashlist_from_file(abspath)
+            hashes, _, crc = self._hashlist_from_file(abspath, "", True)
             if not hashes:
                 return False
 
             wark = up2k_wark_from_hashlist(self.salt, inf.st_size, hashes)
+            if not self.args.no_zipcrc:
+                crcs.append((wark[:16], crc))
 
         with self.mutex, self.reg_mutex:
             self.idx_wark(
@@ -5183,6 +5911,9 @@ class Up2k(object):
                 skip_xau,
             )
 
+        if crcs:
+            self.crc_add(ptop, crcs)
+
         if at and time.time() - at > 30:
             with self.rescan_cond:
                 self.rescan_cond.notify_all()
@@ -5269,6 +6000,12 @@ class Up2k(object):
         if self.mth:
             self.mth.stop = True
 
+        if self.fsw:
+            self.fsw.shutdown()
+
+        if self.mtag:
+            self.mtag.shutdown()
+
         # in case we're killed early
         for x in list(self.spools):
             self._unspool(x)
@@ -5300,6 +6037,78 @@ class Up2k(object):
         self.registry = {}
 
 
+def snap_fp(job: dict[str, Any]) -> list[Any]:
+    """job metadata, to detect changes which are not confirmed chunks"""
+    ret: list[Any] = [id(job)]
+    ret.extend([x for x in job.items() if x[0] not in SNAP_VOLATILE])
+    return ret
+
+
+def snap_body(reg: dict[str, dict[str, Any]], drp: Optional[list[str]]) -> bytes:
+    body = {"droppable": drp, "registry": reg}
+    j = json.dumps(body, sort_keys=True, separators=(",\n", ": ")).encode("utf-8")
+    # j = re.sub(r'"(need|hash)": \[\],\n', "", j)  # bytes=slow, utf8=hungry
+    j = j.replace(b'"need": [],\n', b"")  # surprisingly optimal
+    j = j.replace(b'"hash": [],\n', b"")
+    return j
+
+
+def snap_load(
+    path: str,
+) -> tuple[dict[str, dict[str, Any]], Optional[list[str]]]:
+    """
+    reads up2k.snap and replays the journal (up2k.snap.jnl) on top;
+    returns registry and droppables (None if unknown)
+    """
+    reg: dict[str, dict[str, Any]] = {}
+    drp = None
+    if bos.path.exists(path):
+        with gzip.GzipFile(path, "rb") as f:
+            j = f.read().decode("utf-8")
+
+        reg = json.loads(j)
+        try:
+            drp = reg["droppable"]
+            reg = reg["registry"]
+        except:
+            pass
+
+    jpath = path + ".jnl"
+    if not bos.path.exists(jpath):
+        return reg, drp
+
+    # confirmed chunks since the most recent full copy of each job
+    cc: dict[str, set[str]] = {}
+    with open(fsenc(jpath), "rb") as f:
+        for ln in f:
+            try:
+                x = json.loads(ln.decode("utf-8"))
+            except:
+                continue  # torn write from a crash
+
+            k = x[0]
+            if k == "c":
+                try:
+                    cc[x[1]].update(x[2])
+                except:
+                    cc[x[1]] = set(x[2])
+            elif k == "j":
+                reg[x[1]["wark"]] = x[1]
+                cc.pop(x[1]["wark"], None)
+            elif k == "d":
+                reg.pop(x[1], None)
+                cc.pop(x[1], None)
+            elif k == "drp":
+                drp = x[1]
+
+    for wark, zss in cc.items():
+        job = reg.get(wark)
+        if job and job.get("need"):
+            job["need"] = [x for x in job["need"] if x not in zss]
+
+    return reg, drp
+
+
 def up2k_chunksize(filesize: int) -> int:
     chunksize = 1024 * 1024
     stepsize = 512 * 1024
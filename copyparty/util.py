@@ -26,6 +26,7 @@ import sys
 import threading
 import time
 import traceback
+import zlib
 from collections import Counter
 
 from ipaddress import IPv4Address, IPv4Network, IPv6Address, IPv6Network
@@ -644,6 +645,58 @@ class Cooldown(object):
             return ret
 
 
+class StatLock(object):
+    """
+    threading.Lock which keeps track of how often it was taken,
+    how often someone had to wait for it, and for how long;
+    counters are only modified while holding the lock
+    """
+
+    def __init__(self) -> None:
+        self.lk = threading.Lock()
+        self.n = 0  # acquired
+        self.nw = 0  # had to wait
+        self.tw = 0.0  # total wait (sec)
+        self.mw = 0.0  # longest wait (sec)
+
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        if self.lk.acquire(False):
+            self.n += 1
+            return True
+
+        if not blocking:
+            return False
+
+        t0 = time.time()
+        if PY2:
+            ok = self.lk.acquire()
+        else:
+            ok = self.lk.acquire(True, timeout)
+
+        if ok:
+            td = time.time() - t0
+            self.n += 1
+            self.nw += 1
+            self.tw += td
+            if td > self.mw:
+                self.mw = td
+
+        return ok
+
+    def release(self) -> None:
+        self.lk.release()
+
+    def __enter__(self) -> bool:
+        return self.acquire()
+
+    def __exit__(self, *a: Any) -> None:
+        self.lk.release()
+
+    def stats(self) -> list[float]:
+        """acquired, contended, total wait, max wait"""
+        return [self.n, self.nw, self.tw, self.mw]
+
+
 class HLog(logging.Handler):
     def __init__(self, log_func: "RootLogger") -> None:
         logging.Handler.__init__(self)
@@ -798,6 +851,33 @@ class _Unrecv(object):
 
         return ret
 
+    def recv_into(self, mv: memoryview, spins: int = 1) -> int:
+        """like recv, but into a preallocated buffer"""
+        if self.buf:
+            n = min(len(mv), len(self.buf))
+            mv[:n] = self.buf[:n]
+            self.buf = self.buf[n:]
+            return n
+
+        while True:
+            try:
+                n = self.s.recv_into(mv)
+                break
+            except socket.timeout:
+                spins -= 1
+                if spins <= 0:
+                    n = 0
+                    break
+                continue
+            except:
+                n = 0
+                break
+
+        if not n:
+            raise UnrecvEOF("client stopped sending data")
+
+        return n
+
     def recv_ex(self, nbytes: int, raise_on_trunc: bool = True) -> bytes:
         """read an exact number of bytes"""
         ret = b""
@@ -852,6 +932,11 @@ class _LUnrecv(object):
 
         return ret
 
+    def recv_into(self, mv: memoryview, spins: int = 1) -> int:
+        ret = self.recv(len(mv), spins)
+        mv[: len(ret)] = ret
+        return len(ret)
+
     def recv_ex(self, nbytes: int, raise_on_trunc: bool = True) -> bytes:
         """read an exact number of bytes"""
         try:
@@ -888,6 +973,30 @@ class _LUnrecv(object):
 Unrecv = _Unrecv
 
 
+class BufPool(object):
+    """
+    recycles bytearrays for read_socket_into
+    """
+
+    def __init__(self, bufsz: int, maxbufs: int) -> None:
+        self.bufsz = bufsz
+        self.maxbufs = maxbufs
+        self.bufs: list[bytearray] = []
+        self.mutex = threading.Lock()
+
+    def get(self) -> bytearray:
+        with self.mutex:
+            if self.bufs:
+                return self.bufs.pop()
+
+        return bytearray(self.bufsz)
+
+    def put(self, buf: bytearray) -> None:
+        with self.mutex:
+            if len(self.bufs) < self.maxbufs:
+                self.bufs.append(buf)
+
+
 class CachedSet(object):
     def __init__(self, maxage: float) -> None:
         self.c: dict[Any, float] = {}
@@ -1045,17 +1154,13 @@ class ProgressPrinter(threading.Thread):
 
 
 class MTHash(object):
-    def __init__(self, cores: int):
+    def __init__(self, cores: int, pread: bool = True):
         self.pp: Optional[ProgressPrinter] = None
-        self.f: Optional[typing.BinaryIO] = None
-        self.sz = 0
-        self.csz = 0
         self.stop = False
+        self.pread = pread and hasattr(os, "pread")
         self.readsz = 1024 * 1024 * (2 if (RAM_AVAIL or 2) < 1 else 12)
         self.omutex = threading.Lock()
-        self.imutex = threading.Lock()
-        self.work_q: Queue[int] = Queue()
-        self.done_q: Queue[tuple[int, str, int, int]] = Queue()
+        self.work_q: Queue[tuple[list[Any], int]] = Queue()
         self.thrs = []
         for n in range(cores):
             t = Daemon(self.worker, "mth-" + str(n))
@@ -1069,76 +1174,135 @@ class MTHash(object):
         pp: Optional[ProgressPrinter] = None,
         prefix: str = "",
         suffix: str = "",
-    ) -> list[tuple[str, int, int]]:
+        crc: bool = False,
+    ) -> list[tuple[str, int, int, int]]:
+        """returns [(digest, ofs, sz, crc32)], crc32 is 0 unless crc"""
+        if self.pread:
+            # each worker does its own positional reads, so several
+            # files can be hashed at the same time by different callers
+            return self._hash(f, fsz, chunksz, pp, prefix, suffix, crc)
+
         with self.omutex:
-            self.f = f
-            self.sz = fsz
-            self.csz = chunksz
-
-            chunks: dict[int, tuple[str, int, int]] = {}
-            nchunks = int(math.ceil(fsz / chunksz))
-            for nch in range(nchunks):
-                self.work_q.put(nch)
-
-            ex = ""
-            for nch in range(nchunks):
-                qe = self.done_q.get()
-                try:
-                    nch, dig, ofs, csz = qe
-                    chunks[nch] = (dig, ofs, csz)
-                except:
-                    ex = ex or str(qe)
+            return self._hash(f, fsz, chunksz, pp, prefix, suffix, crc)
+
+    def _hash(
+        self,
+        f: typing.BinaryIO,
+        fsz: int,
+        chunksz: int,
+        pp: Optional[ProgressPrinter],
+        prefix: str,
+        suffix: str,
+        crc: bool,
+    ) -> list[tuple[str, int, int, int]]:
+        done_q: Queue[tuple[int, str, int, int, int]] = Queue()
+        fd = f.fileno() if self.pread else -1
+        job = [f, fd, fsz, chunksz, threading.Lock(), done_q, crc]
+
+        chunks: dict[int, tuple[str, int, int, int]] = {}
+        nchunks = int(math.ceil(fsz / chunksz))
+        for nch in range(nchunks):
+            self.work_q.put((job, nch))
+
+        ex = ""
+        for nch in range(nchunks):
+            qe = done_q.get()
+            try:
+                nch, dig, ofs, csz, ccrc = qe
+                chunks[nch] = (dig, ofs, csz, ccrc)
+            except:
+                ex = ex or str(qe)
 
-                if pp:
-                    mb = (fsz - nch * chunksz) // (1024 * 1024)
-                    pp.msg = prefix + str(mb) + suffix
+            if pp:
+                mb = (fsz - nch * chunksz) // (1024 * 1024)
+                pp.msg = prefix + str(mb) + suffix
 
-            if ex:
-                raise Exception(ex)
+        if ex:
+            raise Exception(ex)
 
-            ret = []
-            for n in range(nchunks):
-                ret.append(chunks[n])
+        ret = []
+        for n in range(nchunks):
+            ret.append(chunks[n])
 
-            self.f = None
-            self.csz = 0
-            self.sz = 0
-            return ret
+        return ret
 
     def worker(self) -> None:
         while True:
-            ofs = self.work_q.get()
+            job, nch = self.work_q.get()
             try:
-                v = self.hash_at(ofs)
+                v = self.hash_at(job, nch)
             except Exception as ex:
                 v = str(ex)  # type: ignore
 
-            self.done_q.put(v)
+            job[5].put(v)
 
-    def hash_at(self, nch: int) -> tuple[int, str, int, int]:
-        f = self.f
-        ofs = ofs0 = nch * self.csz
-        chunk_sz = chunk_rem = min(self.csz, self.sz - ofs)
+    def hash_at(self, job: list[Any], nch: int) -> tuple[int, str, int, int, int]:
+        f, fd, sz, csz, imutex, _, want_crc = job
+        ofs = ofs0 = nch * csz
+        chunk_sz = chunk_rem = min(csz, sz - ofs)
         if self.stop:
-            return nch, "", ofs0, chunk_sz
+            return nch, "", ofs0, chunk_sz, 0
 
-        assert f  # !rm
+        crc = 0
         hashobj = hashlib.sha512()
         while chunk_rem > 0:
-            with self.imutex:
-                f.seek(ofs)
-                buf = f.read(min(chunk_rem, self.readsz))
+            if fd >= 0:
+                buf = os.pread(fd, min(chunk_rem, self.readsz), ofs)
+            else:
+                with imutex:
+                    f.seek(ofs)
+                    buf = f.read(min(chunk_rem, self.readsz))
 
             if not buf:
                 raise Exception("EOF at " + str(ofs))
 
             hashobj.update(buf)
+            if want_crc:
+                crc = zlib.crc32(buf, crc)
             chunk_rem -= len(buf)
             ofs += len(buf)
 
         bdig = hashobj.digest()[:33]
         udig = ub64enc(bdig).decode("ascii")
-        return nch, udig, ofs0, chunk_sz
+        return nch, udig, ofs0, chunk_sz, crc & 0xFFFFFFFF
+
+
+def _gf2_times(mat: list[int], vec: int) -> int:
+    ret = 0
+    n = 0
+    while vec:
+        if vec & 1:
+            ret ^= mat[n]
+        vec >>= 1
+        n += 1
+    return ret
+
+
+def crc32_op(nbytes: int) -> list[int]:
+    """
+    the gf(2) operator which appends nbytes of zeros to a crc32;
+    see crc32_combine (same thing as zlib's, but reusable since
+    all the up2k chunks in a file are the same size except the last)
+    """
+    # one zero bit, then square it up to one zero byte
+    mat = [0xEDB88320] + [1 << n for n in range(31)]
+    for _ in range(3):
+        mat = [_gf2_times(mat, x) for x in mat]
+
+    ret = [1 << n for n in range(32)]
+    while nbytes:
+        if nbytes & 1:
+            ret = [_gf2_times(mat, x) for x in ret]
+        nbytes >>= 1
+        if nbytes:
+            mat = [_gf2_times(mat, x) for x in mat]
+
+    return ret
+
+
+def crc32_combine(crc1: int, crc2: int, op: list[int]) -> int:
+    """crc32 of a+b given crc32(a), crc32(b) and crc32_op(len(b))"""
+    return _gf2_times(op, crc1) ^ crc2
 
 
 class HMaccas(object):
@@ -1697,8 +1861,16 @@ class MultipartParser(object):
         raise Pebkac(400, "server expected a multipart header but you never sent one")
 
     def _read_data(self) -> Generator[bytes, None, None]:
-        blen = len(self.boundary)
+        """
+        yields the field value until the next boundary, as memoryview slices
+        of each recv; the only thing carried over between reads is the end of
+        the buffer, and only when it could be the start of the boundary
+        """
+        bnd = self.boundary
+        blen = len(bnd)
+        b0 = bnd[:1]
         bufsz = self.args.s_rd_sz
+        tail = b""
         while True:
             try:
                 buf = self.sr.recv(bufsz)
@@ -1706,43 +1878,41 @@ class MultipartParser(object):
                 # abort: client disconnected
                 raise Pebkac(400, "client d/c during multipart post")
 
-            while True:
-                ofs = buf.find(self.boundary)
-                if ofs != -1:
-                    self.sr.unrecv(buf[ofs + blen :])
-                    yield buf[:ofs]
-                    return
-
-                d = len(buf) - blen
-                if d > 0:
-                    # buffer growing large; yield everything except
-                    # the part at the end (maybe start of boundary)
-                    yield buf[:d]
-                    buf = buf[d:]
-
-                # look for boundary near the end of the buffer
-                n = 0
-                for n in range(1, len(buf) + 1):
-                    if not buf[-n:] in self.boundary:
-                        n -= 1
-                        break
-
-                if n == 0 or not self.boundary.startswith(buf[-n:]):
-                    # no boundary contents near the buffer edge
-                    break
+            if tail:
+                if len(buf) < blen:
+                    # tiny read; too short to rule anything out
+                    buf = tail + buf
+                else:
+                    # boundary split across the previous read and this one
+                    zb = tail + buf[: blen - 1]
+                    ofs = zb.find(bnd)
+                    if ofs != -1:
+                        self.sr.unrecv(buf[ofs + blen - len(tail) :])
+                        yield zb[:ofs]
+                        return
+
+                    yield tail
+                tail = b""
+
+            ofs = buf.find(bnd)
+            if ofs != -1:
+                self.sr.unrecv(buf[ofs + blen :])
+                yield buf[:ofs] if PY2 else memoryview(buf)[:ofs]  # type: ignore
+                return
 
-                if blen == n:
-                    # EOF: found boundary
-                    yield buf[:-n]
-                    return
+            # hold back the end of the buffer if it is a partial boundary
+            nbuf = len(buf)
+            ofs = buf.find(b0, max(0, nbuf - blen + 1))
+            while ofs != -1 and not buf.startswith(bnd[: nbuf - ofs], ofs):
+                ofs = buf.find(b0, ofs + 1)
 
-                try:
-                    buf += self.sr.recv(bufsz)
-                except:
-                    # abort: client disconnected
-                    raise Pebkac(400, "client d/c during multipart post")
+            if ofs == -1:
+                ofs = nbuf
+            else:
+                tail = buf[ofs:]
 
-            yield buf
+            if ofs:
+                yield buf[:ofs] if PY2 else memoryview(buf)[:ofs]  # type: ignore
 
     def _run_gen(
         self,
@@ -1789,7 +1959,7 @@ class MultipartParser(object):
             if not junk:
                 continue
 
-            jtxt = junk.decode("utf-8", "replace")
+            jtxt = bytes(junk).decode("utf-8", "replace")
             self.log("discarding preamble |%d| %r" % (len(junk), jtxt))
 
         # nice, now make it fast
@@ -2544,6 +2714,114 @@ def wunlink(log: "NamedLogger", abspath: str, flags: dict[str, Any]) -> bool:
     return _fs_mvrm(log, abspath, "", False, flags)
 
 
+# linux/fs.h; the _IOW encoding differs on these archs so just skip them
+FICLONE = 0x40049409
+FICLONERANGE = 0x4020940D
+HAVE_FICLONE = sys.platform.startswith("linux") and not re.match(
+    r"(alpha|mips|parisc|powerpc|ppc|sparc)", platform.machine()
+)
+HAVE_CFR = hasattr(os, "copy_file_range")
+
+
+def fclone(fd1: int, fd2: int, ofs1: int = 0, ofs2: int = 0, sz: int = 0) -> None:
+    """
+    copy-on-write clone (reflink) of fd1 into fd2; btrfs, xfs, bcachefs, zfs 2.2+
+    the whole file if sz is 0, otherwise a range which must be block-aligned
+    (except at the end of fd1); raises OSError if the fs can't
+    """
+    if not HAVE_FICLONE:
+        raise OSError(errno.ENOSYS, "reflink is not available on this platform")
+
+    if not sz and not ofs1 and not ofs2:
+        fcntl.ioctl(fd2, FICLONE, fd1)
+    else:
+        zb = struct.pack(b"qQQQ", fd1, ofs1, sz, ofs2)
+        fcntl.ioctl(fd2, FICLONERANGE, zb)
+
+
+def fcopy_range(
+    fd1: int, fd2: int, ofs1: int, ofs2: int, sz: int, clone: bool
+) -> None:
+    """
+    copy sz bytes (or until eof) from fd1 to fd2, which may be the same file;
+    tries reflink (if clone), then copy_file_range, then a plain copy
+    """
+    if clone:
+        try:
+            fclone(fd1, fd2, ofs1, ofs2, sz)
+            return
+        except:
+            pass
+
+    if HAVE_CFR:
+        try:
+            while sz > 0:
+                n = os.copy_file_range(fd1, fd2, sz, ofs1, ofs2)
+                if not n:
+                    break  # eof, or some fs/kernel which won't; let read() decide
+                ofs1 += n
+                ofs2 += n
+                sz -= n
+            if sz <= 0:
+                return
+        except OSError:
+            pass  # EXDEV on old kernels, ENOSYS, EINVAL on some fuse...
+
+    while sz > 0:
+        os.lseek(fd1, ofs1, os.SEEK_SET)
+        buf = os.read(fd1, min(sz, 4 * 1024 * 1024))
+        if not buf:
+            return
+        os.lseek(fd2, ofs2, os.SEEK_SET)
+        while buf:
+            n = os.write(fd2, buf)
+            buf = buf[n:]
+            ofs1 += n
+            ofs2 += n
+            sz -= n
+
+
+def fcopy(src: str, dst: str, flags: dict[str, Any]) -> None:
+    """like shutil.copy2, but avoids reading the file into userspace if possible"""
+    bsrc = fsenc(src)
+    bdst = fsenc(dst)
+    if not HAVE_FICLONE and not HAVE_CFR:
+        shutil.copy2(bsrc, bdst)
+        return
+
+    with open(bsrc, "rb") as f1, open(bdst, "wb") as f2:
+        fd1 = f1.fileno()
+        fd2 = f2.fileno()
+        sz = os.fstat(fd1).st_size
+        try:
+            if "reflink" not in flags:
+                raise Exception()
+            fclone(fd1, fd2)
+        except:
+            fcopy_range(fd1, fd2, 0, 0, sz, False)
+
+        zi = os.fstat(fd2).st_size
+
+    if zi != sz:
+        os.unlink(bdst)
+        raise Exception("fcopy: got %d of %d bytes into [%s]" % (zi, sz, dst))
+
+    shutil.copystat(bsrc, bdst)
+
+
+def reflink(src: str, dst: str) -> None:
+    """create dst as a copy-on-write clone of src, or raise OSError"""
+    try:
+        with open(fsenc(src), "rb") as f1, open(fsenc(dst), "wb") as f2:
+            fclone(f1.fileno(), f2.fileno())
+    except:
+        try:
+            os.unlink(fsenc(dst))
+        except:
+            pass
+        raise
+
+
 def get_df(abspath: str, prune: bool) -> tuple[Optional[int], Optional[int], str]:
     try:
         ap = fsenc(abspath)
@@ -2637,6 +2915,37 @@ def read_socket(
         yield buf
 
 
+def read_socket_into(
+    sr: Unrecv, buf: bytearray, total_size: int
+) -> Generator[memoryview, None, None]:
+    """
+    like read_socket, but reuses buf for each read, so
+    the caller must be done with each yield before the next
+    """
+    if PY2:
+        # no memoryview support in hashlib
+        for zb in read_socket(sr, len(buf), total_size):
+            yield zb  # type: ignore
+        return
+
+    mv = memoryview(buf)
+    bufsz = len(buf)
+    remains = total_size
+    while remains > 0:
+        if bufsz > remains:
+            bufsz = remains
+            mv = mv[:bufsz]
+
+        try:
+            n = sr.recv_into(mv)
+        except OSError:
+            t = "client d/c during binary post after {} bytes, {} bytes remaining"
+            raise Pebkac(400, t.format(total_size - remains, remains))
+
+        remains -= n
+        yield mv[:n] if n < bufsz else mv
+
+
 def read_socket_unbounded(sr: Unrecv, bufsz: int) -> Generator[bytes, None, None]:
     try:
         while True:
@@ -2648,46 +2957,85 @@ def read_socket_unbounded(sr: Unrecv, bufsz: int) -> Generator[bytes, None, None
 def read_socket_chunked(
     sr: Unrecv, bufsz: int, log: Optional["NamedLogger"] = None
 ) -> Generator[bytes, None, None]:
+    """
+    decodes transfer-encoding: chunked; reads bufsz at a time and yields
+    slices (memoryviews) of that, so lots of tiny chunks are cheap
+    """
     err = "upload aborted: expected chunk length, got [{}] |{}| instead"
+    buf = b""
+    mv = memoryview(buf)
+    ofs = 0
+    nrx = 0
     while True:
-        buf = b""
-        while b"\r" not in buf:
+        # chunk-size line
+        eol = buf.find(b"\n", ofs)
+        while eol < 0:
+            zb = buf[ofs:]
+            if len(zb) > 16:
+                raise Pebkac(400, err.format(zb.decode("utf-8", "replace"), len(zb)))
             try:
-                buf += sr.recv(2)
-                if len(buf) > 16:
-                    raise Exception()
-            except:
-                err = err.format(buf.decode("utf-8", "replace"), len(buf))
-                raise Pebkac(400, err)
-
-        if not buf.endswith(b"\n"):
-            sr.recv(1)
+                buf = zb + sr.recv(bufsz)
+            except OSError:
+                raise Pebkac(400, err.format(zb.decode("utf-8", "replace"), len(zb)))
+            mv = memoryview(buf)
+            ofs = 0
+            eol = buf.find(b"\n")
 
+        zb = buf[ofs:eol]
+        ofs = eol + 1
         try:
-            chunklen = int(buf.rstrip(b"\r\n"), 16)
+            if len(zb) > 17:
+                raise Exception()
+            chunklen = int(zb.rstrip(b"\r"), 16)
         except:
-            err = err.format(buf.decode("utf-8", "replace"), len(buf))
-            raise Pebkac(400, err)
-
-        if chunklen == 0:
-            x = sr.recv_ex(2, False)
-            if x == b"\r\n":
-                return
-
-            t = "protocol error after final chunk: want b'\\r\\n', got {!r}"
-            raise Pebkac(400, t.format(x))
+            raise Pebkac(400, err.format(zb.decode("utf-8", "replace"), len(zb)))
 
+        final = not chunklen
         if log:
             log("receiving %d byte chunk" % (chunklen,))
 
-        for chunk in read_socket(sr, bufsz, chunklen):
-            yield chunk
+        while chunklen > 0:
+            if ofs >= len(buf):
+                try:
+                    buf = sr.recv(bufsz)
+                except OSError:
+                    t = "client d/c during binary post after {} bytes, {} bytes remaining in chunk"
+                    raise Pebkac(400, t.format(nrx, chunklen))
+                mv = memoryview(buf)
+                ofs = 0
+
+            n = min(len(buf) - ofs, chunklen)
+            yield buf[ofs : ofs + n] if PY2 else mv[ofs : ofs + n]  # type: ignore
+            ofs += n
+            nrx += n
+            chunklen -= n
+
+        # chunk separator, or the end of the final (empty) chunk
+        while len(buf) - ofs < 2:
+            try:
+                buf = buf[ofs:] + sr.recv(bufsz)
+            except OSError:
+                buf = buf[ofs:]
+                ofs = 0
+                break
+            mv = memoryview(buf)
+            ofs = 0
 
-        x = sr.recv_ex(2, False)
+        x = buf[ofs : ofs + 2]
+        ofs += 2
         if x != b"\r\n":
-            t = "protocol error in chunk separator: want b'\\r\\n', got {!r}"
+            if final:
+                t = "protocol error after final chunk: want b'\\r\\n', got {!r}"
+            else:
+                t = "protocol error in chunk separator: want b'\\r\\n', got {!r}"
             raise Pebkac(400, t.format(x))
 
+        if final:
+            # final chunk; give back anything that belongs to the next request
+            if ofs < len(buf):
+                sr.unrecv(buf[ofs:])
+            return
+
 
 def list_ips() -> list[str]:
     from .stolen.ifaddr import get_adapters
@@ -2840,6 +3188,50 @@ def sendfile_py(
     return 0
 
 
+HAVE_SENDMSG = hasattr(socket.socket, "sendmsg")
+
+
+def sendvec(s: socket.socket, bufs: list[bytes]) -> None:
+    """
+    sendall for a list of buffers; lots of small ones (zip headers
+    and tiny files) become one syscall instead of a join + send each
+    """
+    if not HAVE_SENDMSG:
+        s.sendall(b"".join(bufs))
+        return
+
+    n = 0
+    while n < len(bufs):
+        iov = bufs[n : n + 1000]  # IOV_MAX is 1024 on linux/bsd/mac
+        sent = s.sendmsg(iov)
+        for buf in iov:
+            if sent < len(buf):
+                break
+            sent -= len(buf)
+            n += 1
+        else:
+            continue
+
+        # partial write; finish this buffer and resume at the next
+        s.sendall(memoryview(bufs[n])[sent:])
+        n += 1
+
+
+def sck_alive(s: socket.socket) -> bool:
+    """False if the peer has disconnected; does not consume any data"""
+    try:
+        if not select.select([s], [], [], 0)[0]:
+            return True
+    except:
+        return True  # not a real socket; assume the best
+
+    try:
+        # peek the tcp stream itself, also when s is an SSLSocket
+        return bool(socket.socket.recv(s, 1, socket.MSG_PEEK))
+    except:
+        return False
+
+
 def sendfile_kern(
     log: "NamedLogger",
     lower: int,
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+
+import os
+import random
+import shutil
+import socket
+import subprocess as sp
+import sys
+import tempfile
+import time
+
+"""arc: compressed archive download speed (tar.gz/bz2/xz, zip=dfl) vs --arc-mt"""
+__author__ = "ed <copyparty@ocv.me>"
+__copyright__ = 2024
+__license__ = "MIT"
+__url__ = "https://github.com/9001/copyparty/"
+
+# usage: python3 scripts/bench/arc.py [MiB] [arc-mt...]
+#
+# creates a folder of MiB mixed files (text, random/incompressible, and
+# lots of small ones), then downloads it from copyparty as each of the
+# compressed archive formats, once for each --arc-mt, and prints the
+# throughput and the compression ratio
+
+FMTS = ["tar=gz", "tar=bz2", "tar=xz", "zip=dfl", "tar", "zip"]
+
+
+def mkdata(td, mib):
+    rnd = random.Random(1)
+    abc = "abcdefghijklmnopqrstuvwxyz"
+    words = [
+        "".join(rnd.choice(abc) for _ in range(rnd.randint(1, 9)))
+        for _ in range(4096)
+    ]
+    nbytes = mib * 1024 * 1024
+    n = 0
+    while nbytes > 0:
+        n += 1
+        kind = n % 4
+        if kind == 0:
+            sz = 8 * 1024 * 1024
+            zb = os.urandom(sz)
+        elif kind == 1:
+            zs = " ".join(rnd.choice(words) for _ in range(1024 * 1024))
+            zb = zs.encode("ascii")
+        else:
+            sub = os.path.join(td, "small%d" % (n,))
+            os.mkdir(sub)
+            for n2 in range(500):
+                zs = " ".join(rnd.choice(words) for _ in range(rnd.randint(10, 900)))
+                with open(os.path.join(sub, "%d.txt" % (n2,)), "wb") as f:
+                    f.write(zs.encode("ascii"))
+                nbytes -= len(zs)
+            continue
+
+        with open(os.path.join(td, "f%d" % (n,)), "wb") as f:
+            f.write(zb)
+        nbytes -= len(zb)
+
+
+def dl(port, fmt):
+    sck = socket.create_connection(("127.0.0.1", port))
+    req = "GET /?%s HTTP/1.1\r\nHost: a\r\nConnection: close\r\n\r\n" % (fmt,)
+    sck.sendall(req.encode("ascii"))
+    nbytes = 0
+    while True:
+        zb = sck.recv(1024 * 1024)
+        if not zb:
+            break
+        nbytes += len(zb)
+    sck.close()
+    return nbytes
+
+
+def run(td, port, nthr, insz):
+    argv = [sys.executable, "-m", "copyparty", "-q", "-i", "127.0.0.1"]
+    argv += ["-p", str(port), "-v", td + "::r", "--arc-mt", str(nthr)]
+    p = sp.Popen(argv, stdout=sp.DEVNULL, stderr=sp.DEVNULL)
+    try:
+        for _ in range(100):
+            try:
+                socket.create_connection(("127.0.0.1", port)).close()
+                break
+            except:
+                time.sleep(0.1)
+
+        for fmt in FMTS:
+            t0 = time.time()
+            nbytes = dl(port, fmt)
+            td = time.time() - t0
+            mib = insz / 1024 / 1024
+            t = "arc-mt %-2d %-8s %.1f MiB in %.2f sec = %.1f MiB/s, ratio %.3f"
+            print(t % (nthr, fmt, mib, td, mib / td, nbytes / insz))
+    finally:
+        p.terminate()
+        p.wait()
+
+
+def main():
+    mib = int(sys.argv[1]) if len(sys.argv) > 1 else 256
+    nthrs = [int(x) for x in sys.argv[2:]] or [1, os.cpu_count() or 1]
+    td = tempfile.mkdtemp(prefix="cpp-bench-")
+    try:
+        mkdata(td, mib)
+        insz = 0
+        for dp, _, fns in os.walk(td):
+            insz += sum(os.path.getsize(os.path.join(dp, x)) for x in fns)
+
+        for n, nthr in enumerate(nthrs):
+            run(td, 3925 + n, nthr, insz)
+    finally:
+        shutil.rmtree(td)
+
+
+if __name__ == "__main__":
+    main()
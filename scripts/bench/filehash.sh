@@ -11,6 +11,11 @@ set -euo pipefail
 # * anything less and it takes your number of cores
 #
 # can be adjusted with --hash-mt (but alpine caps out at 5)
+#
+# to compare core counts, give a list of --hash-mt values in $cores;
+# each one gets its own run and the GiB/s is reported for each, for example
+#   cores="1 2 4 8" ./filehash.sh copyparty-sfx.py
+# and add --no-pread to compare against the shared-filehandle reader
 
 fsize=256
 nfiles=128
@@ -49,12 +54,20 @@ echo warming up cache
 cat 1 >/dev/null
 
 echo ok lets go
-$pybin "$sfx" -p39204 -e2dsa --dbd=yolo --exit=idx -lo=t -q "$@" && err= || err=$?
-[ $win ] && [ $err = 15 ] && err=  # sigterm doesn't hook on windows, ah whatever
-[ $err ] && echo ERROR $err && exit $err
+results=
+for nc in ${cores:-default}; do
+	hmt=; [ $nc = default ] || hmt=--hash-mt=$nc
+	rm -rf .hist
+	$pybin "$sfx" -p39204 -e2dsa --dbd=yolo --exit=idx -lo=t -q $hmt "$@" && err= || err=$?
+	[ $win ] && [ $err = 15 ] && err=  # sigterm doesn't hook on windows, ah whatever
+	[ $err ] && echo ERROR $err && exit $err
+
+	r=$(LC_ALL=C $awk '/1 volumes in / {s=$(NF-1); printf "speed: %.1f MiB/s  (%.2f GiB/s, time=%.2fs)", '$totalsize'/s, '$totalsize'/s/1024, s}' <t)
+	results="$results$(printf '%8s cores: %s' $nc "$r")"$'\n'
+done
 
 echo and the results are...
-LC_ALL=C $awk '/1 volumes in / {s=$(NF-1); printf "speed: %.1f MiB/s  (time=%.2fs)\n", '$totalsize'/s, s}' <t
+printf '%s' "$results"
 
 echo deleting $td and exiting
 
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+
+import os
+import shutil
+import socket
+import subprocess as sp
+import sys
+import tempfile
+import time
+
+"""keepalive: server threads and latency with lots of idle connections"""
+__author__ = "ed <copyparty@ocv.me>"
+__copyright__ = 2024
+__license__ = "MIT"
+__url__ = "https://github.com/9001/copyparty/"
+
+# usage: python3 scripts/bench/keepalive.py [num_idle_conns] [extra copyparty args...]
+#
+# starts copyparty twice (with and without --no-park) and opens num_idle_conns
+# connections to it; half of them do one keepalive request and then go
+# quiet, the other half never send anything. Then it checks how many threads
+# the server is using, and how long it takes to serve some requests on top
+#
+# linux only (reads /proc); needs ulimit -n of at least 2x num_idle_conns
+
+REQ = b"GET /a.txt HTTP/1.1\r\nHost: a\r\nConnection: keep-alive\r\n\r\n"
+
+
+def get(sck):
+    sck.sendall(REQ)
+    buf = b""
+    while b"\r\n\r\n" not in buf:
+        zb = sck.recv(4096)
+        if not zb:
+            raise Exception("server hung up")
+        buf += zb
+
+    hdr, body = buf.split(b"\r\n\r\n", 1)
+    clen = int(hdr.lower().split(b"content-length: ")[1].split(b"\r")[0])
+    while len(body) < clen:
+        body += sck.recv(4096)
+
+
+def proc_stat(pid, key):
+    with open("/proc/%d/status" % (pid,), "rb") as f:
+        for ln in f:
+            k, v = ln.decode("utf-8").split(":", 1)
+            if k == key:
+                return v.strip()
+
+
+def run(td, nconn, port, xargs):
+    argv = [sys.executable, "-m", "copyparty", "-q", "-i", "127.0.0.1"]
+    argv += ["-p", str(port), "-nc", str(nconn + 64), "-v", td + "::r"] + xargs
+    p = sp.Popen(argv, stdout=sp.DEVNULL, stderr=sp.DEVNULL)
+    try:
+        for _ in range(100):
+            try:
+                socket.create_connection(("127.0.0.1", port)).close()
+                break
+            except:
+                time.sleep(0.1)
+
+        t0 = time.time()
+        scks = []
+        for n in range(nconn):
+            sck = socket.create_connection(("127.0.0.1", port))
+            if n % 2:
+                get(sck)
+            scks.append(sck)
+
+        td_open = time.time() - t0
+        time.sleep(3)
+        nthr = proc_stat(p.pid, "Threads")
+        rss = proc_stat(p.pid, "VmRSS")
+
+        lat = []
+        sck = socket.create_connection(("127.0.0.1", port))
+        for n in range(200):
+            t0 = time.time()
+            if n % 2:
+                get(sck)
+            else:
+                sck2 = socket.create_connection(("127.0.0.1", port))
+                get(sck2)
+                sck2.close()
+            lat.append(time.time() - t0)
+
+        sck.close()
+        for sck in scks:
+            sck.close()
+
+        lat.sort()
+        t = "%-12s %d idle conns opened in %.2f sec; server has %s threads, %s RSS; p50 %.2f ms, p99 %.2f ms"
+        name = " ".join(xargs) or "(default)"
+        zf = 1000.0
+        print(t % (name, nconn, td_open, nthr, rss, lat[100] * zf, lat[198] * zf))
+    finally:
+        p.terminate()
+        p.wait()
+
+
+def main():
+    nconn = int(sys.argv[1]) if len(sys.argv) > 1 else 4000
+    xargs = sys.argv[2:]
+    try:
+        import resource
+
+        _, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except:
+        pass
+
+    td = tempfile.mkdtemp(prefix="cpp-bench-")
+    try:
+        with open(os.path.join(td, "a.txt"), "wb") as f:
+            f.write(b"hello\n")
+
+        run(td, nconn, 3923, xargs)
+        run(td, nconn, 3924, xargs + ["--no-park"])
+    finally:
+        shutil.rmtree(td)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+import os
+import socket
+import sys
+import threading
+import time
+from argparse import Namespace
+
+"""multipart: loopback bup (basic uploader) throughput through MultipartParser"""
+__author__ = "ed <copyparty@ocv.me>"
+__copyright__ = 2024
+__license__ = "MIT"
+__url__ = "https://github.com/9001/copyparty/"
+
+# usage: python3 scripts/bench/multipart.py [MiB_per_run] [num_runs]
+#
+# sends a multipart/form-data body with one MiB_per_run file over a tcp
+# connection on localhost, and parses+hashes+writes it to /dev/null the
+# same way handle_plain_upload does, once for each --s-rd-sz; then again
+# without the hashing, to see what the parser itself costs
+
+sys.path.insert(0, ".")
+
+from copyparty.util import MultipartParser, Unrecv, hashcopy
+
+BOUNDARY = "----WebKitFormBoundaryc6P4Zc6fVLb6DqRu"
+
+
+def log(*a, **ka):
+    pass
+
+
+def sender(srv, nbytes):
+    c, _ = srv.accept()
+    hdr = '--%s\r\nContent-Disposition: form-data; name="f"; filename="a"\r\n\r\n'
+    c.sendall((hdr % (BOUNDARY,)).encode("utf-8"))
+    buf = os.urandom(1024 * 1024)
+    while nbytes > 0:
+        zb = buf[:nbytes]
+        c.sendall(zb)
+        nbytes -= len(zb)
+    c.sendall(("\r\n--%s--\r\n" % (BOUNDARY,)).encode("utf-8"))
+    c.close()
+
+
+def run(bufsz, nbytes, fout, hashed):
+    srv = socket.socket()
+    srv.bind(("127.0.0.1", 0))
+    srv.listen(1)
+    thr = threading.Thread(target=sender, args=(srv, nbytes))
+    thr.start()
+
+    s = socket.create_connection(srv.getsockname())
+    sr = Unrecv(s, None)
+    args = Namespace(s_rd_sz=bufsz)
+    hdrs = {"content-type": "multipart/form-data; boundary=" + BOUNDARY}
+    t0 = time.time()
+    parser = MultipartParser(log, args, sr, hdrs)
+    parser.parse()
+    _, _, p_data = next(parser.gen)
+    if hashed:
+        sz, _, _ = hashcopy(p_data, fout, None, 0, 0)
+    else:
+        sz = 0
+        for buf in p_data:
+            sz += len(buf)
+
+    parser.drop()
+    td = time.time() - t0
+    assert sz == nbytes
+    thr.join()
+    s.close()
+    srv.close()
+    return td
+
+
+def main():
+    mib = int(sys.argv[1]) if len(sys.argv) > 1 else 2048
+    nruns = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    nbytes = mib * 1024 * 1024
+    with open(os.devnull, "wb") as fout:
+        for hashed in (True, False):
+            for bufsz in (256 * 1024, 4 * 1024 * 1024):
+                tds = [run(bufsz, nbytes, fout, hashed) for _ in range(nruns)]
+                td = min(tds)
+                t = "s-rd-sz %-7d hash=%d %d MiB in %.2f sec = %.1f MiB/s (best of %d)"
+                print(t % (bufsz, hashed, mib, td, mib / td, nruns))
+
+
+if __name__ == "__main__":
+    main()
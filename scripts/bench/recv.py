@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+
+import os
+import socket
+import sys
+import threading
+import time
+
+"""recv: loopback upload throughput; read_socket vs read_socket_into"""
+__author__ = "ed <copyparty@ocv.me>"
+__copyright__ = 2024
+__license__ = "MIT"
+__url__ = "https://github.com/9001/copyparty/"
+
+# usage: python3 scripts/bench/recv.py [MiB_per_run] [num_runs]
+#
+# receives MiB_per_run over a tcp connection on localhost and hashes+writes
+# it to /dev/null the same way handle_post_binary does, first with a new
+# bytes object for each recv, then reusing one buffer with recv_into
+
+sys.path.insert(0, ".")
+
+from copyparty.util import Unrecv, hashcopy, read_socket, read_socket_into
+
+BUFSZ = 256 * 1024
+
+
+def sender(srv, nbytes):
+    c, _ = srv.accept()
+    buf = os.urandom(1024 * 1024)
+    while nbytes > 0:
+        zb = buf[:nbytes]
+        c.sendall(zb)
+        nbytes -= len(zb)
+    c.close()
+
+
+def run(into, nbytes, fout):
+    srv = socket.socket()
+    srv.bind(("127.0.0.1", 0))
+    srv.listen(1)
+    thr = threading.Thread(target=sender, args=(srv, nbytes))
+    thr.start()
+
+    s = socket.create_connection(srv.getsockname())
+    sr = Unrecv(s, None)
+    t0 = time.time()
+    if into:
+        reader = read_socket_into(sr, bytearray(BUFSZ), nbytes)
+    else:
+        reader = read_socket(sr, BUFSZ, nbytes)
+
+    sz, _, _ = hashcopy(reader, fout, None, 0, 0)
+    td = time.time() - t0
+    assert sz == nbytes
+    thr.join()
+    s.close()
+    srv.close()
+    return td
+
+
+def main():
+    mib = int(sys.argv[1]) if len(sys.argv) > 1 else 2048
+    nruns = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    nbytes = mib * 1024 * 1024
+    with open(os.devnull, "wb") as fout:
+        for into in (False, True):
+            tds = [run(into, nbytes, fout) for _ in range(nruns)]
+            td = min(tds)
+            t = "%-16s %d MiB in %.2f sec = %.1f MiB/s (best of %d)"
+            name = "read_socket_into" if into else "read_socket"
+            print(t % (name, mib, td, mib / td, nruns))
+
+
+if __name__ == "__main__":
+    main()
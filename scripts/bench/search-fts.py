@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+"""search-fts: wildcard search latency with and without the fts index"""
+__author__ = "ed <copyparty@ocv.me>"
+__copyright__ = 2024
+__license__ = "MIT"
+__url__ = "https://github.com/9001/copyparty/"
+
+# usage: python3 scripts/bench/search-fts.py [num_files] [num_queries]
+#
+# creates a synthetic up2k.db with num_files files (default 1M; try 10M if
+# you have the patience), each with an artist and title tag, then runs the
+# same searches through u2idx with the fts volflag off and on
+
+sys.path.insert(0, ".")
+
+from copyparty.authsrv import AuthSrv
+from copyparty.u2idx import U2idx
+from tests.util import Cfg, VHub
+
+WORDS = "alpha bravo charlie delta echo foxtrot golf hotel india juliett kilo lima mike november oscar papa quebec romeo sierra tango uniform victor whiskey xray yankee zulu".split()
+
+
+def log(*a, **ka):
+    pass
+
+
+def name(rnd):
+    return " ".join(rnd.choice(WORDS) for _ in range(3)) + " %d" % (rnd.randint(0, 99999),)
+
+
+class Hsrv(object):
+    def __init__(self, args, asrv):
+        self.args = args
+        self.asrv = asrv
+        self.log = log
+
+
+def main():
+    nfiles = int(sys.argv[1]) if len(sys.argv) > 1 else 1000 * 1000
+    nq = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+    td = tempfile.mkdtemp(prefix="cpp-bench-")
+    try:
+        run(td, nfiles, nq)
+    finally:
+        shutil.rmtree(td)
+
+
+def run(td, nfiles, nq):
+    args = Cfg(v=[td + "::r:c,e2d"], a=[], srch_time=600)
+    asrv = AuthSrv(args, log)
+    vol = asrv.vfs.all_vols[""]
+    up2k = VHub(args, asrv, log).up2k
+    cur = up2k.cur[vol.realpath]
+    db_path = os.path.join(asrv.vfs.histtab[vol.realpath], "up2k.db")
+
+    t0 = time.time()
+    rnd = random.Random(1)
+    q1 = "insert into up values (?,?,?,?,?,?,?)"
+    q2 = "insert into mt values (?,?,?)"
+    for n in range(0, nfiles, 10000):
+        ups = []
+        mts = []
+        for n2 in range(n, min(nfiles, n + 10000)):
+            w = "%044x" % (rnd.getrandbits(176),)
+            rd = "music/%s/%s" % (rnd.choice(WORDS), rnd.choice(WORDS))
+            ups.append((w, 1, n2, rd, name(rnd) + ".flac", "", 0))
+            mts.append((w[:16], "artist", name(rnd)))
+            mts.append((w[:16], "title", name(rnd)))
+        cur.executemany(q1, ups)
+        cur.executemany(q2, mts)
+    cur.connection.commit()
+    print("%d files, %d tags; created in %.1f sec" % (nfiles, nfiles * 2, time.time() - t0))
+
+    t0 = time.time()
+    up2k._add_fts_tab(cur, db_path, True)
+    td = time.time() - t0
+    zi = os.path.getsize(db_path) // 1024 // 1024
+    print("fts index built in %.1f sec; db is now %d MiB" % (td, zi))
+    up2k.shutdown()
+
+    rnd = random.Random(2)
+    queries = []
+    for _ in range(nq):
+        a, b = rnd.sample(WORDS, 2)
+        queries.append('name like "*%s %s*"' % (a, b[:3]))
+        queries.append('artist like "*%s %s*"' % (a, b[:3]))
+        queries.append("title like *%d*" % (rnd.randint(10000, 99999),))
+
+    idx = U2idx(Hsrv(args, asrv))
+    for fts in (False, True):
+        if fts:
+            vol.flags["fts"] = True
+        else:
+            vol.flags.pop("fts", None)
+
+        lat = []
+        nhits = 0
+        for q in queries:
+            t0 = time.time()
+            hits, _, _ = idx.search("*", [vol], q, 99999)
+            lat.append(time.time() - t0)
+            nhits += len(hits)
+
+        lat.sort()
+        t = "fts=%d: %d queries, %d hits, p50 %.1f ms, p99 %.1f ms, max %.1f ms"
+        zf = 1000.0
+        p50 = lat[len(lat) // 2] * zf
+        p99 = lat[int(len(lat) * 0.99)] * zf
+        print(t % (fts, len(lat), nhits, p50, p99, lat[-1] * zf))
+
+    idx.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+
+import os
+import shutil
+import socket
+import struct
+import subprocess as sp
+import sys
+import tempfile
+import threading
+import time
+
+"""thumbs: thumbnails/sec with pillow, pyvips and ffmpeg"""
+__author__ = "ed <copyparty@ocv.me>"
+__copyright__ = 2024
+__license__ = "MIT"
+__url__ = "https://github.com/9001/copyparty/"
+
+# usage: python3 scripts/bench/thumbs.py [folder] [num_images]
+#
+# creates num_images (default 24) 24-megapixel jpegs, each with a
+# 480x320 thumbnail in the exif like some cameras do, unless a folder
+# with pictures is given (and then kept), and asks copyparty for
+# the grid-view thumbnail of each picture with each of the CONFIGS;
+# a fresh --hist for every run so nothing is cached
+#
+# configs where the decoder is unavailable (no pyvips, no ffmpeg)
+# will fail every thumbnail and are shown as such
+
+CONFIGS = [
+    ["pil", "--th-dec=pil", "--th-webp-m=6"],
+    ["pil", "--th-dec=pil"],
+    ["pil-exif", "--th-dec=pil", "--th-exif"],
+    ["vips", "--th-dec=vips"],
+    ["ffmpeg", "--th-dec=ff"],
+]
+
+
+def exif_blob(th):
+    """tiff header, empty IFD0, IFD1 with the jpeg thumbnail"""
+    ifd0 = struct.pack("<H", 0) + struct.pack("<I", 14)
+    pos = 14 + 2 + 2 * 12 + 4
+    ifd1 = struct.pack("<H", 2)
+    ifd1 += struct.pack("<HHII", 0x201, 4, 1, pos)
+    ifd1 += struct.pack("<HHII", 0x202, 4, 1, len(th))
+    ifd1 += struct.pack("<I", 0)
+    return b"Exif\x00\x00II" + struct.pack("<HI", 42, 8) + ifd0 + ifd1 + th
+
+
+def mkdata(td, num):
+    from io import BytesIO
+
+    from PIL import Image, ImageFilter
+
+    noise = Image.effect_noise((1500, 1000), 64).filter(ImageFilter.GaussianBlur(2))
+    for n in range(num):
+        grad = Image.linear_gradient("L").rotate(n * 15).resize((1500, 1000))
+        zs = "L" if n % 3 else "RGB"
+        im = Image.merge("RGB", (grad, noise, grad.rotate(90).resize((1500, 1000))))
+        im = im.convert(zs).convert("RGB").resize((6000, 4000))
+        th = im.resize((480, 320))
+        bio = BytesIO()
+        th.save(bio, "jpeg", quality=80)
+        fp = os.path.join(td, "%03d.jpg" % (n,))
+        im.save(fp, "jpeg", quality=90, exif=exif_blob(bio.getvalue()))
+
+
+def get(port, fn):
+    sck = socket.create_connection(("127.0.0.1", port))
+    req = "GET /%s?th=w HTTP/1.1\r\nHost: a\r\nConnection: close\r\n\r\n" % (fn,)
+    sck.sendall(req.encode("ascii"))
+    ret = b""
+    while True:
+        zb = sck.recv(1024 * 1024)
+        if not zb:
+            break
+        ret += zb
+    sck.close()
+    hdr = ret.split(b"\r\n\r\n")[0].decode("latin1").lower()
+    return "content-type: image/webp" in hdr or "content-type: image/jpeg" in hdr
+
+
+def run(td, fns, port, cfg, nthr):
+    hist = tempfile.mkdtemp(prefix="cpp-bench-hist-")
+    argv = [sys.executable, "-m", "copyparty", "-q", "-i", "127.0.0.1"]
+    argv += ["-p", str(port), "-v", td + "::r", "--hist", hist]
+    argv += ["--th-mt", str(nthr)] + cfg[1:]
+    p = sp.Popen(argv, stdout=sp.DEVNULL, stderr=sp.DEVNULL)
+    try:
+        for _ in range(100):
+            try:
+                socket.create_connection(("127.0.0.1", port)).close()
+                break
+            except:
+                time.sleep(0.1)
+
+        todo = list(fns)
+        nok = [0]
+        mutex = threading.Lock()
+
+        def worker():
+            while True:
+                with mutex:
+                    if not todo:
+                        return
+                    fn = todo.pop()
+                ok = get(port, fn)
+                with mutex:
+                    nok[0] += ok
+
+        t0 = time.time()
+        thrs = [threading.Thread(target=worker) for _ in range(nthr)]
+        for thr in thrs:
+            thr.start()
+        for thr in thrs:
+            thr.join()
+        td2 = time.time() - t0
+
+        name = " ".join([cfg[0]] + [x for x in cfg[1:] if "th-dec" not in x])
+        if not nok[0]:
+            print("%-24s n/a (decoder unavailable?)" % (name,))
+        else:
+            t = "%-24s %d/%d thumbs in %.2f sec = %.2f thumbs/s"
+            print(t % (name, nok[0], len(fns), td2, nok[0] / td2))
+    finally:
+        p.terminate()
+        p.wait()
+        shutil.rmtree(hist)
+
+
+def main():
+    td = sys.argv[1] if len(sys.argv) > 1 else ""
+    num = int(sys.argv[2]) if len(sys.argv) > 2 else 24
+    keep = bool(td)
+    if not td:
+        td = tempfile.mkdtemp(prefix="cpp-bench-")
+
+    try:
+        if not os.listdir(td):
+            t0 = time.time()
+            mkdata(td, num)
+            print("created %d pictures in %.1f sec" % (num, time.time() - t0))
+
+        exts = ("jpg", "jpeg", "png", "webp", "heic", "avif", "tif", "tiff")
+        fns = [x for x in sorted(os.listdir(td)) if x.split(".")[-1].lower() in exts]
+        nthr = os.cpu_count() or 1
+        for n, cfg in enumerate(CONFIGS):
+            run(td, fns, 3927 + n, cfg, nthr)
+    finally:
+        if not keep:
+            shutil.rmtree(td)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+"""up2k-chunks: chunk bookkeeping overhead with many parallel big uploads"""
+__author__ = "ed <copyparty@ocv.me>"
+__copyright__ = 2024
+__license__ = "MIT"
+__url__ = "https://github.com/9001/copyparty/"
+
+# usage: python3 scripts/bench/up2k-chunks.py [num_uploads] [GiB_per_file] [threads]
+#
+# registers N fake uploads directly in the up2k registry and runs every
+# chunk through handle_chunks + confirm_chunks (which is what each chunk
+# POST does, minus the actual network and disk i/o), round-robin across
+# all uploads from several threads, like many clients uploading at once
+
+sys.path.insert(0, ".")
+
+from copyparty.authsrv import AuthSrv
+from copyparty.up2k import up2k_chunksize
+from tests.util import Cfg, VHub
+
+
+def log(*a, **ka):
+    pass
+
+
+def main():
+    nup = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    gsz = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    nthr = int(sys.argv[3]) if len(sys.argv) > 3 else 8
+
+    td = tempfile.mkdtemp(prefix="cpp-bench-")
+    try:
+        run(td, nup, gsz, nthr)
+    finally:
+        shutil.rmtree(td)
+
+
+def run(td, nup, gsz, nthr):
+    args = Cfg(v=[td + "::A"], a=[])
+    asrv = AuthSrv(args, log)
+    up2k = VHub(args, asrv, log).up2k
+    ptop = asrv.vfs.realpath
+    up2k.registry[ptop] = reg = {}
+
+    fsz = gsz * 1024 * 1024 * 1024
+    csz = up2k_chunksize(fsz)
+    nchunk = (fsz + csz - 1) // csz
+    work = []
+    for n in range(nup):
+        hashes = ["%044x" % (random.getrandbits(176),) for _ in range(nchunk)]
+        wark = "%044x" % (random.getrandbits(176),)
+        reg[wark] = {
+            "wark": wark,
+            "ptop": ptop,
+            "prel": "",
+            "name": "f%d" % (n,),
+            "tnam": "f%d.PARTIAL" % (n,),
+            "size": fsz,
+            "lmod": 0,
+            "sprs": True,
+            "hash": hashes,
+            "need": hashes[:],
+            "busy": {},
+        }
+        work.append([(wark, x) for x in hashes])
+
+    # interleave uploads, chunks in order within each
+    q = [x for zt in zip(*work) for x in zt]
+    print("%d uploads x %d chunks (%d MiB each)" % (nup, nchunk, csz >> 20))
+
+    mutex = threading.Lock()
+
+    def worker():
+        while True:
+            with mutex:
+                if not q:
+                    return
+                wark, chash = q.pop()
+
+            up2k.handle_chunks(ptop, wark, [chash])
+            up2k.confirm_chunks(ptop, wark, [chash], [chash])
+
+    q.reverse()
+    nops = len(q)
+    t0 = time.time()
+    thrs = [threading.Thread(target=worker) for _ in range(nthr)]
+    for t in thrs:
+        t.start()
+    for t in thrs:
+        t.join()
+    td = time.time() - t0
+
+    left = sum(len(x["need"]) for x in reg.values())
+    t = "%d chunks in %.2f sec = %.0f chunks/s, %.1f us/chunk (%d threads, %d left)"
+    print(t % (nops, td, nops / td, td * 1e6 / nops, nthr, left))
+
+
+if __name__ == "__main__":
+    main()
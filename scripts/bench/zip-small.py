@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+
+import os
+import random
+import shutil
+import socket
+import subprocess as sp
+import sys
+import tempfile
+import time
+
+"""zip-small: archive download speed for lots of tiny files"""
+__author__ = "ed <copyparty@ocv.me>"
+__copyright__ = 2024
+__license__ = "MIT"
+__url__ = "https://github.com/9001/copyparty/"
+
+# usage: python3 scripts/bench/zip-small.py [num_files] [folder]
+#
+# creates num_files (default 500000) files of 0-2000 bytes in folders
+# of 1000 files each, then downloads it from copyparty as each of the
+# uncompressed archive formats and prints the throughput
+#
+# the folder is kept if it is specified (and reused if it exists), so
+# another version can be compared with PYTHONPATH=/other/copyparty
+
+FMTS = ["zip", "zip=crc", "zip=store", "tar"]
+
+
+def mkdata(td, nfiles):
+    rnd = random.Random(1)
+    zb = os.urandom(2000)
+    for n in range(nfiles):
+        if n % 1000 == 0:
+            sub = os.path.join(td, "%04d" % (n // 1000,))
+            os.mkdir(sub)
+        with open(os.path.join(sub, "%d.bin" % (n,)), "wb") as f:
+            f.write(zb[: rnd.randint(0, 2000)])
+
+
+def dl(port, fmt):
+    sck = socket.create_connection(("127.0.0.1", port))
+    req = "GET /?%s HTTP/1.1\r\nHost: a\r\nConnection: close\r\n\r\n" % (fmt,)
+    sck.sendall(req.encode("ascii"))
+    nbytes = 0
+    while True:
+        zb = sck.recv(1024 * 1024)
+        if not zb:
+            break
+        nbytes += len(zb)
+    sck.close()
+    return nbytes
+
+
+def main():
+    nfiles = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+    td = sys.argv[2] if len(sys.argv) > 2 else ""
+    keep = bool(td)
+    if not td:
+        td = tempfile.mkdtemp(prefix="cpp-bench-")
+
+    port = 3926
+    p = None
+    try:
+        if not os.path.exists(td) or not os.listdir(td):
+            os.makedirs(td, exist_ok=True)
+            t0 = time.time()
+            mkdata(td, nfiles)
+            print("created %d files in %.1f sec" % (nfiles, time.time() - t0))
+
+        argv = [sys.executable, "-m", "copyparty", "-q", "-i", "127.0.0.1"]
+        argv += ["-p", str(port), "-v", td + "::r"]
+        p = sp.Popen(argv, stdout=sp.DEVNULL, stderr=sp.DEVNULL)
+        for _ in range(100):
+            try:
+                socket.create_connection(("127.0.0.1", port)).close()
+                break
+            except:
+                time.sleep(0.1)
+
+        # warm up the page cache
+        dl(port, "tar")
+
+        for fmt in FMTS:
+            t0 = time.time()
+            nbytes = dl(port, fmt)
+            td2 = time.time() - t0
+            t = "%-9s %.1f MiB in %.2f sec = %.1f MiB/s, %d files/s"
+            mib = nbytes / 1024 / 1024
+            print(t % (fmt, mib, td2, mib / td2, nfiles / td2))
+    finally:
+        if p:
+            p.terminate()
+            p.wait()
+        if not keep:
+            shutil.rmtree(td)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# coding: utf-8
+from __future__ import print_function, unicode_literals
+
+import hashlib
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from copyparty.authsrv import AuthSrv
+from copyparty.httpcli import HttpCli
+from copyparty.util import Pebkac, Unrecv, read_socket_chunked
+from tests import util as tu
+from tests.util import Cfg
+
+
+class FragSock(tu.VSock):
+    """counts reads, and returns random-sized pieces of what was asked for"""
+
+    def __init__(self, buf, rnd):
+        super(FragSock, self).__init__(buf)
+        self.rnd = rnd
+        self.nrecv = 0
+
+    def recv(self, sz):
+        self.nrecv += 1
+        if self.rnd:
+            sz = self.rnd.randint(1, sz)
+        return super(FragSock, self).recv(sz)
+
+
+def encode(chunks):
+    ret = [b"%x\r\n%s\r\n" % (len(x), x) for x in chunks]
+    return b"".join(ret) + b"0\r\n\r\n"
+
+
+class TestChunked(unittest.TestCase):
+    def setUp(self):
+        self.td = tu.get_ramdisk()
+
+    def tearDown(self):
+        os.chdir(tempfile.gettempdir())
+        shutil.rmtree(self.td)
+
+    def log(self, src, msg, c=0):
+        pass
+
+    def decode(self, body, rnd, bufsz):
+        sck = FragSock(body, rnd)
+        sr = Unrecv(sck, None)
+        ret = b"".join(bytes(x) for x in read_socket_chunked(sr, bufsz))
+        return ret, sr, sck
+
+    def test_stress(self):
+        rnd = random.Random(1)
+        for n in range(200):
+            nchunks = rnd.randint(0, 300)
+            zi = rnd.choice((1, 2, 3, 15, 16, 17, 999))
+            chunks = [os.urandom(zi) for _ in range(nchunks)]
+            if n % 10 == 0:
+                chunks.append(os.urandom(rnd.randint(1, 600 * 1024)))
+
+            body = encode(chunks)
+            want = b"".join(chunks)
+            for frag, bufsz in ((None, 256 * 1024), (rnd, 256 * 1024), (rnd, 7)):
+                if bufsz < 9 and len(body) > 64 * 1024:
+                    continue
+                got, sr, _ = self.decode(body + b"GET / HTTP", frag, bufsz)
+                self.assertEqual(got, want)
+
+                # the next request is still there
+                self.assertEqual(sr.recv_ex(10), b"GET / HTTP")
+
+        # many tiny chunks should only need a few reads
+        body = encode([b"x"] * 100000)
+        _, _, sck = self.decode(body, None, 256 * 1024)
+        self.assertEqual(sck.nrecv, len(body) // (256 * 1024) + 1)
+
+    def test_errors(self):
+        for body in (
+            b"3\r\nabcX\r\n0\r\n\r\n",  # bad separator
+            b"3\r\nabc\r\n0\r\nXX",  # bad final
+            b"zz\r\nabc\r\n0\r\n\r\n",  # bad length
+            b"1234567890abcdef123\r\n",  # too long
+            b"10\r\nabc",  # truncated
+        ):
+            with self.assertRaises(Pebkac):
+                self.decode(body, None, 256 * 1024)
+
+    def test_put(self):
+        td = os.path.join(self.td, "vfs")
+        os.mkdir(td)
+        os.chdir(td)
+        args = Cfg(v=[".::w"], a=[])
+        asrv = AuthSrv(args, self.log)
+        conn = tu.VHttpConn(args, asrv, self.log, b"")
+
+        chunks = [os.urandom(random.randint(1, 99)) for _ in range(5000)]
+        hdr = "PUT /f HTTP/1.1\r\nConnection: close\r\nTransfer-Encoding: chunked\r\n\r\n"
+        HttpCli(conn.setbuf(hdr.encode("utf-8") + encode(chunks))).run()
+        self.assertIn(b" 201 Created", conn.s._reply)
+        with open("f", "rb") as f:
+            data = f.read()
+        self.assertEqual(data, b"".join(chunks))
+        zs = hashlib.sha512(data).hexdigest()[:40]
+        self.assertIn(zs.encode("ascii"), conn.s._reply)
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+# coding: utf-8
+from __future__ import print_function, unicode_literals
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from copyparty.authsrv import AuthSrv
+from copyparty.fswatch import HAVE_INOTIFY, FsWatch
+from copyparty.up2k import Up2k
+from tests import util as tu
+from tests.util import Cfg
+
+
+@unittest.skipUnless(HAVE_INOTIFY, "needs inotify")
+class TestFsWatch(unittest.TestCase):
+    def setUp(self):
+        self.td = tu.get_ramdisk()
+        self.cond = threading.Condition()
+        self.evs = []
+
+    def tearDown(self):
+        self.fsw.shutdown()
+        os.chdir(tempfile.gettempdir())
+        shutil.rmtree(self.td)
+
+    def log(self, src, msg, c=0):
+        pass
+
+    def ev(self, *a):
+        with self.cond:
+            self.evs.append(a)
+            self.cond.notify_all()
+
+    def cb(self, k):
+        return lambda *a: self.ev(k, *a)
+
+    def expect(self, want, exact=True):
+        t0 = time.time()
+        with self.cond:
+            while time.time() - t0 < 5:
+                if set(want) <= set(self.evs):
+                    break
+                self.cond.wait(0.1)
+
+            if exact:
+                self.assertEqual(set(want), set(self.evs))
+            else:
+                self.assertLessEqual(set(want), set(self.evs))
+            self.evs = []
+
+    def test(self):
+        top = self.td
+        os.mkdir(os.path.join(top, "a"))
+        os.mkdir(os.path.join(top, "ex"))
+
+        on = [self.cb(k) for k in ("f", "d", "g", "l")]
+        self.fsw = FsWatch(self.log, *on, settle=0.1)
+        self.fsw.set_vols({top: [os.path.join(top, "ex")]})
+        while len(self.fsw.wds) < 2:
+            time.sleep(0.05)
+
+        def w(rp):
+            with open(os.path.join(top, rp), "wb") as f:
+                f.write(b"a")
+
+        w("f1")
+        w("a/f2")
+        w("ex/nope")
+        self.expect([("f", top, "", "f1"), ("f", top, "a", "f2")])
+
+        # rename within volume = gone + new
+        os.rename(os.path.join(top, "a/f2"), os.path.join(top, "f3"))
+        self.expect([("g", top, "a", "f2"), ("f", top, "", "f3")])
+
+        os.unlink(os.path.join(top, "f1"))
+        self.expect([("g", top, "", "f1")])
+
+        # new folder gets watched right away
+        os.makedirs(os.path.join(top, "b/c"))
+        self.expect([("d", top, "b")], False)
+        time.sleep(0.3)
+        w("b/c/f4")
+        self.expect([("f", top, "b/c", "f4")])
+
+        shutil.rmtree(os.path.join(top, "b"))
+        self.expect([("g", top, "", "b")], False)
+
+
+class FakeFsw(object):
+    def __init__(self, vols):
+        self.vols = vols
+
+    def shutdown(self):
+        pass
+
+
+class TestFswUp2k(unittest.TestCase):
+    """the up2k end of fswatch; events are delivered by hand"""
+
+    def __init__(self, *a, **ka):
+        super(TestFswUp2k, self).__init__(*a, **ka)
+        self.is_dut = True
+
+    def setUp(self):
+        self.td = tu.get_ramdisk()
+        os.chdir(self.td)
+        self.up2k = None
+        for rp, sz in (("f0", 5), ("a/f1", 20), ("a/b/f2", 10)):
+            self.w(rp, sz)
+
+    def tearDown(self):
+        if self.up2k:
+            self.up2k.shutdown()
+        os.chdir(tempfile.gettempdir())
+        shutil.rmtree(self.td)
+
+    def log(self, src, msg, c=0):
+        pass
+
+    def w(self, rp, sz):
+        if "/" in rp and not os.path.isdir(rp.rsplit("/", 1)[0]):
+            os.makedirs(rp.rsplit("/", 1)[0])
+        with open(rp, "wb") as f:
+            f.write(b"x" * sz)
+
+    def boot(self, vflags=""):
+        self.args = Cfg(v=[".::r" + vflags], a=[], e2dsa=True, no_dhash=False)
+        self.asrv = AuthSrv(self.args, self.log)
+        self.up2k = Up2k(self)
+        self.cur = self.up2k.cur[self.td]
+        self.up2k.fsw = FakeFsw({self.td: set()})
+
+    def hash_all(self):
+        # the hasher thread does not run in tests
+        up2k = self.up2k
+        while not up2k.hashq.empty():
+            up2k._hash_t(up2k.hashq.get())
+        up2k.n_hashq = 0
+
+    def files(self):
+        q = "select rd, fn from up"
+        return sorted("/".join(x).lstrip("/") for x in self.cur.execute(q))
+
+    def ds(self):
+        q = "select rd, sz, nf from ds"
+        return dict((x[0], (x[1], x[2])) for x in self.cur.execute(q))
+
+    def test_add(self):
+        self.boot()
+        up2k = self.up2k
+        self.assertEqual(self.files(), ["a/b/f2", "a/f1", "f0"])
+        self.assertEqual(self.ds()[""], (35, 3))
+
+        # unchanged file is not rehashed
+        up2k._fsw_file(self.td, "a", "f1")
+        self.assertTrue(up2k.hashq.empty())
+
+        # new or modified files are
+        self.w("g", 7)
+        self.w("a/f1", 21)
+        up2k._fsw_file(self.td, "", "g")
+        up2k._fsw_file(self.td, "a", "f1")
+        up2k._fsw_file(self.td, "", "g.PARTIAL")
+        self.hash_all()
+        self.assertEqual(self.files(), ["a/b/f2", "a/f1", "f0", "g"])
+        zt = self.cur.execute("select sz from up where fn='f1'").fetchone()
+        self.assertEqual(zt[0], 21)
+        ds = self.ds()
+        self.assertEqual(ds["a"], (31, 2))
+        self.assertEqual(ds[""], (43, 4))
+        self.assertEqual(up2k.volsize[self.cur], 43)
+        self.assertEqual(up2k.volnfiles[self.cur], 4)
+
+        # new folder, with subfolders
+        self.w("c/d/h", 3)
+        self.w("c/i", 4)
+        up2k._fsw_dir(self.td, "c")
+        self.hash_all()
+        self.assertIn("c/d/h", self.files())
+        self.assertIn("c/i", self.files())
+        self.assertEqual(self.ds()["c"], (7, 2))
+
+    def test_gone(self):
+        self.boot()
+        up2k = self.up2k
+        n0 = up2k.volnfiles[self.cur]
+        self.assertEqual(self.ds()["a"], (30, 2))
+        self.assertTrue(self.cur.execute("select d from dh").fetchall())
+
+        # file
+        os.unlink("f0")
+        up2k._fsw_gone(self.td, "", "f0")
+        self.assertEqual(self.files(), ["a/b/f2", "a/f1"])
+        self.assertEqual(self.ds()[""], (30, 2))
+        self.assertEqual(up2k.volnfiles[self.cur], n0 - 1)
+
+        # folder; everything inside, and the folder sizes above it
+        shutil.rmtree("a/b")
+        up2k._fsw_gone(self.td, "a", "b")
+        self.assertEqual(self.files(), ["a/f1"])
+        ds = self.ds()
+        self.assertNotIn("a/b", ds)
+        self.assertEqual(ds["a"], (20, 1))
+        self.assertEqual(ds[""], (20, 1))
+
+        shutil.rmtree("a")
+        up2k._fsw_gone(self.td, "", "a")
+        self.assertEqual(self.files(), [])
+        self.assertEqual(self.ds(), {"": (0, 0)})
+        zs = "select d from dh where d like 'a%'"
+        self.assertEqual(self.cur.execute(zs).fetchall(), [])
+        self.assertEqual(up2k.volnfiles[self.cur], n0 - 3)
+
+    def test_noforget(self):
+        self.boot(":c,noforget")
+        shutil.rmtree("a")
+        os.unlink("f0")
+        self.up2k._fsw_gone(self.td, "", "a")
+        self.up2k._fsw_gone(self.td, "", "f0")
+        self.assertEqual(self.files(), ["a/b/f2", "a/f1", "f0"])
+        self.assertEqual(self.ds()["a"], (30, 2))
+
+    def test_lost(self):
+        self.boot()
+        self.assertEqual(self.up2k.need_rescan, set())
+        self.up2k._fsw_lost(self.td)
+        self.up2k._fsw_lost("/nope")
+        self.assertEqual(self.up2k.need_rescan, set([""]))
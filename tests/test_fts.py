@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# coding: utf-8
+from __future__ import print_function, unicode_literals
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from copyparty.authsrv import AuthSrv
+from copyparty.u2idx import U2idx
+from copyparty.up2k import Up2k
+from tests import util as tu
+from tests.util import Cfg
+
+
+def have_trigram():
+    try:
+        db = sqlite3.connect(":memory:")
+        db.execute("create virtual table t using fts5(a, tokenize='trigram')")
+        db.close()
+        return True
+    except:
+        return False
+
+
+@unittest.skipUnless(have_trigram(), "needs sqlite with fts5 trigram")
+class TestFts(unittest.TestCase):
+    def __init__(self, *a, **ka):
+        super(TestFts, self).__init__(*a, **ka)
+        self.is_dut = True
+
+    def setUp(self):
+        self.td = tu.get_ramdisk()
+
+    def tearDown(self):
+        os.chdir(tempfile.gettempdir())
+        shutil.rmtree(self.td)
+
+    def log(self, src, msg, c=0):
+        pass
+
+    def search(self, q):
+        u2idx = U2idx(self)
+        vols = list(self.asrv.vfs.all_vols.values())
+        ret = u2idx.search("*", vols, q, 999)[0]
+        u2idx.shutdown()
+        return " ".join(sorted([x["rp"] for x in ret]))
+
+    def test(self):
+        td = os.path.join(self.td, "vfs")
+        os.mkdir(td)
+        os.chdir(td)
+        os.mkdir("sub")
+        for fn in "Foobar.txt foo.txt xfoobarx BARF sub/bar.FOO".split():
+            with open(fn, "wb") as f:
+                f.write(fn.encode("utf-8"))
+
+        queries = [
+            "name like *foobar*",
+            "name like *bar*",
+            "name like foo*",
+            "name like *fo*",
+            "not name like *bar*",
+            "name like *oob* or name like *barf*",
+            "path like *sub* and name like *.foo",
+        ]
+
+        self.args = Cfg(v=[".::r"], a=[], e2dsa=True, fts=True)
+        self.asrv = AuthSrv(self.args, self.log)
+        up2k = Up2k(self)
+        cur = up2k.cur[td]
+        self.assertTrue(cur.execute("select count(*) from upf").fetchone()[0])
+
+        with_fts = [self.search(x) for x in queries]
+        self.assertEqual(with_fts[0], "Foobar.txt xfoobarx")
+
+        # same hits without the index
+        self.args = Cfg(v=[".::r"], a=[], e2d=True)
+        self.asrv = AuthSrv(self.args, self.log)
+        self.assertEqual(with_fts, [self.search(x) for x in queries])
+
+        # index follows the table
+        self.args = Cfg(v=[".::r"], a=[], e2d=True, fts=True)
+        self.asrv = AuthSrv(self.args, self.log)
+        cur.execute("delete from up where fn = 'xfoobarx'")
+        cur.execute("update up set fn = 'foobaz' where fn = 'foo.txt'")
+        cur.connection.commit()
+        self.assertEqual(self.search(queries[0]), "Foobar.txt")
+        self.assertEqual(self.search("name like *obaz"), "foobaz")
+        up2k._vacuum(cur)
+        self.assertEqual(self.search("name like *obaz"), "foobaz")
+        up2k.shutdown()
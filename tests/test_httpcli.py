@@ -178,6 +178,98 @@ class TestHttpCli(unittest.TestCase):
                     ap = os.path.join(vn.realpath, rem)
                     os.unlink(ap)
 
+    def test_ranges(self):
+        td = os.path.join(self.td, "vfs")
+        os.mkdir(td)
+        os.chdir(td)
+        data = os.urandom(1000)
+        with open("f.bin", "wb") as f:
+            f.write(data)
+
+        self.args = Cfg(v=[".::r"], a=[])
+        self.asrv = AuthSrv(self.args, self.log)
+        self.conn = tu.VHttpConn(self.args, self.asrv, self.log, b"")
+
+        def get(rng, mode="GET"):
+            t = "%s /f.bin HTTP/1.1\r\nConnection: close\r\nRange: bytes=%s\r\n\r\n"
+            conn = self.conn.setbuf((t % (mode, rng)).encode("utf-8"))
+            HttpCli(conn).run()
+            h, b = conn.s._reply.split(b"\r\n\r\n", 1)
+            h = h.decode("utf-8").split("\r\n")
+            hs = dict(x.split(": ", 1) for x in h[1:])
+            if mode != "HEAD":
+                self.assertEqual(int(hs["Content-Length"]), len(b))
+            return h[0].split(" ")[1], hs, b
+
+        def parts(hs, body):
+            bnd = hs["Content-Type"].split("boundary=")[1].encode("ascii")
+            self.assertTrue(body.endswith(b"\r\n--%s--\r\n" % (bnd,)))
+            ret = []
+            for zb in body.split(b"\r\n--" + bnd)[1:-1]:
+                h, b = zb.split(b"\r\n\r\n", 1)
+                crange = h.split(b"Content-Range: bytes ")[1].split(b"/")[0]
+                a, z = [int(x) for x in crange.split(b"-")]
+                self.assertEqual(b, data[a : z + 1])
+                ret.append((a, z))
+            return ret
+
+        # single range, same as before
+        st, hs, b = get("10-19")
+        self.assertEqual(st, "206")
+        self.assertEqual(hs["Content-Range"], "bytes 10-19/1000")
+        self.assertEqual(b, data[10:20])
+
+        st, hs, b = get("0-9, 50-59, 990-")
+        self.assertEqual(st, "206")
+        self.assertIn("multipart/byteranges", hs["Content-Type"])
+        self.assertEqual(parts(hs, b), [(0, 9), (50, 59), (990, 999)])
+
+        # overlapping, adjacent and out-of-order ranges are coalesced
+        st, hs, b = get("50-59, 0-9, 5-20, 21-30, 55-56")
+        self.assertEqual(parts(hs, b), [(0, 30), (50, 59)])
+
+        # ...possibly into a single range
+        st, hs, b = get("0-9, 5-20, 21-3000")
+        self.assertEqual(hs["Content-Range"], "bytes 0-999/1000")
+        self.assertEqual(b, data)
+
+        # same length for HEAD
+        zi = int(get("0-9, 50-59", "GET")[1]["Content-Length"])
+        self.assertEqual(int(get("0-9, 50-59", "HEAD")[1]["Content-Length"]), zi)
+
+        # too many ranges; whole file
+        st, hs, b = get(", ".join("%d-%d" % (x, x) for x in range(0, 999, 2)))
+        self.assertEqual(st, "200")
+        self.assertEqual(b, data)
+
+        # suffix ranges are the last n bytes
+        st, hs, b = get("-10")
+        self.assertEqual(hs["Content-Range"], "bytes 990-999/1000")
+        self.assertEqual(b, data[-10:])
+
+        st, hs, b = get("-2000")
+        self.assertEqual(hs["Content-Range"], "bytes 0-999/1000")
+        self.assertEqual(b, data)
+
+        st, hs, b = get("0-9, -5")
+        self.assertEqual(parts(hs, b), [(0, 9), (995, 999)])
+
+        # unsatisfiable ranges are skipped...
+        st, hs, b = get("0-9, 2000-3000, -0")
+        self.assertEqual(st, "206")
+        self.assertEqual(hs["Content-Range"], "bytes 0-9/1000")
+        self.assertEqual(b, data[:10])
+
+        # ...and 416 if none are left
+        for zs in ("2000-3000", "1000-", "-0", "1000-1001, -0"):
+            st, hs, _ = get(zs)
+            self.assertEqual(st, "416")
+            self.assertEqual(hs["Content-Range"], "bytes */1000")
+
+        # malformed
+        for zs in ("9-0", "-", "a-b"):
+            self.assertEqual(get(zs)[0], "416")
+
     def can_rw(self, fp):
         # lowest non-neutral folder declares permissions
         expect = fp.split("/")[:-1]
@@ -64,6 +64,8 @@ cpp_http_conns 9$
 cpp_total_bans 9$
 cpp_sus_reqs_total 9$
 cpp_active_bans 0$
+cpp_ls_big_seconds\{quantile="0.99"\} 0\.250$
+cpp_ls_big_seconds_count 1$
 cpp_idle_vols 0$
 cpp_busy_vols 0$
 cpp_offline_vols 0$
@@ -79,6 +81,10 @@ cpp_vol_bytes\{vol="total"\} 0$
 cpp_vol_files\{vol="total"\} 0$
 cpp_dupe_bytes\{vol="total"\} 0$
 cpp_dupe_files\{vol="total"\} 0$
+cpp_lock_acquired_total\{lock="main"\} [0-9]+$
+cpp_lock_contended_total\{lock="reg"\} [0-9]+$
+cpp_lock_wait_seconds_total\{lock="main"\} [0-9]+\.[0-9]{3}$
+cpp_lock_maxwait_seconds\{lock="hashq"\} [0-9]+\.[0-9]{3}$
 """
         if not PY2:
             ptns += r"""
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# coding: utf-8
+from __future__ import print_function, unicode_literals
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from copyparty.mtag import MParser, MTag
+from tests import util as tu
+from tests.util import Cfg
+
+PLUGIN = """
+import json, os, sys, time
+
+assert sys.argv[1] == "--mtp-worker"
+for ln in sys.stdin:
+    req = json.loads(ln)
+    fn = os.path.basename(req["path"])
+    if fn == "crash":
+        os._exit(1)
+    if fn == "slow":
+        time.sleep(30)
+    if fn == "noise":
+        print("some library being chatty")
+    if fn == "bad":
+        ret = {"err": "nope"}
+    elif "tags" in req:
+        ret = {"v": {"y": req["tags"]["x"] + "!", "z": 1}}
+    else:
+        ret = {"v": "%d:%s" % (os.getpid(), fn)}
+    ret["id"] = req["id"]
+    print(json.dumps(ret))
+    if fn == "dup":
+        print(json.dumps(ret))
+    sys.stdout.flush()
+"""
+
+
+class TestMtp(unittest.TestCase):
+    def setUp(self):
+        self.td = tu.get_ramdisk()
+        os.chdir(self.td)
+        with open("w.py", "wb") as f:
+            f.write(PLUGIN.encode("utf-8"))
+        for fn in ("a", "b", "crash", "slow", "bad", "noise", "dup"):
+            with open(fn, "wb") as f:
+                f.write(b"x")
+
+    def tearDown(self):
+        os.chdir(tempfile.gettempdir())
+        shutil.rmtree(self.td)
+
+    def log(self, src, msg, c=0):
+        pass
+
+    def test_worker(self):
+        args = Cfg(no_mutagen=False, no_mtag_ff=True, mtm=[], au_unpk={})
+        args.mtag_v = True
+        mtag = MTag(self.log, args)
+        fp = os.path.join(self.td, "w.py")
+        px = {"x": MParser("x=w,t2,ad," + fp)}
+
+        def get(fn, parsers=px):
+            return mtag.get_bin(parsers, os.path.join(self.td, fn), {})
+
+        # the same process handles each file
+        pid, fn = get("a")["x"].split(":")
+        self.assertEqual(fn, "a")
+        self.assertEqual(get("b")["x"], pid + ":b")
+
+        # errors are per-file, and the worker survives
+        self.assertEqual(get("bad"), {})
+        self.assertEqual(get("a")["x"], pid + ":a")
+
+        # restarted if it crashes
+        self.assertEqual(get("crash"), {})
+        pid2 = get("a")["x"].split(":")[0]
+        self.assertNotEqual(pid, pid2)
+
+        # ...or takes longer than the timeout
+        t0 = time.time()
+        self.assertEqual(get("slow"), {})
+        self.assertLess(time.time() - t0, 10)
+        pid3 = get("a")["x"].split(":")[0]
+        self.assertNotIn(pid3, (pid, pid2))
+
+        # garbage on stdout means it is out of sync; restarted
+        self.assertEqual(get("noise"), {})
+        pid4, fn = get("a")["x"].split(":")
+        self.assertEqual(fn, "a")
+        self.assertNotEqual(pid4, pid3)
+
+        # ...and so does a reply to the wrong request
+        self.assertEqual(get("dup")["x"], pid4 + ":dup")
+        self.assertEqual(get("b"), {})
+        pid5, fn = get("b")["x"].split(":")
+        self.assertEqual(fn, "b")
+        self.assertNotEqual(pid5, pid4)
+
+        # daisychained; gets the tags so far, and returns multiple
+        py = {"y,z": MParser("y,z=w,p1,ad," + fp)}
+        py.update(px)
+        ret = get("b", py)
+        self.assertEqual(ret["y"], pid5 + ":b!")
+        self.assertEqual(ret["z"], 1)
+
+        pool = mtag.mtp_pools[px["x"].cmdline]
+        wrk = pool.idle[0]
+        mtag.shutdown()
+        self.assertIsNotNone(wrk.p.poll())
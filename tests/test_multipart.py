@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# coding: utf-8
+from __future__ import print_function, unicode_literals
+
+import os
+import random
+import unittest
+from argparse import Namespace
+
+from copyparty.util import MultipartParser, Pebkac, Unrecv
+from tests import util as tu
+from tests.util import Cfg
+
+
+class FragSock(tu.VSock):
+    """returns random-sized pieces of what was asked for"""
+
+    def __init__(self, buf, rnd):
+        super(FragSock, self).__init__(buf)
+        self.rnd = rnd
+        self.ofs = 0
+
+    def recv(self, sz):
+        if self.rnd:
+            sz = self.rnd.randint(1, sz)
+        ret = self._query[self.ofs : self.ofs + sz]
+        self.ofs += len(ret)
+        return ret
+
+
+class OldParser(MultipartParser):
+    """the previous boundary search, kept as a reference"""
+
+    def _read_data(self):
+        blen = len(self.boundary)
+        bufsz = self.args.s_rd_sz
+        while True:
+            try:
+                buf = self.sr.recv(bufsz)
+            except:
+                raise Pebkac(400, "client d/c during multipart post")
+
+            while True:
+                ofs = buf.find(self.boundary)
+                if ofs != -1:
+                    self.sr.unrecv(buf[ofs + blen :])
+                    yield buf[:ofs]
+                    return
+
+                d = len(buf) - blen
+                if d > 0:
+                    yield buf[:d]
+                    buf = buf[d:]
+
+                n = 0
+                for n in range(1, len(buf) + 1):
+                    if not buf[-n:] in self.boundary:
+                        n -= 1
+                        break
+
+                if n == 0 or not self.boundary.startswith(buf[-n:]):
+                    break
+
+                if blen == n:
+                    yield buf[:-n]
+                    return
+
+                try:
+                    buf += self.sr.recv(bufsz)
+                except:
+                    raise Pebkac(400, "client d/c during multipart post")
+
+            yield buf
+
+
+BCHARS = "abcXYZ019'()+_,-./:=?"
+
+
+class TestMultipart(unittest.TestCase):
+    def log(self, *a, **ka):
+        pass
+
+    def parse(self, cls, args, bnd, body, rnd):
+        sr = Unrecv(FragSock(body + b"GET / HTTP", rnd), None)
+        hdrs = {"content-type": "multipart/form-data; boundary=" + bnd}
+        parser = cls(self.log, args, sr, hdrs)
+        parser.parse()
+        ret = []
+        for field, _, data in parser.gen:
+            ret.append((field, b"".join(bytes(x) for x in data)))
+
+        # the next request is still there
+        self.assertEqual(sr.recv_ex(10), b"GET / HTTP")
+        return ret
+
+    def gen_value(self, rnd, bnd, extra=b""):
+        delim = b"\r\n--" + bnd
+        while True:
+            parts = []
+            for _ in range(rnd.randint(0, 12)):
+                zi = rnd.randint(0, len(delim))
+                parts.append(
+                    rnd.choice(
+                        (
+                            os.urandom(rnd.randint(1, 300)),
+                            b"\r\n",
+                            b"--",
+                            b"\r",
+                            delim[:zi],
+                            delim[zi:],
+                            delim[:-1],
+                            bnd,
+                        )
+                    )
+                )
+            ret = b"".join(parts) + extra
+            if (ret + delim).find(delim) == len(ret):
+                return ret
+
+    def test_fuzz(self):
+        rnd = random.Random(1)
+        argss = [Namespace(s_rd_sz=x) for x in (1, 7, 64, 256 * 1024)]
+        for _ in range(1000):
+            zs = "".join(rnd.choice(BCHARS) for _ in range(rnd.randint(1, 70)))
+            bnd = rnd.choice((zs, "-" * rnd.randint(1, 9), "----WebKitFormBoundary" + zs))
+            bbnd = bnd.encode("utf-8")
+
+            args = rnd.choice(argss)
+            frag = rnd if rnd.randint(0, 1) else None
+
+            fields = []
+            body = b""
+            if rnd.randint(0, 3) == 0:
+                body = b"junk\r\n"
+
+            for n in range(rnd.randint(1, 4)):
+                extra = b""
+                if n == 0 and args.s_rd_sz > 64 and rnd.randint(0, 5) == 0:
+                    extra = os.urandom(rnd.randint(1, 900 * 1024))
+
+                # the random tail must also be checked for the boundary
+                val = self.gen_value(rnd, bbnd, extra)
+
+                field = "f%d" % (n,)
+                fields.append((field, val))
+                zs = 'Content-Disposition: form-data; name="%s"' % (field,)
+                body += b"--%s\r\n%s\r\n\r\n%s\r\n" % (bbnd, zs.encode("utf-8"), val)
+
+            body += b"--%s--\r\n" % (bbnd,)
+
+            got = self.parse(MultipartParser, args, bnd, body, frag)
+            self.assertEqual(got, fields)
+
+            if args.s_rd_sz > 1 and len(body) < 64 * 1024:
+                old = self.parse(OldParser, args, bnd, body, frag)
+                self.assertEqual(got, old)
+
+    def test_dc(self):
+        body = b"--xyz\r\nContent-Disposition: form-data; name=a\r\n\r\nabc\r\n--x"
+        hdrs = {"content-type": "multipart/form-data; boundary=xyz"}
+        parser = MultipartParser(self.log, Cfg(), Unrecv(tu.VSock(body), None), hdrs)
+        parser.parse()
+        with self.assertRaises(Pebkac):
+            parser.drop()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# coding: utf-8
+from __future__ import print_function, unicode_literals
+
+import os
+import shutil
+import socket
+import tempfile
+import time
+import unittest
+
+from copyparty.authsrv import AuthSrv
+from copyparty.httpsrv import HAVE_SEL, HttpSrv
+from copyparty.util import ANYWIN, HMaccas
+from tests import util as tu
+from tests.util import Cfg
+
+
+@unittest.skipUnless(HAVE_SEL and not ANYWIN, "needs selectors")
+class TestPark(unittest.TestCase):
+    def setUp(self):
+        self.td = tu.get_ramdisk()
+        self.hsrv = None
+        self.clis = []
+
+    def tearDown(self):
+        if self.hsrv:
+            self.hsrv.shutdown()
+        for sck in self.clis:
+            sck.close()
+        os.chdir(tempfile.gettempdir())
+        shutil.rmtree(self.td)
+
+    def log(self, src, msg, c=0):
+        pass
+
+    def wait(self, fun, tmax=5):
+        t0 = time.time()
+        while not fun():
+            if time.time() - t0 > tmax:
+                self.fail("timeout")
+            time.sleep(0.02)
+
+    def connect(self, lsck):
+        cli = socket.create_connection(lsck.getsockname(), 5)
+        self.clis.append(cli)
+        sck, addr = lsck.accept()
+        self.hsrv.accept(sck, addr)
+        return cli
+
+    def req(self, cli):
+        cli.sendall(b"GET /?ls HTTP/1.1\r\nHost: a\r\n\r\n")
+        buf = b""
+        while b"\r\n\r\n" not in buf:
+            zb = cli.recv(4096)
+            if not zb:
+                self.fail("disconnected")
+            buf += zb
+        hdr, body = buf.split(b"\r\n\r\n", 1)
+        sz = int(hdr.lower().split(b"content-length: ")[1].split(b"\r")[0])
+        while len(body) < sz:
+            body += cli.recv(4096)
+        self.assertTrue(hdr.startswith(b"HTTP/1.1 200 "))
+
+    def test(self):
+        args = Cfg(v=[self.td + "::r"], a=[], s_thead=1)
+        broker = tu.NullBroker(args, AuthSrv(args, self.log))
+        broker.log = self.log
+        broker.iphash = HMaccas(os.path.join(self.td, "iphash"), 8)
+        hsrv = self.hsrv = HttpSrv(broker, None)
+
+        lsck = socket.socket()
+        lsck.bind(("127.0.0.1", 0))
+        lsck.listen(4)
+        try:
+            # parked before the first request, and after each one
+            cli = self.connect(lsck)
+            self.wait(lambda: hsrv.npark == 1)
+            self.req(cli)
+            self.wait(lambda: hsrv.npark == 1)
+            self.req(cli)
+            self.wait(lambda: hsrv.npark == 1)
+            self.assertEqual(hsrv.ncli, 1)
+
+            # and dropped when idle for --s-thead
+            t0 = time.time()
+            self.assertEqual(cli.recv(4096), b"")
+            self.assertGreater(time.time() - t0, 0.5)
+            self.wait(lambda: not hsrv.ncli)
+            self.assertEqual(hsrv.npark, 0)
+
+            # still parked at shutdown; dropped, and the selector closed
+            cli = self.connect(lsck)
+            self.wait(lambda: hsrv.npark == 1)
+            self.hsrv = None
+            hsrv.shutdown()
+            self.assertFalse(hsrv.t_park.is_alive())
+            self.wait(lambda: not hsrv.ncli)
+            self.assertEqual(hsrv.npark, 0)
+            self.assertEqual(hsrv.park_r.fileno(), -1)
+            self.assertEqual(hsrv.park_w.fileno(), -1)
+            self.assertEqual(cli.recv(4096), b"")
+        finally:
+            lsck.close()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# coding: utf-8
+from __future__ import print_function, unicode_literals
+
+import errno
+import os
+import shutil
+import tempfile
+import unittest
+
+from copyparty import fsutil
+from copyparty import util as Util
+from copyparty.authsrv import AuthSrv
+from copyparty.util import HAVE_CFR, HAVE_FICLONE, fcopy, fcopy_range
+from tests import util as tu
+from tests.util import Cfg
+
+# set CPP_REFLINK_DIR to a folder on btrfs/xfs (a loopback mount is fine)
+# to test actual reflinks; otherwise this runs on the ramdisk which can't,
+# so it only checks that everything falls back correctly
+
+
+class TestReflink(unittest.TestCase):
+    def setUp(self):
+        zs = os.environ.get("CPP_REFLINK_DIR")
+        if zs:
+            self.td = tempfile.mkdtemp(prefix="cpp-reflink-", dir=zs)
+        else:
+            self.td = tu.get_ramdisk()
+        os.chdir(self.td)
+
+    def tearDown(self):
+        os.chdir(tempfile.gettempdir())
+        shutil.rmtree(self.td)
+
+    def log(self, src, msg, c=0):
+        pass
+
+    def test_copy(self):
+        csz = 1024 * 1024
+        data = os.urandom(csz * 2) + b"tail"
+        with open("a", "wb") as f:
+            f.write(data)
+        os.utime("a", (1, 1234567890))
+
+        for flags in ({}, {"reflink": True}):
+            fcopy("a", "b", flags)
+            with open("b", "rb") as f:
+                self.assertEqual(f.read(), data)
+            self.assertEqual(int(os.stat("b").st_mtime), 1234567890)
+            os.unlink("b")
+
+        # chunk cloning within the same file, like handle_post_binary
+        for clone in (False, True):
+            with open("c", "wb") as f:
+                f.write(data[:csz] + b"\x00" * csz * 2)
+
+            with open("c", "rb+") as f:
+                fd = f.fileno()
+                fcopy_range(fd, fd, 0, csz, csz, clone)
+                fcopy_range(fd, fd, 0, csz * 2, csz, clone)
+
+            with open("c", "rb") as f:
+                self.assertEqual(f.read(), data[:csz] * 3)
+
+    @unittest.skipUnless(HAVE_CFR, "needs copy_file_range")
+    def test_cfr_zero(self):
+        data = os.urandom(1024 * 1024 + 5)
+        with open("a", "wb") as f:
+            f.write(data)
+
+        # some filesystems return 0 instead of copying anything
+        orig = os.copy_file_range
+        try:
+            os.copy_file_range = lambda *a: 0
+            fcopy("a", "b", {})
+            with open("b", "rb") as f:
+                self.assertEqual(f.read(), data)
+        finally:
+            os.copy_file_range = orig
+
+        # and a short copy is an error, not a smaller file
+        orig = Util.fcopy_range
+        try:
+            Util.fcopy_range = lambda *a: None
+            with self.assertRaises(Exception):
+                fcopy("a", "c", {})
+        finally:
+            Util.fcopy_range = orig
+
+        self.assertFalse(os.path.exists("c"))
+
+    def test_dedup(self):
+        os.mkdir("v")
+        with open("v/a", "wb") as f:
+            f.write(b"hello")
+
+        args = Cfg(v=["v::A"], a=[])
+        asrv = AuthSrv(args, self.log)
+        up2k = tu.VHub(args, asrv, self.log).up2k
+        ok = up2k.fstab.can_reflink(os.path.abspath("v"))
+        self.assertIn(ok, up2k.fstab.reflinks.values())
+        self.assertEqual(os.listdir("v"), ["a"])  # probe cleaned up
+
+        src = os.path.abspath("v/a")
+        for n, flags in enumerate(
+            ({"reflink": True}, {"reflink": True, "dedup": True})
+        ):
+            dst = os.path.abspath("v/b%d" % (n,))
+            up2k._symlink(src, dst, flags, lmod=1234567890)
+            with open(dst, "rb") as f:
+                self.assertEqual(f.read(), b"hello")
+
+            # a clone or a full copy is a regular file; dedup falls back to symlinks
+            want_link = "dedup" in flags and not ok
+            self.assertEqual(os.path.islink(dst), want_link)
+            if not want_link:
+                self.assertEqual(int(os.stat(dst).st_mtime), 1234567890)
+
+        up2k.shutdown()
+
+    @unittest.skipUnless(HAVE_FICLONE, "needs ficlone")
+    def test_probe(self):
+        fstab = fsutil.Fstab(self.log, Cfg())
+        td = os.path.abspath(".")
+        dev = os.stat(td).st_dev
+
+        # could not even create the probe; no verdict
+        fn = ".cpr-reflink-%d" % (os.getpid(),)
+        os.mkdir(fn)
+        self.assertFalse(fstab.can_reflink(td))
+        self.assertNotIn(dev, fstab.reflinks)
+        os.rmdir(fn)
+
+        def fclone(err):
+            def fun(*a):
+                raise OSError(err, os.strerror(err))
+
+            return fun
+
+        orig = fsutil.fclone
+        try:
+            # likewise if the clone fails for other reasons
+            fsutil.fclone = fclone(errno.ENOSPC)
+            self.assertFalse(fstab.can_reflink(td))
+            self.assertNotIn(dev, fstab.reflinks)
+
+            # but the fs saying no is remembered
+            fsutil.fclone = fclone(errno.EOPNOTSUPP)
+            self.assertFalse(fstab.can_reflink(td))
+            self.assertEqual(fstab.reflinks[dev], False)
+
+            fsutil.fclone = orig
+            self.assertFalse(fstab.can_reflink(td))
+        finally:
+            fsutil.fclone = orig
+
+        self.assertEqual(os.listdir("."), [])
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# coding: utf-8
+from __future__ import print_function, unicode_literals
+
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+
+from copyparty.__init__ import E
+from copyparty.authsrv import AuthSrv
+from copyparty.httpcli import HttpCli
+from copyparty.rescache import ResCache
+from tests import util as tu
+from tests.util import Cfg
+
+
+class TestResCache(unittest.TestCase):
+    def setUp(self):
+        self.td = tu.get_ramdisk()
+
+    def tearDown(self):
+        os.chdir(tempfile.gettempdir())
+        shutil.rmtree(self.td)
+
+    def log(self, src, msg, c=0):
+        pass
+
+    def get(self, url, hdrs=""):
+        t = "GET /%s HTTP/1.1\r\nConnection: close\r\n%s\r\n"
+        conn = self.conn.setbuf((t % (url, hdrs)).encode("utf-8"))
+        HttpCli(conn).run()
+        h, b = conn.s._reply.split(b"\r\n\r\n", 1)
+        h = h.decode("utf-8").split("\r\n")
+        hs = dict(x.split(": ", 1) for x in h[1:])
+        return h[0].split(" ")[1], hs, b
+
+    def test(self):
+        os.chdir(self.td)
+        args = Cfg(v=[".::r"], a=[])
+        asrv = AuthSrv(args, self.log)
+        self.conn = tu.VHttpConn(args, asrv, self.log, b"")
+        rc = ResCache(E, self.log)
+        rc.build()
+        self.conn.hsrv.res = rc
+
+        with open(os.path.join(E.mod, "web", "ui.css"), "rb") as f:
+            want = f.read()
+
+        st, hs, b = self.get(".cpr/ui.css")
+        self.assertEqual(st, "200")
+        self.assertNotIn("Content-Encoding", hs)
+        self.assertEqual(b, want)
+        etag = hs["ETag"]
+
+        st, hs, b = self.get(".cpr/ui.css", "Accept-Encoding: gzip;q=1.0, x\r\n")
+        self.assertEqual(hs["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", hs["Vary"])
+        self.assertEqual(int(hs["Content-Length"]), len(b))
+        self.assertEqual(gzip.decompress(b), want)
+
+        # any edition's etag is good for a 304
+        for zs in (etag, hs["ETag"], 'W/"x", ' + etag):
+            st, _, b = self.get(".cpr/ui.css", "If-None-Match: %s\r\n" % (zs,))
+            self.assertEqual(st, "304")
+            self.assertEqual(b, b"")
+
+        st, _, _ = self.get(".cpr/ui.css", 'If-None-Match: "x"\r\n')
+        self.assertEqual(st, "200")
+
+        # images are not compressed
+        st, hs, b = self.get(".cpr/iiam.gif", "Accept-Encoding: gzip\r\n")
+        self.assertNotIn("Content-Encoding", hs)
+        self.assertTrue(b.startswith(b"GIF"))
+
+        # q=0 means no
+        for zs in ("gzip;q=0", "gzip; q=0.0, br;q=0", "gzip;q=x"):
+            st, hs, b = self.get(".cpr/ui.css", "Accept-Encoding: %s\r\n" % (zs,))
+            self.assertNotIn("Content-Encoding", hs)
+            self.assertEqual(b, want)
+
+        # same lastmod hint as tx_res for users who can write
+        self.assertNotIn("X-Lastmod3", hs)
+        args = Cfg(v=[".::rw"], a=[])
+        self.conn = tu.VHttpConn(args, AuthSrv(args, self.log), self.log, b"")
+        self.conn.hsrv.res = rc
+        st, hs, b = self.get(".cpr/ui.css")
+        zs = str(int(rc.cache["web/ui.css"].ts * 1000))
+        self.assertEqual(hs["X-Lastmod3"], zs)
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# coding: utf-8
+from __future__ import print_function, unicode_literals
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from copyparty.authsrv import AuthSrv
+from copyparty.u2idx import U2idx
+from copyparty.up2k import Up2k
+from tests import util as tu
+from tests.util import Cfg
+
+
+class TestSearch(unittest.TestCase):
+    def __init__(self, *a, **ka):
+        super(TestSearch, self).__init__(*a, **ka)
+        self.is_dut = True
+
+    def setUp(self):
+        self.td = tu.get_ramdisk()
+
+    def tearDown(self):
+        os.chdir(tempfile.gettempdir())
+        shutil.rmtree(self.td)
+
+    def log(self, src, msg, c=0):
+        pass
+
+    def search(self, q, lim=999):
+        u2idx = U2idx(self)
+        vols = list(sorted(self.asrv.vfs.all_vols.items()))
+        vols = [x[1] for x in vols]
+        ret, taglist, more = u2idx.search("*", vols, q, lim)
+        u2idx.shutdown()
+        return ret, taglist, more
+
+    def test(self):
+        td = os.path.join(self.td, "vfs")
+        os.mkdir(td)
+        os.chdir(td)
+        for vn in "a b c".split():
+            os.makedirs(os.path.join(vn, "sub"))
+            for n in range(4):
+                fn = "%s/sub/f%d.txt" % (vn, n)
+                with open(fn, "wb") as f:
+                    f.write(fn.encode("utf-8"))
+
+        vols = ["a:a:r", "b:b:r", "c:c:r"]
+        self.args = Cfg(v=vols, a=[], e2dsa=True)
+        self.asrv = AuthSrv(self.args, self.log)
+        up2k = Up2k(self)
+
+        # tags are fetched in one go per volume
+        for ptop, cur in up2k.cur.items():
+            q = "select substr(w,1,16) from up where fn = 'f1.txt'"
+            for (w,) in cur.execute(q).fetchall():
+                cur.execute("insert into mt values (?,?,?)", (w, "artist", ptop))
+            cur.connection.commit()
+
+        ret, taglist, more = self.search("name like *.txt")
+        rps = sorted(x["rp"] for x in ret)
+        self.assertEqual(len(rps), 12)
+        self.assertEqual(len(set(rps)), 12)
+        self.assertFalse(more)
+        self.assertEqual(taglist, ["artist"])
+        tagged = [x["rp"] for x in ret if x["tags"]]
+        self.assertEqual(len(tagged), 3)
+        for x in ret:
+            if x["tags"]:
+                self.assertTrue(x["rp"].endswith("/f1.txt"))
+
+        # limit applies across all volumes, in volume order
+        ret, _, more = self.search("name like *.txt", 6)
+        rps = [x["rp"] for x in ret]
+        self.assertEqual(len(rps), 6)
+        self.assertEqual(len([x for x in rps if x.startswith("a/")]), 4)
+        self.assertTrue(more)
+
+        ret, _, more = self.search("name like *.txt", 4)
+        self.assertEqual(len(ret), 4)
+        self.assertTrue(more)
+
+        # tags from the volume where the limit was reached
+        for ptop, cur in up2k.cur.items():
+            cur.execute("delete from mt")
+            if ptop.endswith("b"):
+                q = "select substr(w,1,16) from up"
+                for (w,) in cur.execute(q).fetchall():
+                    cur.execute("insert into mt values (?,?,?)", (w, "album", "x"))
+            cur.connection.commit()
+
+        ret, taglist, more = self.search("name like *.txt", 6)
+        self.assertEqual(len([x for x in ret if x["tags"]]), 2)
+        self.assertEqual(taglist, ["album"])
+        self.assertTrue(more)
+
+        up2k.shutdown()
+
+    def test_ls(self):
+        td = os.path.join(self.td, "vfs")
+        os.makedirs(os.path.join(td, "d", "sub1"))
+        os.makedirs(os.path.join(td, "d", "sub2"))
+        os.chdir(td)
+        for fn in "d/a d/b d/sub1/c d/sub2/d d/sub2/e".split():
+            with open(fn, "wb") as f:
+                f.write(fn.encode("utf-8"))
+
+        self.args = Cfg(v=[".::r"], a=[], e2dsa=True, ls_cache=2)
+        self.asrv = AuthSrv(self.args, self.log)
+        vol = self.asrv.vfs.all_vols[""]
+        up2k = Up2k(self)
+        cur = up2k.cur[td]
+        (w,) = cur.execute("select substr(w,1,16) from up where fn = 'a'").fetchone()
+        cur.execute("insert into mt values (?,?,?)", (w, "artist", "x"))
+        cur.connection.commit()
+
+        u2idx = U2idx(self)
+        files, dsz = u2idx.ls_meta(vol, "d", ["sub1", "sub2", "nope"])
+        self.assertEqual(sorted(files), ["a", "b"])
+        self.assertEqual(files["a"][2], {"artist": "x"})
+        self.assertEqual(files["b"][2], {})
+        self.assertEqual(dsz["sub1"][1], 1)
+        self.assertEqual(dsz["sub2"][1], 2)
+
+        # cached until the db changes
+        zt = u2idx.ls_meta(vol, "d", ["sub1"])
+        self.assertIs(zt[0], files)
+        cur.execute("insert into mt values (?,?,?)", (w, "title", "y"))
+        cur.connection.commit()
+        files, _ = u2idx.ls_meta(vol, "d", ["sub1"])
+        self.assertEqual(files["a"][2], {"artist": "x", "title": "y"})
+
+        # a subfolder that was not looked up last time is a miss
+        zt = u2idx.ls_meta(vol, "d", ["sub3"])
+        self.assertIsNot(zt[0], files)
+
+        u2idx.shutdown()
+        up2k.shutdown()
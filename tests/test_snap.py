@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# coding: utf-8
+from __future__ import print_function, unicode_literals
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from copyparty.authsrv import AuthSrv
+from copyparty.up2k import snap_load
+from tests import util as tu
+from tests.util import Cfg
+
+
+class TestSnap(unittest.TestCase):
+    def setUp(self):
+        self.td = tu.get_ramdisk()
+        os.chdir(self.td)
+        os.mkdir("v")
+
+    def tearDown(self):
+        os.chdir(tempfile.gettempdir())
+        shutil.rmtree(self.td)
+
+    def log(self, src, msg, c=0):
+        pass
+
+    def boot(self):
+        args = Cfg(v=["v::A"], a=[], no_snap=False, snap_wri=300, snap_drop=1440.0)
+        asrv = AuthSrv(args, self.log)
+        vol = asrv.vfs.all_vols[""]
+        up2k = tu.VHub(args, asrv, self.log).up2k
+        with up2k.mutex, up2k.reg_mutex:
+            up2k.register_vpath(vol.realpath, vol.flags)
+        self.snap = os.path.join(asrv.vfs.histtab[vol.realpath], "up2k.snap")
+        return up2k, vol.realpath
+
+    def add_job(self, up2k, ptop, n, nchunks):
+        fn = "f%d" % (n,)
+        with open(os.path.join(ptop, fn), "wb"):
+            pass
+
+        hashes = ["%043d%d" % (n, x) for x in range(nchunks)]
+        job = {
+            "wark": "w%043d" % (n,),
+            "dwrk": "w%043d" % (n,),
+            "ptop": ptop,
+            "vtop": "",
+            "prel": "",
+            "name": fn,
+            "tnam": fn + ".PARTIAL",
+            "size": 1024 * 1024 * nchunks,
+            "lmod": 1,
+            "t0": time.time(),
+            "poke": time.time(),
+            "sprs": True,
+            "addr": "1.2.3.4",
+            "host": "",
+            "user": "*",
+            "hash": hashes,
+            "need": hashes[:],
+            "busy": {},
+        }
+        with up2k.mutex, up2k.reg_mutex:
+            up2k.registry[ptop][job["wark"]] = job
+        return job
+
+    def test(self):
+        up2k, ptop = self.boot()
+        j1 = self.add_job(up2k, ptop, 1, 8)
+        j2 = self.add_job(up2k, ptop, 2, 4)
+
+        # nothing on disk yet, so both jobs go into the journal
+        up2k.do_snapshot()
+        jpath = self.snap + ".jnl"
+        self.assertFalse(os.path.exists(self.snap))
+        jsz = os.path.getsize(jpath)
+
+        # then just the confirmed chunks
+        up2k.confirm_chunks(ptop, j1["wark"], j1["hash"][:3], [])
+        up2k.do_snapshot()
+        with open(jpath, "rb") as f:
+            jnl = f.read()[jsz:]
+        self.assertIn(j1["hash"][2].encode("utf-8"), jnl)
+        self.assertNotIn(j1["hash"][4].encode("utf-8"), jnl)
+
+        # a new job is journaled in full, a dropped job as a tombstone
+        j3 = self.add_job(up2k, ptop, 3, 2)
+        with up2k.mutex, up2k.reg_mutex:
+            del up2k.registry[ptop][j2["wark"]]
+        up2k.do_snapshot()
+
+        # nothing changed; nothing written
+        jsz = os.path.getsize(jpath)
+        up2k.do_snapshot()
+        self.assertEqual(jsz, os.path.getsize(jpath))
+
+        # torn write from a crash
+        with open(jpath, "ab") as f:
+            f.write(b'["c","')
+
+        reg, _ = snap_load(self.snap)
+        self.assertEqual(sorted(reg), sorted([j1["wark"], j3["wark"]]))
+        self.assertEqual(reg[j1["wark"]]["need"], j1["hash"][3:])
+        self.assertEqual(reg[j3["wark"]]["need"], j3["hash"])
+
+        # reboot; journal gets folded into the snap
+        up2k.shutdown()
+        up2k, ptop = self.boot()
+        self.assertFalse(os.path.exists(jpath))
+        reg = up2k.registry[ptop]
+        self.assertEqual(sorted(reg), sorted([j1["wark"], j3["wark"]]))
+        self.assertEqual(reg[j1["wark"]]["need"], j1["hash"][3:])
+
+        # and journaling continues from there
+        up2k.confirm_chunks(ptop, j1["wark"], j1["hash"][3:5], [])
+        up2k.do_snapshot()
+        reg, _ = snap_load(self.snap)
+        self.assertEqual(reg[j1["wark"]]["need"], j1["hash"][5:])
+
+        # last one out turns off the lights
+        with up2k.mutex, up2k.reg_mutex:
+            up2k.registry[ptop].clear()
+        up2k.do_snapshot()
+        self.assertFalse(os.path.exists(self.snap))
+        self.assertFalse(os.path.exists(jpath))
+        up2k.shutdown()
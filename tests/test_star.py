@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# coding: utf-8
+from __future__ import print_function, unicode_literals
+
+import io
+import os
+import random
+import shutil
+import tarfile
+import tempfile
+import unittest
+import zipfile
+
+from copyparty.authsrv import AuthSrv
+from copyparty.star import StreamTar
+from copyparty.szip import StreamZip
+from tests import util as tu
+from tests.util import Cfg
+
+
+class TestStar(unittest.TestCase):
+    def setUp(self):
+        self.td = tu.get_ramdisk()
+        td = os.path.join(self.td, "vfs")
+        os.mkdir(td)
+        os.chdir(td)
+        os.mkdir("sub")
+        rnd = random.Random(1)
+        words = "foo bar baz qux\n".split(" ")
+        self.want = {}
+        for fn, sz in (("a.txt", 5), ("empty", 0), ("sub/b.txt", 2500 * 1024)):
+            zs = "".join(rnd.choice(words) for _ in range(sz // 4))[:sz]
+            self.want["top/" + fn] = zb = zs.encode("utf-8")
+            with open(fn, "wb") as f:
+                f.write(zb)
+
+        self.want["top/rnd.bin"] = zb = os.urandom(300 * 1024)
+        with open("rnd.bin", "wb") as f:
+            f.write(zb)
+
+    def tearDown(self):
+        os.chdir(tempfile.gettempdir())
+        shutil.rmtree(self.td)
+
+    def log(self, *a, **ka):
+        pass
+
+    def fgen(self, asrv):
+        return asrv.vfs.zipgen("", "", set(), "*", False, True)
+
+    def test_tar(self):
+        for nthr in (1, 3):
+            asrv = AuthSrv(Cfg(v=[".::r"], a=[], arc_mt=nthr), self.log)
+            for cmp in ("gz", "xz:0", "bz2:1"):
+                gen = StreamTar(self.log, asrv, self.fgen(asrv), cmp=cmp).gen()
+                zb = b"".join(x for x in gen if x)
+                mode = "r:" + cmp.split(":")[0]
+                with tarfile.open(fileobj=io.BytesIO(zb), mode=mode) as tf:
+                    got = {x.name: tf.extractfile(x).read() for x in tf.getmembers()}
+
+                self.assertEqual(got, self.want)
+
+    def test_zip(self):
+        for nthr in (1, 3):
+            asrv = AuthSrv(Cfg(v=[".::r"], a=[], arc_mt=nthr), self.log)
+            for cmp in ("dfl", "dfl:6", "utf8,dfl:0"):
+                gen = StreamZip(self.log, asrv, self.fgen(asrv), cmp=cmp).gen()
+                with zipfile.ZipFile(io.BytesIO(b"".join(gen)), "r") as zf:
+                    self.assertIsNone(zf.testzip())
+                    got = {x: zf.read(x) for x in zf.namelist()}
+                    zi = zf.getinfo("top/sub/b.txt")
+                    self.assertEqual(zi.compress_type, zipfile.ZIP_DEFLATED)
+
+                self.assertEqual(got, self.want)
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+# coding: utf-8
+from __future__ import print_function, unicode_literals
+
+import io
+import os
+import random
+import shutil
+import socket
+import tempfile
+import threading
+import unittest
+import zipfile
+import zlib
+
+from copyparty.authsrv import AuthSrv
+from copyparty.httpcli import HttpCli
+from copyparty.szip import StoreZip, StreamZip
+from copyparty.up2k import Up2k
+from copyparty.util import crc32_combine, crc32_op, sendvec
+from tests import util as tu
+from tests.util import Cfg
+
+
+class TestSzip(unittest.TestCase):
+    def __init__(self, *a, **ka):
+        super(TestSzip, self).__init__(*a, **ka)
+        self.is_dut = True
+
+    def setUp(self):
+        self.td = tu.get_ramdisk()
+        td = os.path.join(self.td, "vfs")
+        os.mkdir(td)
+        os.chdir(td)
+        os.mkdir("sub")
+        rnd = random.Random(1)
+        self.fns = ["a.txt", "empty", "sub/big.bin", "sub/åäö.txt"]
+        for fn, sz in zip(self.fns, (5, 0, 300 * 1024, 70000)):
+            with open(fn, "wb") as f:
+                f.write(bytes(bytearray(rnd.getrandbits(8) for _ in range(sz))))
+
+    def tearDown(self):
+        os.chdir(tempfile.gettempdir())
+        shutil.rmtree(self.td)
+
+    def log(self, src, msg, c=0):
+        pass
+
+    def zlog(self, msg, c=0):
+        pass
+
+    def get(self, url, hdrs="", mode="GET"):
+        t = "%s /%s HTTP/1.1\r\nConnection: close\r\n%s\r\n"
+        conn = self.conn.setbuf((t % (mode, url, hdrs)).encode("utf-8"))
+        HttpCli(conn).run()
+        h, b = conn.s._reply.split(b"\r\n\r\n", 1)
+        h = h.decode("utf-8").split("\r\n")
+        hs = dict(x.split(": ", 1) for x in h[1:])
+        return h[0].split(" ")[1], hs, b
+
+    def streamzip(self, utf8, pre_crc=True, vec=False):
+        asrv = AuthSrv(Cfg(v=[".::r"], a=[]), self.log)
+        fgen = asrv.vfs.zipgen("", "", set(), "*", False, True)
+        zs = StreamZip(self.zlog, asrv, fgen, utf8, pre_crc, vec=vec)
+        if vec:
+            return self.flatten(zs.gen())
+        return b"".join(zs.gen())
+
+    def flatten(self, gen):
+        # lists of buffers, and files larger than 64k as (ap, ofs, end)
+        ret = []
+        for x in gen:
+            if isinstance(x, list):
+                x = b"".join(x)
+            elif isinstance(x, tuple):
+                with open(x[0], "rb") as f:
+                    f.seek(x[1])
+                    x = f.read(x[2] - x[1])
+            ret.append(x)
+        return b"".join(ret)
+
+    def test_crc32_combine(self):
+        a = os.urandom(1000)
+        b = os.urandom(777)
+        zi = crc32_combine(zlib.crc32(a), zlib.crc32(b), crc32_op(len(b)))
+        self.assertEqual(zi, zlib.crc32(a + b) & 0xFFFFFFFF)
+
+    def test_vec(self):
+        for pre_crc in (True, False):
+            want = self.streamzip(True, pre_crc)
+            self.assertEqual(self.streamzip(True, pre_crc, True), want)
+            with zipfile.ZipFile(io.BytesIO(want), "r") as zf:
+                self.assertIsNone(zf.testzip())
+
+        bufs = [os.urandom(random.randint(0, 300)) for _ in range(2500)]
+        bufs.append(os.urandom(1024 * 1024))
+        a, b = socket.socketpair()
+        ret = []
+
+        def rx():
+            while True:
+                zb = b.recv(65536)
+                if not zb:
+                    break
+                ret.append(zb)
+
+        t = threading.Thread(target=rx)
+        t.start()
+        sendvec(a, bufs)
+        a.close()
+        t.join()
+        b.close()
+        self.assertEqual(b"".join(ret), b"".join(bufs))
+
+    def test_layout(self):
+        want = self.streamzip(True)
+        for known in (True, False):
+            files = []
+            for fn in self.fns:
+                with open(fn, "rb") as f:
+                    crc = zlib.crc32(f.read()) & 0xFFFFFFFF
+                st = os.stat(fn)
+                files.append(["top/" + fn, fn, st.st_size, st.st_mtime, crc])
+                if not known and st.st_size:
+                    files[-1][4] = None
+
+            zs = StoreZip(self.zlog, 65536, files, True)
+            self.assertEqual(zs.size, len(want))
+            self.assertEqual(self.flatten(zs.gen(0, zs.size)), want)
+            self.assertEqual(len(zs.new_crcs), 0 if known else 3)
+
+            rnd = random.Random(2)
+            for _ in range(200):
+                a = rnd.randint(0, zs.size - 1)
+                b = rnd.randint(a + 1, zs.size)
+                self.assertEqual(self.flatten(zs.gen(a, b)), want[a:b])
+
+    def test_http(self):
+        td = os.getcwd()
+        self.args = Cfg(v=[".::r"], a=[], e2dsa=True)
+        self.asrv = AuthSrv(self.args, self.log)
+        up2k = Up2k(self)
+        cur = up2k.cur[td]
+        self.assertEqual(cur.execute("select count(*) from cr").fetchone()[0], 3)
+        self.conn = tu.VHttpConn(self.args, self.asrv, self.log, b"")
+        want = self.streamzip(False)
+
+        st, hs, b = self.get("?zip=store")
+        self.assertEqual(st, "200")
+        self.assertEqual(int(hs["Content-Length"]), len(want))
+        self.assertEqual(b, want)
+        with zipfile.ZipFile(io.BytesIO(b), "r") as zf:
+            self.assertIsNone(zf.testzip())
+        etag = hs["ETag"]
+
+        st, hs, b = self.get("?zip=store", mode="HEAD")
+        self.assertEqual(int(hs["Content-Length"]), len(want))
+        self.assertEqual(b, b"")
+
+        # resume
+        zi = len(want)
+        for rng, a, b2 in (("100-", 100, zi), ("-30", zi - 30, zi), ("5-9", 5, 10)):
+            zs = "Range: bytes=%s\r\nIf-Range: %s\r\n" % (rng, etag)
+            st, hs, b = self.get("?zip=store", zs)
+            self.assertEqual(st, "206")
+            self.assertEqual(b, want[a:b2])
+            zs = "bytes %d-%d/%d" % (a, b2 - 1, len(want))
+            self.assertEqual(hs["Content-Range"], zs)
+
+        # the archive changed; start over
+        zs = 'Range: bytes=100-\r\nIf-Range: "x"\r\n'
+        st, hs, b = self.get("?zip=store", zs)
+        self.assertEqual(st, "200")
+
+        # the crcs really are from the db
+        cur.execute("update cr set v = 1")
+        cur.connection.commit()
+        st, hs, b = self.get("?zip=store")
+        with zipfile.ZipFile(io.BytesIO(b), "r") as zf:
+            self.assertIsNotNone(zf.testzip())
+
+        # ...unless the file changed since it was indexed
+        cur.execute("update up set mt = 1")
+        cur.connection.commit()
+        st, hs, b = self.get("?zip=store")
+        self.assertEqual(b, want)
+        up2k.shutdown()
@@ -0,0 +1,404 @@
+#!/usr/bin/env python3
+# coding: utf-8
+from __future__ import print_function, unicode_literals
+
+import os
+import shutil
+import socket
+import struct
+import tempfile
+import threading
+import time
+import unittest
+
+from copyparty.authsrv import AuthSrv
+from copyparty.th_srv import HAVE_PIL, ThumbSrv, exif_thumb, th_fmt
+from copyparty.util import sck_alive
+from tests import util as tu
+from tests.util import Cfg
+
+
+def exif_blob(e, th, rot=1, short=False):
+    """tiff header, IFD0 with the orientation, IFD1 with the thumbnail"""
+    hdr = (b"II" if e == "<" else b"MM") + struct.pack(e + "HI", 42, 8)
+    ifd0 = struct.pack(e + "H", 1) + struct.pack(e + "HHIHH", 0x112, 3, 1, rot, 0)
+    ofs = 8 + len(ifd0) + 4
+    ifd0 += struct.pack(e + "I", ofs)
+    ifd1 = struct.pack(e + "H", 2)
+    ifd1 += struct.pack(e + "HHII", 0x201, 4, 1, ofs + 2 + 2 * 12 + 4)
+    if short:
+        ifd1 += struct.pack(e + "HHIHH", 0x202, 3, 1, len(th), 0)
+    else:
+        ifd1 += struct.pack(e + "HHII", 0x202, 4, 1, len(th))
+    ifd1 += struct.pack(e + "I", 0)
+    return b"Exif\x00\x00" + hdr + ifd0 + ifd1 + th
+
+
+class Hub(object):
+    def __init__(self, args, log):
+        self.args = args
+        self.log = log
+        self.asrv = AuthSrv(args, log)
+
+
+class FakeThumbSrv(ThumbSrv):
+    """no pillow/vips/ffmpeg here; just write something and log the order"""
+
+    def __init__(self, hub):
+        self.done = []
+        self.hold = {}
+        super(FakeThumbSrv, self).__init__(hub)
+
+    def conv_pil(self, abspath, tpath, fmt, vn):
+        fn = os.path.basename(abspath)
+        ev = self.hold.get(fn)
+        if ev:
+            ev.wait(10)
+
+        self.done.append(fn)
+        with open(tpath, "wb") as f:
+            f.write(b"t" * 1000)
+
+
+class TestThumb(unittest.TestCase):
+    def setUp(self):
+        self.td = tu.get_ramdisk()
+        os.chdir(self.td)
+        for fn in ("a.jpg", "b.jpg", "c.jpg", "d.jpg", "slow.jpg"):
+            with open(fn, "wb") as f:
+                f.write(b"x")
+
+        for dn in ("d1", "d2", "d3"):
+            os.mkdir(dn)
+            with open(dn + "/a.jpg", "wb") as f:
+                f.write(b"x")
+
+    def tearDown(self):
+        os.chdir(tempfile.gettempdir())
+        shutil.rmtree(self.td)
+
+    def log(self, src, msg, c=0):
+        pass
+
+    def mksrv(self, **ka):
+        ka2 = {
+            "v": [".::r:c,thpre"],
+            "th_mt": 1,
+            "th_dec": ["pil"],
+            "th_ram_max": 6,
+            "th_poke": 300,
+            "th_clean": 0,
+            "th_maxage": 604800,
+            "ac_maxage": 86400,
+            "th_no_jpg": False,
+            "th_no_webp": False,
+            "th_ff_jpg": False,
+            "th_r_pil": "jpg",
+            "th_r_vips": "",
+            "th_r_ffi": "",
+            "th_r_ffv": "",
+            "th_r_ffa": "",
+            "au_unpk": {},
+        }
+        ka2.update(ka)
+        hub = Hub(Cfg(**ka2), self.log)
+        self.ptop = hub.asrv.vfs.realpath
+        return FakeThumbSrv(hub)
+
+    def wait_pre(self, srv, ndone):
+        for _ in range(100):
+            if srv.pre_state()[1] >= ndone:
+                return
+            time.sleep(0.05)
+
+    def test_pregen(self):
+        srv = self.mksrv()
+        try:
+            srv.pregen(self.ptop, "a.jpg", os.path.getmtime("a.jpg"))
+            self.wait_pre(srv, 1)
+            self.assertEqual(srv.done, ["a.jpg"])
+            self.assertEqual(srv.pre_state(), (0, 1, 0))
+
+            # and then the client finds it ready to go
+            fmt = th_fmt(srv.args, srv.asrv.vfs.flags, "w", True, srv.can_webp)
+            ret = srv.get(self.ptop, "a.jpg", os.path.getmtime("a.jpg"), fmt)
+            self.assertTrue(ret and os.path.exists(ret))
+            self.assertEqual(srv.done, ["a.jpg"])
+
+            # unknown/disabled files are skipped
+            srv.pregen(self.ptop, "nope.txt", 1)
+            srv.pregen("/nowhere", "a.jpg", 1)
+            time.sleep(0.2)
+            self.assertEqual(srv.pre_state(), (0, 1, 0))
+        finally:
+            srv.shutdown()
+
+    def test_priority(self):
+        srv = self.mksrv()
+        try:
+            ev = srv.hold["slow.jpg"] = threading.Event()
+            rets = []
+
+            def get():
+                mt = os.path.getmtime("slow.jpg")
+                rets.append(srv.get(self.ptop, "slow.jpg", mt, "j"))
+
+            thr = threading.Thread(target=get)
+            thr.start()
+            for _ in range(100):
+                if srv.busy:
+                    break
+                time.sleep(0.02)
+
+            # must wait for the interactive request
+            srv.pregen(self.ptop, "b.jpg", os.path.getmtime("b.jpg"))
+            time.sleep(0.3)
+            self.assertEqual(srv.done, [])
+            self.assertEqual(srv.pre_state()[:2], (1, 0))
+
+            ev.set()
+            thr.join(10)
+            self.wait_pre(srv, 1)
+            self.assertTrue(rets[0])
+            self.assertEqual(srv.done, ["slow.jpg", "b.jpg"])
+        finally:
+            srv.shutdown()
+
+    def test_qcap(self):
+        srv = self.mksrv(th_pre_q=1)
+        try:
+            ev = srv.hold["a.jpg"] = threading.Event()
+            for fn in ("a.jpg", "b.jpg", "c.jpg"):
+                srv.pregen(self.ptop, fn, os.path.getmtime(fn))
+                time.sleep(0.1)
+
+            # a.jpg is converting, b.jpg is queued, c.jpg did not fit
+            self.assertEqual(srv.pre_state(), (1, 0, 1))
+            ev.set()
+            self.wait_pre(srv, 2)
+            self.assertEqual(srv.done, ["a.jpg", "b.jpg"])
+        finally:
+            srv.shutdown()
+
+    def bg_get(self, srv, fn, prio="i", uname="", tmax=0):
+        """get() in a thread, returning once it is queued"""
+        rets = []
+        n = len(srv.busy)
+
+        def fun():
+            mt = os.path.getmtime(fn)
+            rets.append(srv.get(self.ptop, fn, mt, "j", prio, uname, tmax))
+
+        thr = threading.Thread(target=fun)
+        thr.start()
+        for _ in range(100):
+            if len(srv.busy) > n:
+                break
+            time.sleep(0.02)
+        return thr, rets
+
+    def test_sched(self):
+        srv = self.mksrv()
+        try:
+            ev = srv.hold["slow.jpg"] = threading.Event()
+            thrs = [self.bg_get(srv, "slow.jpg", "i", "u0")[0]]
+            for _ in range(100):
+                if srv.nrun["i"]:
+                    break
+                time.sleep(0.02)
+
+            # bulk is queued first but goes last;
+            # interactive is round-robin between users
+            thrs.append(self.bg_get(srv, "d.jpg", "b", "u1")[0])
+            thrs.append(self.bg_get(srv, "a.jpg", "i", "u1")[0])
+            thrs.append(self.bg_get(srv, "b.jpg", "i", "u1")[0])
+            thrs.append(self.bg_get(srv, "c.jpg", "i", "u2")[0])
+
+            st = srv.q_state()
+            self.assertEqual((st["i"]["q"], st["i"]["run"], st["b"]["q"]), (3, 1, 1))
+
+            ev.set()
+            for thr in thrs:
+                thr.join(10)
+
+            zs = "slow.jpg a.jpg c.jpg b.jpg d.jpg"
+            self.assertEqual(srv.done, zs.split())
+
+            st = srv.q_state()
+            self.assertEqual(sum(st["i"]["lat"]), 4)
+            self.assertEqual(sum(st["b"]["lat"]), 1)
+            self.assertEqual(st["i"]["dep"][:3], [2, 1, 1])
+        finally:
+            srv.shutdown()
+
+    def test_cancel(self):
+        srv = self.mksrv()
+        try:
+            ev = srv.hold["slow.jpg"] = threading.Event()
+            thr, _ = self.bg_get(srv, "slow.jpg")
+
+            # two clients want a.jpg; both give up waiting
+            mt = os.path.getmtime("a.jpg")
+            t0 = time.time()
+            for _ in range(2):
+                ret = srv.get(self.ptop, "a.jpg", mt, "j", "i", "", 0.2)
+                self.assertEqual(ret, "")
+            self.assertLess(time.time() - t0, 2)
+
+            # the first one comes back for it, then disconnects
+            ret = srv.get(self.ptop, "a.jpg", mt, "j", "i", "", 0.2, True)
+            self.assertEqual(ret, "")
+            srv.cancel(self.ptop, "a.jpg", mt, "j")
+            self.assertEqual(srv.q_state()["i"]["q"], 1)
+            srv.cancel(self.ptop, "a.jpg", mt, "j")
+            self.assertEqual(srv.q_state()["i"]["q"], 0)
+
+            ev.set()
+            thr.join(10)
+            time.sleep(0.2)
+            self.assertEqual(srv.done, ["slow.jpg"])
+            self.assertEqual(srv.n_cancel, 1)
+
+            # the waiter is woken up right away
+            ev = srv.hold["b.jpg"] = threading.Event()
+            thr, rets = self.bg_get(srv, "b.jpg")
+            time.sleep(0.1)
+            t0 = time.time()
+            ev.set()
+            thr.join(10)
+            self.assertLess(time.time() - t0, 1)
+            self.assertTrue(rets[0])
+        finally:
+            srv.shutdown()
+
+    def test_sck_alive(self):
+        s1, s2 = socket.socketpair()
+        try:
+            self.assertTrue(sck_alive(s1))
+            s2.sendall(b"GET")
+            self.assertTrue(sck_alive(s1))
+            self.assertEqual(s1.recv(8), b"GET")
+            s2.close()
+            self.assertFalse(sck_alive(s1))
+        finally:
+            s1.close()
+
+    def test_idx(self):
+        # one thumbnail from before the index existed
+        hp = os.path.join(self.td, ".hist")
+        zs = "ab/cd/" + "a" * 24
+        os.makedirs(os.path.join(hp, "th", zs, "w"))
+        with open(os.path.join(hp, "th", zs, "dir.txt"), "wb") as f:
+            f.write(b"/somewhere")
+        old = os.path.join(hp, "th", zs, "b" * 24 + ".65000000.webp")
+        with open(old, "wb") as f:
+            f.write(b"t" * 500)
+
+        srv = self.mksrv()
+        try:
+            self.assertEqual(srv.clean(hp), 0)
+            idx = srv._get_idx(hp)
+            self.assertEqual(idx.nbytes, 500)
+
+            def mk(dn):
+                ap = os.path.join(self.td, dn, "a.jpg")
+                ret = srv.get(self.ptop, dn + "/a.jpg", os.path.getmtime(ap), "j")
+                self.assertTrue(ret)
+                return ret
+
+            tps = [mk(x) for x in ("d1", "d2", "d3")]
+            self.assertEqual(idx.nbytes, 3500)
+
+            # last-access is poked per folder; d2 is the oldest, then d1
+            now = int(time.time())
+            for tp, age in zip(tps + [old], (20, 30, 10, 0)):
+                _, c, d, _ = srv._idx_loc(tp)
+                idx.poke(c, d, "", now - age)
+
+            # 10% below the limit; that's d2 and d1
+            srv.args.th_maxsz = 2500
+            self.assertEqual(srv.clean(hp), 2)
+            self.assertEqual(idx.nbytes, 1500)
+            for tp, exists in zip(tps + [old], (False, False, True, True)):
+                self.assertEqual(os.path.exists(tp), exists)
+
+            # and the empty folders are gone too
+            self.assertFalse(os.path.exists(os.path.dirname(tps[1])))
+            self.assertTrue(os.path.exists(os.path.dirname(tps[2])))
+
+            # the new version of a modified file replaces the old
+            os.utime("d3/a.jpg", (now - 9, now - 9))
+            tp = mk("d3")
+            self.assertNotEqual(tp, tps[2])
+            self.assertFalse(os.path.exists(tps[2]))
+            self.assertEqual(idx.nbytes, 1500)
+
+            # expired by age
+            srv.args.th_clean = 1
+            srv.args.th_maxage = 5
+            self.assertEqual(srv.clean(hp), 0)
+            _, c, d, _ = srv._idx_loc(tp)
+            idx.poke(c, d, "", now - 60)
+            self.assertEqual(srv.clean(hp), 1)
+            self.assertEqual(idx.nbytes, 500)
+            self.assertFalse(os.path.exists(tp))
+        finally:
+            srv.shutdown()
+
+    def test_idx_maxsz(self):
+        # too big; the cleaner is woken up right away
+        srv = self.mksrv(th_maxsz=2500)
+        try:
+            for dn in ("d1", "d2", "d3"):
+                ap = os.path.join(self.td, dn, "a.jpg")
+                srv.get(self.ptop, dn + "/a.jpg", os.path.getmtime(ap), "j")
+
+            idx = srv._get_idx(os.path.join(self.td, ".hist"))
+            for _ in range(100):
+                if idx.nbytes <= 2250:
+                    break
+                time.sleep(0.05)
+            self.assertEqual(idx.nbytes, 2000)
+        finally:
+            srv.shutdown()
+
+    def test_exif_thumb(self):
+        th = b"\xff\xd8 pretend this is a jpeg \xff\xd9"
+        for e in "<>":
+            for short in (False, True):
+                self.assertEqual(exif_thumb(exif_blob(e, th, 1, short)), th)
+
+        zb = exif_blob("<", th)
+        self.assertEqual(exif_thumb(zb[6:]), th)
+        self.assertIsNone(exif_thumb(zb[:-4]))
+        self.assertIsNone(exif_thumb(b"Exif\x00\x00II*\x00"))
+        self.assertIsNone(exif_thumb(b""))
+
+    def test_exif_pil(self):
+        if not HAVE_PIL:
+            raise unittest.SkipTest()
+
+        from io import BytesIO
+
+        from PIL import Image
+
+        srv = self.mksrv()
+        try:
+            res = srv.getres(srv.asrv.vfs, "w")
+            for tw, th, rot, want in [
+                (480, 320, 1, True),
+                (480, 320, 6, True),  # rotated; 320px wide
+                (480, 360, 1, False),  # letterboxed 4:3
+                (160, 120, 1, False),  # too small
+            ]:
+                bio = BytesIO()
+                Image.new("RGB", (tw, th)).save(bio, "jpeg")
+                bio2 = BytesIO()
+                zb = exif_blob("<", bio.getvalue(), rot)
+                Image.new("RGB", (1500, 1000)).save(bio2, "jpeg", exif=zb)
+                bio2.seek(0)
+                im = Image.open(bio2)
+                eim = srv.exif_pil(im, res, "w")
+                self.assertEqual(bool(eim), want, (tw, th, rot))
+        finally:
+            srv.shutdown()
@@ -45,7 +45,7 @@ from copyparty.broker_thr import BrokerThr
 from copyparty.ico import Ico
 from copyparty.u2idx import U2idx
 from copyparty.up2k import Up2k
-from copyparty.util import FHC, CachedDict, Garda, Unrecv
+from copyparty.util import FHC, BufPool, CachedDict, Garda, Unrecv
 
 init_E(E)
 
@@ -122,22 +122,22 @@ class Cfg(Namespace):
     def __init__(self, a=None, v=None, c=None, **ka0):
         ka = {}
 
-        ex = "chpw daw dav_auth dav_inf dav_mac dav_rt e2d e2ds e2dsa e2t e2ts e2tsr e2v e2vu e2vp early_ban ed emp exp force_js getmod grid gsel hardlink ih ihead magic hardlink_only nid nih no_acode no_athumb no_clone no_cp no_dav no_db_ip no_del no_dirsz no_dupe no_lifetime no_logues no_mv no_pipe no_poll no_readme no_robots no_sb_md no_sb_lg no_scandir no_tarcmp no_thumb no_vthumb no_zip nrand nw og og_no_head og_s_title ohead q rand re_dirsz rss smb srch_dbg stats uqe vague_403 vc ver write_uplog xdev xlink xvol zs"
+        ex = "chpw daw dav_auth dav_inf dav_mac dav_rt e2d e2ds e2dsa e2t e2ts e2tsr e2v e2vu e2vp early_ban ed emp exp force_js fts getmod grid gsel hardlink http_only https_only ih ihead inotify log_conn magic hardlink_only nid nih no_acode no_athumb no_clone no_cp no_dav no_db_ip no_del no_dirsz no_dupe no_lifetime no_logues no_mv no_park no_pipe no_pread no_poll no_readme no_rescache no_robots no_sb_md no_sb_lg no_scandir no_tarcmp no_thumb no_vthumb no_zip no_zipcrc nrand nsort nw og og_no_head og_s_title ohead q rand re_dirsz reflink rss smb srch_dbg stats th_exif th_pre uqe vague_403 vc ver write_uplog xdev xlink xvol zs"
         ka.update(**{k: False for k in ex.split()})
 
         ex = "dedup dotpart dotsrch hook_v no_dhash no_fastboot no_fpool no_htp no_rescan no_sendfile no_ses no_snap no_up_list no_voldump re_dhash plain_ip"
         ka.update(**{k: True for k in ex.split()})
 
-        ex = "ah_cli ah_gen css_browser hist ipu js_browser js_other mime mimes no_forget no_hash no_idx nonsus_urls og_tpl og_ua"
+        ex = "ah_cli ah_gen css_browser hist ipu js_browser js_other lf_url mime mimes no_forget no_hash no_idx nonsus_urls og_tpl og_ua"
         ka.update(**{k: None for k in ex.split()})
 
-        ex = "hash_mt safe_dedup srch_time u2abort u2j u2sz"
+        ex = "arc_mt hash_mt safe_dedup srch_time u2abort u2j u2sz"
         ka.update(**{k: 1 for k in ex.split()})
 
-        ex = "au_vol dl_list mtab_age reg_cap s_thead s_tbody th_convt"
+        ex = "au_vol dl_list mtab_age reg_cap s_thead s_tbody th_convt th_pre_q"
         ka.update(**{k: 9 for k in ex.split()})
 
-        ex = "db_act k304 loris no304 re_maxage rproxy rsp_jtr rsp_slp s_wr_slp snap_wri theme themes turbo"
+        ex = "db_act k304 loris ls_cache no304 re_maxage scan_mt rproxy rsp_jtr rsp_slp s_wr_slp snap_wri th_maxsz theme themes turbo"
         ka.update(**{k: 0 for k in ex.split()})
 
         ex = "ah_alg bname chpw_db doctitle df exit favico idp_h_usr ipa html_head lg_sbf log_fk md_sbf name og_desc og_site og_th og_title og_title_a og_title_v og_title_i shr tcolor textfiles unlist vname xff_src R RS SR"
@@ -183,6 +183,7 @@ class Cfg(Namespace):
             th_coversd_set=set(["folder.png"]),
             th_crop="y",
             th_size="320x256",
+            th_webp_m=4,
             th_x3="n",
             u2sort="s",
             u2ts="c",
@@ -216,10 +217,18 @@ class VSock(object):
         self._query = self._query[sz:]
         return ret
 
+    def recv_into(self, mv):
+        ret = self.recv(len(mv))
+        mv[: len(ret)] = ret
+        return len(ret)
+
     def send(self, buf):
         self._reply += buf
         return len(buf)
 
+    def sendmsg(self, bufs):
+        return self.send(b"".join(bufs))
+
     def getsockname(self):
         return ("a", 1)
 
@@ -258,6 +267,8 @@ class VHttpSrv(object):
         self.tdli = self.dli = {}
         self.nreq = 0
         self.nsus = 0
+        self.ls_lat = []
+        self.res = None
 
         aliases = ["splash", "shares", "browser", "browser2", "msg", "md", "mde"]
         self.j2 = {x: J2_FILES for x in aliases}
@@ -268,6 +279,7 @@ class VHttpSrv(object):
         self.gurl = Garda("")
 
         self.u2idx = None
+        self.rbufs = BufPool(args.s_rd_sz, 4)
         self.ptn_cc = re.compile(r"[\x00-\x1f]")
         self.uparam_cc_ok = set("doc move tree".split())
 
@@ -311,6 +323,7 @@ class VHttpConn(object):
         self.nbyte = 0
         self.nid = None
         self.nreq = -1
+        self.ls_lat = [0.25]
         self.thumbcli = None
         self.u2fh = FHC()
 